@@ -0,0 +1,88 @@
+"""
+Redis operations per admitted request for EnhancedRateLimitMiddleware
+
+Runs the limiter against fakeredis with and without the in-process lease tier
+and reports how many script calls each admitted request cost.
+
+    python services/api/benchmarks/bench_rate_limiter.py [--requests N] [--clients N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import fakeredis.aioredis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from middleware import EnhancedRateLimitMiddleware  # noqa: E402
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis that counts script invocations"""
+
+    evals = 0
+
+    async def evalsha(self, *args, **kwargs):
+        self.evals += 1
+        return await super().evalsha(*args, **kwargs)
+
+
+async def _app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def run(lease_size: int, requests: int, clients: int) -> dict:
+    r = CountingRedis()
+    limiter = EnhancedRateLimitMiddleware(
+        _app, r,
+        capacity_global=100_000, rate_global=100_000,
+        capacity_route=100_000, rate_route=100_000,
+        capacity_user=100_000, rate_user=100_000,
+        capacity_ip=100_000, rate_ip=100_000,
+        lease_size=lease_size,
+    )
+    admitted = 0
+
+    async def send(message):
+        nonlocal admitted
+        if message["type"] == "http.response.start" and message["status"] == 200:
+            admitted += 1
+
+    start = time.perf_counter()
+    for i in range(requests):
+        scope = {"type": "http", "path": "/api/alerts/stock", "client": (f"10.0.0.{i % clients}", 0)}
+        await limiter(scope, None, send)
+        # Let background lease refills run, as they would between real requests.
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*limiter._refill_tasks)
+    return {
+        "lease_size": lease_size,
+        "admitted": admitted,
+        "redis_ops": r.evals,
+        "ops_per_request": r.evals / max(admitted, 1),
+        "elapsed_s": elapsed,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'lease':>6} {'admitted':>9} {'redis ops':>10} {'ops/req':>8} {'elapsed':>8}")
+    for lease_size in (0, 10, 50, 200):
+        res = await run(lease_size, args.requests, args.clients)
+        print(
+            f"{res['lease_size']:>6} {res['admitted']:>9} {res['redis_ops']:>10} "
+            f"{res['ops_per_request']:>8.3f} {res['elapsed_s']:>7.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Gateway startup time: import, first request and OpenAPI schema
+
+Each run starts a fresh interpreter, times ``import main`` (which builds the
+module-level app), then builds an app on fakeredis and times its first
+request (middleware stack build and routing) and first ``/openapi.json``
+(schema generation). Prints the median and worst of each across runs and
+exits non-zero if a median exceeds its budget, so it can gate CI.
+
+    python services/api/benchmarks/bench_startup.py [--runs N] [--max-import-ms MS] ...
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child():
+    """One measurement, printed as JSON"""
+    sys.path.insert(0, API_DIR)
+    logging.disable(logging.INFO)
+
+    start = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import fakeredis.aioredis
+    import httpx
+
+    async def requests() -> dict:
+        server = fakeredis.FakeServer()
+        app = main.create_app(
+            fakeredis.aioredis.FakeRedis(server=server, decode_responses=True),
+            fakeredis.aioredis.FakeRedis(server=server),
+        )
+        timings = {}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for name, path in (("first_request_ms", "/"), ("openapi_ms", "/openapi.json")):
+                start = time.perf_counter()
+                response = await client.get(path)
+                timings[name] = (time.perf_counter() - start) * 1000
+                response.raise_for_status()
+        return timings
+
+    print(json.dumps({"import_ms": import_ms, **asyncio.run(requests())}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-first-request-ms", type=float, default=None)
+    parser.add_argument("--max-openapi-ms", type=float, default=None)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"],
+            check=True, capture_output=True, text=True, cwd=API_DIR,
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    budgets = {
+        "import_ms": args.max_import_ms,
+        "first_request_ms": args.max_first_request_ms,
+        "openapi_ms": args.max_openapi_ms,
+    }
+    failed = False
+    for name, budget in budgets.items():
+        values = [run[name] for run in runs]
+        median = statistics.median(values)
+        over = budget is not None and median > budget
+        failed |= over
+        print(
+            f"{name:<17} median={median:8.1f}ms  max={max(values):8.1f}ms"
+            + (f"  budget={budget:.0f}ms" if budget is not None else "")
+            + ("  OVER BUDGET" if over else "")
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Dashboard metrics aggregation for /api/metrics/dashboard
+
+Every field the dashboard shows is read in one pipelined round trip. A
+background task also keeps a JSON snapshot per (timeframe, retailer) that it
+rewrites every second, so a dashboard read is a single GET however many
+viewers there are. Per-timeframe totals come from the minute/hour/day
+buckets in ``metrics_rollup``. Timeframes and retailers are the plain values
+of ``MetricsTimeframe`` and ``RetailerType``.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import metrics_rollup
+
+logger = logging.getLogger(__name__)
+
+TIMEFRAMES = {"1h": 3600, "24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400}
+SNAPSHOT_KEY = "metrics:snapshot:{timeframe}:{retailer}"
+SNAPSHOT_TTL = 5          # seconds; readers fall back to a live fetch once a snapshot expires
+SNAPSHOT_LOCK = "metrics:snapshot:lock"
+DEFAULT_AVG_CHECKOUT_MS = 2500
+
+# Rollup fields summed per timeframe, besides the checkout counts
+_TIMEFRAME_FIELDS = [
+    "completed_tasks", "checkout_ms_sum", "checkout_ms_count",
+]
+# Spend fields; total_spent stays None until something records them
+_COST_FIELDS = ["proxy_costs", "captcha_costs"]
+
+def _snapshot_key(timeframe: str, retailer: Optional[str]) -> str:
+    return SNAPSHOT_KEY.format(timeframe=timeframe, retailer=retailer or "all")
+
+def _checkout_fields(retailer: Optional[str]) -> Tuple[str, str]:
+    if retailer:
+        return f"{retailer}:total", f"{retailer}:success"
+    return "total_checkouts", "successful_checkouts"
+
+def _float(value) -> float:
+    return float(value) if value is not None else 0.0
+
+async def collect(
+    redis_client,
+    timeframes: Iterable[str] = TIMEFRAMES,
+    retailers: Sequence[Optional[str]] = (None,),
+    now: Optional[float] = None,
+) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+    """Dashboard fields for each (timeframe, retailer), in one pipelined round trip.
+
+    ``total_spent`` is None when no costs were recorded in the window;
+    callers also drop it when costs weren't asked for.
+    """
+    now = time.time() if now is None else now
+    timeframes = list(timeframes)
+    fields: List[str] = _TIMEFRAME_FIELDS + _COST_FIELDS
+    for retailer in retailers:
+        fields.extend(_checkout_fields(retailer))
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.scard("active_monitors")
+    pipe.scard("proxies:active")
+    pipe.scard("proxies:burned")
+    pipe.get("metrics:proxy_cost_today")
+    for timeframe in timeframes:
+        pipe.zcount("checkout_queue", now - TIMEFRAMES[timeframe], now)
+        pipe.zrevrange(f"metrics:top_products:{timeframe}", 0, 9, withscores=True)
+    spans = [metrics_rollup.queue_window(pipe, timeframe, fields, now) for timeframe in timeframes]
+    results = await pipe.execute()
+
+    active_monitors, active_proxies, burned_proxies, proxy_cost = results[:4]
+    active_proxies = active_proxies or 0
+    burned_proxies = burned_proxies or 0
+    proxies = active_proxies + burned_proxies
+    proxy_health = {
+        "active": active_proxies,
+        "burned": burned_proxies,
+        "health_score": round((active_proxies / proxies * 100) if proxies > 0 else 100, 1),
+        "cost_today": f"${_float(proxy_cost):.2f}",
+    }
+
+    out = {}
+    window_start = 4 + len(timeframes) * 2
+    for i, timeframe in enumerate(timeframes):
+        running_tasks, top_products_data = results[4 + i * 2: 6 + i * 2]
+        rows = results[window_start: window_start + spans[i]]
+        totals = metrics_rollup.sum_window(fields, rows)
+        window_start += spans[i]
+        costs = [fields.index(field) for field in _COST_FIELDS]
+        costs_recorded = any(row[j] is not None for row in rows for j in costs)
+        total_spent = round(sum(totals[field] for field in _COST_FIELDS), 2) if costs_recorded else None
+        checkouts = totals["checkout_ms_count"]
+        avg_ms = int(totals["checkout_ms_sum"] / checkouts) if checkouts else DEFAULT_AVG_CHECKOUT_MS
+        top_products = []
+        for member, score in top_products_data:
+            product_info = json.loads(member)
+            product_info["checkout_count"] = int(score)
+            top_products.append(product_info)
+        for retailer in retailers:
+            total_field, success_field = _checkout_fields(retailer)
+            total = int(totals[total_field])
+            successful = int(totals[success_field])
+            success_rate = (successful / total * 100) if total > 0 else 0
+            out[(timeframe, retailer)] = {
+                "timeframe": timeframe,
+                "active_monitors": active_monitors or 0,
+                "running_tasks": int(running_tasks),
+                "completed_tasks": int(totals["completed_tasks"]),
+                "success_rate": round(success_rate, 1),
+                "avg_checkout_time_ms": avg_ms,
+                "total_spent": total_spent,
+                "proxy_health": proxy_health,
+                "top_products": top_products,
+            }
+    return out
+
+async def read(redis_client, timeframe: str, retailer: Optional[str] = None) -> Dict[str, Any]:
+    """Dashboard fields from the current snapshot, or fetched live if there is none."""
+    raw = await redis_client.get(_snapshot_key(timeframe, retailer))
+    if raw is not None:
+        return json.loads(raw)
+    fields = await collect(redis_client, [timeframe], [retailer])
+    return fields[(timeframe, retailer)]
+
+async def refresh_snapshots(redis_client, retailers: Sequence[str] = (), owner: str = "") -> bool:
+    """Rewrite every snapshot; returns False if another worker did so this interval."""
+    acquired = await redis_client.set(SNAPSHOT_LOCK, owner or "1", nx=True, px=900)
+    if not acquired:
+        return False
+    snapshots = await collect(redis_client, TIMEFRAMES, [None, *retailers])
+    pipe = redis_client.pipeline(transaction=False)
+    for (timeframe, retailer), fields in snapshots.items():
+        pipe.set(_snapshot_key(timeframe, retailer), json.dumps(fields), ex=SNAPSHOT_TTL)
+    await pipe.execute()
+    return True
+
+async def run_snapshots(redis_client, retailers: Sequence[str] = (), interval: float = 1.0):
+    """Background task: refresh the snapshots every ``interval`` seconds."""
+    owner = uuid.uuid4().hex
+    while True:
+        try:
+            await refresh_snapshots(redis_client, retailers, owner)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Dashboard snapshot refresh failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,35 @@
+"""
+Shared FastAPI dependencies for the gateway routers
+"""
+
+import os
+
+import redis.asyncio as redis
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+from ws_hub import FanoutHub
+
+# Security
+security = HTTPBearer()
+SESSION_SECRET = os.getenv("SESSION_SECRET", "dev-session-secret").encode()
+
+def get_redis(request: Request) -> redis.Redis:
+    """The gateway's (string-decoding) Redis client"""
+    return request.app.state.redis
+
+def get_ws_hub(request: Request) -> FanoutHub:
+    """The worker's WebSocket hub, for pushing messages to users' sockets"""
+    return request.app.state.ws_hub
+
+# Dependency to get current user from token
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    token = credentials.credentials
+    # Signature check, then the worker's session cache (Redis only on a miss)
+    session = await request.app.state.sessions.get(token) if token else None
+    if session is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication")
+    return {"user_id": session["user_id"], "token": token}
@@ -0,0 +1,103 @@
+"""
+Geohash helpers for heatmap cache tags and cell aggregation
+"""
+
+from typing import List, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+def encode(lat: float, lng: float, precision: int = 6) -> str:
+    """Encode a coordinate as a geohash of ``precision`` characters"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    out = []
+    bits = 0
+    ch = 0
+    even = True
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits = 0
+            ch = 0
+    return "".join(out)
+
+def bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Return (lat_min, lat_max, lng_min, lng_max) of a geohash cell"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for c in geohash:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+def neighbors(geohash: str) -> List[str]:
+    """The (up to) eight cells surrounding ``geohash``"""
+    lat_lo, lat_hi, lng_lo, lng_hi = bounds(geohash)
+    dlat, dlng = lat_hi - lat_lo, lng_hi - lng_lo
+    lat_c, lng_c = (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+    out = []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dx == 0 and dy == 0:
+                continue
+            lat = lat_c + dy * dlat
+            if not -90.0 <= lat <= 90.0:
+                continue
+            lng = (lng_c + dx * dlng + 180.0) % 360.0 - 180.0
+            cell = encode(lat, lng, len(geohash))
+            if cell not in out:
+                out.append(cell)
+    return out
+
+def cells_in_bbox(lat_min: float, lat_max: float, lng_min: float, lng_max: float,
+                  precision: int, max_cells: int = 4096) -> List[str]:
+    """Geohash cells of ``precision`` covering a bounding box, row by row.
+
+    Raises ValueError if the box needs more than ``max_cells`` cells.
+    """
+    lat_lo, lat_hi, lng_lo, lng_hi = bounds(encode(lat_min, lng_min, precision))
+    dlat, dlng = lat_hi - lat_lo, lng_hi - lng_lo
+    rows = int((lat_max - lat_lo) // dlat) + 1
+    cols = int((lng_max - lng_lo) // dlng) + 1
+    if rows * cols > max_cells:
+        raise ValueError(f"Bounding box needs {rows * cols} cells at precision {precision}")
+    cells = []
+    for row in range(rows):
+        lat = min(lat_lo + (row + 0.5) * dlat, 90.0)
+        for col in range(cols):
+            cells.append(encode(lat, lng_lo + (col + 0.5) * dlng, precision))
+    return cells
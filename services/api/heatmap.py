@@ -0,0 +1,185 @@
+"""
+Heatmap event index
+
+Events are indexed in one geoset per type per hour
+(``heatmap:geo:{type}:{hour}``). Drop and restock signals only matter for
+hours, so each slice, like the event hashes, expires once it falls out of
+the retention window. Geo queries therefore never scan stale members, and a
+``since`` bound touches only the slices it covers.
+
+Nearby lookups cost two round trips however many events match: one pipeline
+with a GEORADIUS per slice (nearest first, capped server-side with COUNT
+when a limit is given), and one pipeline fetching the details and timeline
+score of the merged nearest events.
+
+Alongside the geosets, every event increments a per-type counter for each
+geohash cell containing it, at every precision in ``CELL_PRECISIONS``
+(``heatmap:cells:{precision}:{hour}``, field ``{geohash}:{type}``). Those
+buckets share the slices' expiry, so aggregate map views read a bounding box
+in O(cells) with one HMGET per hour instead of scanning events.
+"""
+
+import json
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence
+
+import geo
+
+HEAT_TYPES = ("drop", "restock", "find")
+TIMELINE_KEY = "heatmap:timeline"
+SLICE_SECONDS = 3600
+RETENTION_SECONDS = 24 * 3600
+CELL_PRECISIONS = range(2, 8)
+
+# Web map zoom level -> geohash precision of the aggregated cells: roughly
+# a few cells across a 256px tile. (max zoom, precision), ascending.
+ZOOM_PRECISIONS = ((4, 2), (7, 3), (9, 4), (12, 5), (14, 6), (22, 7))
+
+def geo_key(event_type: str, ts: float) -> str:
+    return f"heatmap:geo:{event_type}:{int(ts // SLICE_SECONDS)}"
+
+def event_key(event_id: str) -> str:
+    return f"heatmap:event:{event_id}"
+
+def cells_key(precision: int, ts: float) -> str:
+    return f"heatmap:cells:{precision}:{int(ts // SLICE_SECONDS)}"
+
+def zoom_precision(zoom: int) -> int:
+    for max_zoom, precision in ZOOM_PRECISIONS:
+        if zoom <= max_zoom:
+            return precision
+    return ZOOM_PRECISIONS[-1][1]
+
+def _hash_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Event fields as Redis hash values (None dropped, containers as JSON)."""
+    fields = {}
+    for name, value in data.items():
+        if value is None:
+            continue
+        if isinstance(value, Enum):
+            value = value.value
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, (list, dict)):
+            value = json.dumps(value)
+        fields[name] = value
+    return fields
+
+async def add_event(
+    redis_client,
+    event_id: str,
+    event_type: str,
+    lat: float,
+    lng: float,
+    data: Dict[str, Any],
+    ts: Optional[float] = None,
+):
+    """Store an event's details, index it in its hour slice and count it in its cells, atomically."""
+    ts = time.time() if ts is None else ts
+    slice_key = geo_key(event_type, ts)
+    slice_end = (int(ts // SLICE_SECONDS) + 1) * SLICE_SECONDS
+    geohash = geo.encode(lat, lng, max(CELL_PRECISIONS))
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(event_key(event_id), mapping=_hash_fields(data))
+    pipe.expireat(event_key(event_id), int(ts + RETENTION_SECONDS))
+    pipe.geoadd(slice_key, (lng, lat, event_id))
+    pipe.expireat(slice_key, slice_end + RETENTION_SECONDS)
+    for precision in CELL_PRECISIONS:
+        pipe.hincrby(cells_key(precision, ts), f"{geohash[:precision]}:{event_type}", 1)
+        pipe.expireat(cells_key(precision, ts), slice_end + RETENTION_SECONDS)
+    pipe.zadd(TIMELINE_KEY, {event_id: ts})
+    pipe.zremrangebyscore(TIMELINE_KEY, "-inf", time.time() - RETENTION_SECONDS)
+    await pipe.execute()
+
+async def nearby(
+    redis_client,
+    lat: float,
+    lng: float,
+    radius_km: float,
+    event_types: Sequence[str] = HEAT_TYPES,
+    limit: Optional[int] = None,
+    since: Optional[float] = None,
+    now: Optional[float] = None,
+) -> List[dict]:
+    """Events within ``radius_km`` of (lat, lng) since ``since``, nearest first, with ``distance_km``."""
+    now = time.time() if now is None else now
+    since = max(since or 0.0, now - RETENTION_SECONDS)
+    slices = range(int(since // SLICE_SECONDS), int(now // SLICE_SECONDS) + 1)
+    queried = [(event_type, index) for event_type in event_types for index in slices]
+    pipe = redis_client.pipeline(transaction=False)
+    for event_type, index in queried:
+        pipe.georadius(
+            geo_key(event_type, index * SLICE_SECONDS), lng, lat, radius_km,
+            unit="km", withdist=True, count=limit, sort="ASC",
+        )
+    # (event_id, distance, from the oldest slice, which may start before ``since``)
+    matches = [
+        (event_id, distance, index == slices[0])
+        for (_, index), result in zip(queried, await pipe.execute())
+        for event_id, distance in result
+    ]
+    # Each slice is sorted already; merge them and keep the overall nearest
+    matches.sort(key=lambda match: match[1])
+    if limit is not None:
+        # Only oldest-slice matches can be filtered out below
+        certain = 0
+        for cut, (_, _, oldest) in enumerate(matches):
+            certain += not oldest
+            if certain == limit:
+                matches = matches[:cut + 1]
+                break
+    if not matches:
+        return []
+
+    pipe = redis_client.pipeline(transaction=False)
+    for event_id, _, _ in matches:
+        pipe.hgetall(event_key(event_id))
+        pipe.zscore(TIMELINE_KEY, event_id)
+    replies = await pipe.execute()
+    events = []
+    for i, (_, distance, _) in enumerate(matches):
+        event_info, ts = replies[i * 2], replies[i * 2 + 1]
+        if not event_info or ts is None or ts < since:
+            continue
+        event_info["distance_km"] = round(distance, 2)
+        events.append(event_info)
+        if limit is not None and len(events) == limit:
+            break
+    return events
+
+async def cell_counts(
+    redis_client,
+    cells: Sequence[str],
+    event_types: Sequence[str] = HEAT_TYPES,
+    since: Optional[float] = None,
+    now: Optional[float] = None,
+) -> Dict[str, Dict[str, int]]:
+    """Per-type event counts of the given same-precision cells, for the hours since ``since``.
+
+    Counts are kept per hour, so ``since`` is rounded down to its hour.
+    Cells without events are left out.
+    """
+    if not cells:
+        return {}
+    precision = len(cells[0])
+    now = time.time() if now is None else now
+    since = max(since or 0.0, now - RETENTION_SECONDS)
+    fields = [f"{cell}:{event_type}" for cell in cells for event_type in event_types]
+    pipe = redis_client.pipeline(transaction=False)
+    for index in range(int(since // SLICE_SECONDS), int(now // SLICE_SECONDS) + 1):
+        pipe.hmget(cells_key(precision, index * SLICE_SECONDS), fields)
+    totals = [0] * len(fields)
+    for values in await pipe.execute():
+        for i, value in enumerate(values):
+            if value is not None:
+                totals[i] += int(value)
+    counts: Dict[str, Dict[str, int]] = {}
+    for field, total in zip(fields, totals):
+        if total:
+            cell, event_type = field.split(":", 1)
+            counts.setdefault(cell, {})[event_type] = total
+    return counts
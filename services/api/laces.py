@@ -0,0 +1,102 @@
+"""
+LACES ledger on Redis
+
+Credits and debits run as one Lua script (laces_ledger.lua): balance,
+lifetime totals, leaderboard and the capped per-user transaction log are
+updated atomically in a single round trip, and the entry is appended to
+LEDGER_STREAM for write-behind to Postgres (see laces_writer.py). Callers
+pass an idempotency key to make retries safe, and route the returned
+notification to the user's sockets (FanoutHub.send_to_user).
+"""
+
+import json
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+MAX_TRANSACTIONS = 500              # per-user transaction log length
+IDEMPOTENCY_TTL = 24 * 3600
+LEADERBOARD_KEY = "laces:leaderboard"
+LEDGER_STREAM = "laces:ledger:stream"
+# Cap on the ledger stream. The writer deletes entries once they are in
+# Postgres, so this only bites when write-behind is off or far behind, and
+# then the oldest unwritten entries are trimmed.
+LEDGER_MAXLEN = int(os.getenv("LACES_LEDGER_MAXLEN", "100000"))
+
+with open(os.path.join(os.path.dirname(__file__), "laces_ledger.lua"), "r", encoding="utf-8") as f:
+    _LEDGER_LUA = f.read()
+
+class InsufficientBalance(ValueError):
+    """A debit larger than the user's balance"""
+
+@dataclass(frozen=True)
+class LedgerResult:
+    balance: int
+    replayed: bool = False    # an earlier call with the same idempotency key was applied
+    notification: Optional[str] = None  # JSON for the user's sockets; None on a replay
+
+def _keys(user_id: str, idempotency_key: Optional[str]) -> list:
+    return [
+        f"laces:balance:{user_id}",
+        f"laces:earned:{user_id}",
+        f"laces:spent:{user_id}",
+        LEADERBOARD_KEY,
+        f"laces:transactions:{user_id}",
+        f"laces:idem:{user_id}:{idempotency_key or ''}",
+        LEDGER_STREAM,
+    ]
+
+async def apply(
+    redis_client,
+    user_id: str,
+    amount: int,
+    reason: str,
+    reference_id: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    max_transactions: int = MAX_TRANSACTIONS,
+    ledger_maxlen: int = LEDGER_MAXLEN,
+) -> LedgerResult:
+    """Credit (amount > 0) or debit (amount < 0) a user's LACES.
+
+    Raises InsufficientBalance if a debit would overdraw the balance.
+    """
+    if amount == 0:
+        raise ValueError("amount must be non-zero")
+    entry = {
+        "id": str(uuid.uuid4()),    # ledger row id in Postgres
+        "user_id": user_id,
+        "amount": amount,
+        "reason": reason,
+        "reference_id": reference_id,
+        "timestamp": datetime.now().isoformat()
+    }
+    script = redis_client.register_script(_LEDGER_LUA)
+    applied, balance, replayed, notification = await script(
+        keys=_keys(user_id, idempotency_key),
+        args=[
+            user_id, amount, json.dumps(entry), max_transactions,
+            IDEMPOTENCY_TTL if idempotency_key else 0, ledger_maxlen,
+        ],
+    )
+    if not applied:
+        raise InsufficientBalance(f"Balance {balance} is less than {-amount}")
+    return LedgerResult(balance=int(balance), replayed=bool(replayed), notification=notification)
+
+async def snapshot(redis_client, user_id: str) -> Dict[str, Any]:
+    """Balance, lifetime totals and leaderboard position, read atomically in one round trip."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.get(f"laces:balance:{user_id}")
+    pipe.get(f"laces:earned:{user_id}")
+    pipe.get(f"laces:spent:{user_id}")
+    pipe.zrevrank(LEADERBOARD_KEY, user_id)
+    pipe.zcard(LEADERBOARD_KEY)
+    balance, earned, spent, rank, total_users = await pipe.execute()
+    return {
+        "balance": int(balance or 0),
+        "lifetime_earned": int(earned or 0),
+        "lifetime_spent": int(spent or 0),
+        "rank": rank or 0,              # 0-based
+        "total_users": total_users or 1,
+    }
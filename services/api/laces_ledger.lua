@@ -0,0 +1,64 @@
+-- KEYS: balance, earned, spent, leaderboard, transactions, idempotency, ledger stream
+-- ARGV: user_id, amount, entry_json, max_transactions, idempotency_ttl, ledger_maxlen
+-- returns: {applied(1/0), balance, replayed(1/0), notification_json or nil}
+--
+-- Credits (amount > 0) and debits (amount < 0) are applied atomically: the
+-- balance, lifetime totals, leaderboard, capped transaction log and ledger
+-- stream entry (written behind to Postgres by laces_writer.py) all change
+-- together or not at all. A debit that would take the balance below zero is
+-- rejected. When idempotency_ttl is non-zero, the resulting balance is
+-- remembered under the idempotency key and a retry with the same key returns it
+-- without applying the mutation again. The ledger stream is trimmed to about
+-- ledger_maxlen entries, so it stays bounded when nothing drains it. The user
+-- notification is returned for the caller to route to the user's sockets; it
+-- is nil when nothing was applied.
+
+local user_id = ARGV[1]
+local amount = tonumber(ARGV[2])
+local max_transactions = tonumber(ARGV[4])
+local idempotency_ttl = tonumber(ARGV[5])
+
+if idempotency_ttl > 0 then
+  local previous = redis.call("GET", KEYS[6])
+  if previous then
+    return {1, tonumber(previous), 1, false}
+  end
+end
+
+local balance = tonumber(redis.call("GET", KEYS[1]) or "0")
+if amount < 0 and balance + amount < 0 then
+  return {0, balance, 0, false}
+end
+
+balance = redis.call("INCRBY", KEYS[1], amount)
+if amount > 0 then
+  redis.call("INCRBY", KEYS[2], amount)
+  redis.call("ZINCRBY", KEYS[4], amount, user_id)
+else
+  redis.call("INCRBY", KEYS[3], -amount)
+end
+
+local entry = cjson.decode(ARGV[3])
+entry["balance"] = balance
+local encoded = cjson.encode(entry)
+redis.call("LPUSH", KEYS[5], encoded)
+redis.call("LTRIM", KEYS[5], 0, max_transactions - 1)
+redis.call("XADD", KEYS[7], "MAXLEN", "~", ARGV[6], "*", "entry", encoded)
+
+local kind = "laces_earned"
+if amount < 0 then
+  kind = "laces_spent"
+end
+local notification = cjson.encode({
+  user_id = user_id,
+  type = kind,
+  amount = amount,
+  reason = entry["reason"],
+  new_balance = balance
+})
+
+if idempotency_ttl > 0 then
+  redis.call("SET", KEYS[6], balance, "EX", idempotency_ttl)
+end
+
+return {1, balance, 0, notification}
@@ -0,0 +1,188 @@
+"""
+Write-behind of the Redis LACES ledger into Postgres
+
+laces_ledger.lua appends every applied credit/debit to ``laces:ledger:stream``.
+LedgerWriter reads that stream through a consumer group in batches, writes
+each batch to ``laces_ledger`` with one multi-row INSERT and only then
+acknowledges (and deletes) the entries, so every mutation reaches Postgres
+at least once without Postgres being on the earn path. Rows are keyed by
+the entry's UUID and inserted with ON CONFLICT DO NOTHING, so redelivered
+entries are no-ops. Entries left pending by a crashed consumer are claimed
+by the others once they've been idle for ``claim_idle_ms``.
+
+The table is the one this service's migrations create (``laces_ledger`` in
+migrations/versions/001_initial_schema.py, with ``reason`` widened to text
+by 002). Entries that can't be stored there, because they are malformed or
+their user isn't in ``users`` (e.g. dev tokens), are logged and moved to
+``DEAD_LETTER_STREAM`` with the reason, never dropped; XADD them back to the
+ledger stream to retry once the user exists.
+
+Runs inside the gateway when DATABASE_URL is set, or on its own:
+
+    DATABASE_URL=postgresql://... REDIS_URL=redis://... python laces_writer.py
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import redis.asyncio as redis
+
+import laces
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+GROUP = "laces-writer"
+DEAD_LETTER_STREAM = "laces:ledger:dead"
+
+# One statement per batch, into laces_ledger as migrations 001/002 define it
+INSERT_SQL = """
+INSERT INTO laces_ledger (id, user_id, delta, reason, ref_id, created_at)
+SELECT * FROM unnest($1::uuid[], $2::uuid[], $3::int[], $4::text[], $5::uuid[], $6::timestamptz[])
+ON CONFLICT (id) DO NOTHING
+"""
+KNOWN_USERS_SQL = "SELECT id FROM users WHERE id = ANY($1::uuid[])"
+
+Row = Tuple[uuid.UUID, uuid.UUID, int, str, Optional[uuid.UUID], datetime]
+
+def to_row(entry: dict) -> Optional[Row]:
+    """The laces_ledger row for a stream entry, or None if it can't be stored."""
+    try:
+        row_id = uuid.UUID(entry["id"])
+        user_id = uuid.UUID(entry["user_id"])
+        amount = int(entry["amount"])
+        created_at = datetime.fromisoformat(entry["timestamp"]).astimezone()
+    except (KeyError, TypeError, ValueError):
+        return None
+    reason = str(entry.get("reason") or "")[:50]
+    try:
+        # ref_id is a UUID column; other references stay in the Redis log only
+        ref_id = uuid.UUID(str(entry.get("reference_id")))
+    except ValueError:
+        ref_id = None
+    return row_id, user_id, amount, reason, ref_id, created_at
+
+class LedgerWriter:
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        pool,
+        *,
+        consumer: Optional[str] = None,
+        batch_size: int = 500,
+        block_ms: int = 1000,
+        claim_idle_ms: int = 30000,
+        retry_delay: float = 1.0,
+    ):
+        self.redis = redis_client
+        self.pool = pool
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.retry_delay = retry_delay
+        self._group_ready = False
+
+    async def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(laces.LEDGER_STREAM, GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def _next_batch(self) -> list:
+        # Entries another (dead) consumer read but never acknowledged come first
+        _, claimed, _ = await self.redis.xautoclaim(
+            laces.LEDGER_STREAM, GROUP, self.consumer,
+            min_idle_time=self.claim_idle_ms, start_id="0-0", count=self.batch_size,
+        )
+        if claimed:
+            return claimed
+        streams = await self.redis.xreadgroup(
+            GROUP, self.consumer, {laces.LEDGER_STREAM: ">"},
+            count=self.batch_size, block=self.block_ms,
+        )
+        return streams[0][1] if streams else []
+
+    async def drain_once(self) -> int:
+        """Persist one batch; returns the number of stream entries acknowledged."""
+        await self._ensure_group()
+        messages = await self._next_batch()
+        if not messages:
+            return 0
+        rows: List[Tuple[str, str, Row]] = []
+        dead: List[Tuple[str, str, str]] = []    # (message id, entry, why)
+        for message_id, fields in messages:
+            raw = fields.get("entry") or fields.get(b"entry")
+            try:
+                row = to_row(json.loads(raw))
+            except (TypeError, ValueError):
+                row = None
+            if row is None:
+                dead.append((message_id, raw or "", "malformed entry"))
+            else:
+                rows.append((message_id, raw, row))
+        if rows:
+            users = list({row[1] for _, _, row in rows})
+            known = {record["id"] for record in await self.pool.fetch(KNOWN_USERS_SQL, users)}
+            stored = []
+            for message_id, raw, row in rows:
+                if row[1] in known:
+                    stored.append(row)
+                else:
+                    dead.append((message_id, raw, "unknown user"))
+            if stored:
+                await self.pool.execute(INSERT_SQL, *(list(column) for column in zip(*stored)))
+        ids = [message_id for message_id, _ in messages]
+        # Dead-letter and acknowledge in one transaction, so every entry is in
+        # Postgres, in the dead-letter stream or still pending
+        pipe = self.redis.pipeline(transaction=True)
+        for message_id, raw, why in dead:
+            logger.error(f"LACES ledger entry {message_id} not stored ({why}); moved to {DEAD_LETTER_STREAM}")
+            pipe.xadd(DEAD_LETTER_STREAM, {"entry": raw, "error": why, "message_id": message_id})
+        pipe.xack(laces.LEDGER_STREAM, GROUP, *ids)
+        pipe.xdel(laces.LEDGER_STREAM, *ids)
+        await pipe.execute()
+        return len(ids)
+
+    async def run(self):
+        while True:
+            try:
+                await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Unacknowledged entries stay pending and are retried
+                logger.warning(f"LACES ledger write-behind failed: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+async def create_pool(database_url: str):
+    if asyncpg is None:
+        raise RuntimeError("asyncpg is required for LACES ledger write-behind")
+    return await asyncpg.create_pool(database_url, min_size=1, max_size=2)
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    r = await redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+    pool = await create_pool(os.environ["DATABASE_URL"])
+    try:
+        await LedgerWriter(r, pool).run()
+    finally:
+        await pool.close()
+        await r.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Time-bucketed metrics rollups
+
+Events are counted into minute, hour and day buckets as they are recorded,
+so a dashboard timeframe is the sum of a fixed number of buckets rather than
+a scan:
+
+    1h  -> the last 60 minute buckets
+    24h -> the last 24 hour buckets
+    7d  -> the last 168 hour buckets
+    30d -> the last 30 day buckets
+
+A bucket is a hash ``metrics:rollup:{resolution}:{index}`` (index = unix
+time // bucket size) of field -> total. Fields are metric names, prefixed
+with the retailer for per-retailer counts (``nike:success``). Buckets expire
+once no window reaches them, so old data falls off on its own. The checkout
+service imports this module and records through ``record`` too, so there is
+one definition of the layout.
+"""
+
+import time
+from typing import Dict, Iterable, List, Optional
+
+ROLLUP_KEY = "metrics:rollup:{resolution}:{index}"
+
+# resolution -> (bucket seconds, ttl seconds)
+RESOLUTIONS = {
+    "m": (60, 2 * 3600),
+    "h": (3600, 8 * 86400),
+    "d": (86400, 31 * 86400),
+}
+
+# timeframe -> (resolution, buckets)
+WINDOWS = {
+    "1h": ("m", 60),
+    "24h": ("h", 24),
+    "7d": ("h", 168),
+    "30d": ("d", 30),
+}
+
+def bucket_key(resolution: str, ts: float) -> str:
+    size, _ = RESOLUTIONS[resolution]
+    return ROLLUP_KEY.format(resolution=resolution, index=int(ts // size))
+
+def window_keys(timeframe: str, now: Optional[float] = None) -> List[str]:
+    """Bucket keys making up ``timeframe``, newest (partial) bucket first."""
+    now = time.time() if now is None else now
+    resolution, buckets = WINDOWS[timeframe]
+    size, _ = RESOLUTIONS[resolution]
+    current = int(now // size)
+    return [ROLLUP_KEY.format(resolution=resolution, index=current - i) for i in range(buckets)]
+
+def record(pipe, values: Dict[str, float], ts: Optional[float] = None):
+    """Queue ``values`` onto ``pipe`` as increments of every bucket covering ``ts``."""
+    ts = time.time() if ts is None else ts
+    for resolution, (_, ttl) in RESOLUTIONS.items():
+        key = bucket_key(resolution, ts)
+        for field, value in values.items():
+            if isinstance(value, float):
+                pipe.hincrbyfloat(key, field, value)
+            elif value:
+                pipe.hincrby(key, field, value)
+        pipe.expire(key, ttl)
+
+def queue_window(pipe, timeframe: str, fields: List[str], now: Optional[float] = None) -> int:
+    """Queue an HMGET of ``fields`` per bucket of ``timeframe``; returns the number of replies to sum."""
+    keys = window_keys(timeframe, now)
+    for key in keys:
+        pipe.hmget(key, fields)
+    return len(keys)
+
+def sum_window(fields: List[str], rows: Iterable[List]) -> Dict[str, float]:
+    """Add up the HMGET replies queued by ``queue_window``."""
+    totals = [0.0] * len(fields)
+    for row in rows:
+        for i, value in enumerate(row):
+            if value is not None:
+                totals[i] += float(value)
+    return dict(zip(fields, totals))
+
+async def totals(redis_client, timeframe: str, fields: List[str], now: Optional[float] = None) -> Dict[str, float]:
+    """Totals of ``fields`` over ``timeframe``, in one pipelined round trip."""
+    pipe = redis_client.pipeline(transaction=False)
+    queue_window(pipe, timeframe, fields, now)
+    return sum_window(fields, await pipe.execute())
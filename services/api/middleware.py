@@ -12,15 +12,36 @@ import logging
 import uuid
 from datetime import datetime, timedelta
 import redis.asyncio as redis
-from typing import Dict, Optional, Callable
+from typing import Any, Dict, Optional, Callable
+from collections import OrderedDict
 import hashlib
 import hmac
+import inspect
 from functools import wraps
 import asyncio
 import os
 import base64
+import gzip
+import struct
+from urllib.parse import parse_qsl, urlencode
 from prometheus_client import Counter, Gauge
+from starlette.routing import Match
 from starlette.types import ASGIApp, Receive, Scope, Send
+from dataclasses import dataclass
+from contextvars import ContextVar
+from starlette.datastructures import MutableHeaders
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute, serialize_response
+from pydantic import BaseModel
+
+import session_tokens
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +57,8 @@ CACHE_HIT   = Counter("snpd_cache_hits_total", "Cache hits", ["route"])
 CACHE_MISS  = Counter("snpd_cache_miss_total", "Cache misses", ["route"])
 CACHE_STALE = Counter("snpd_cache_stale_total", "Stale served", ["route"])
 CACHE_FILL  = Gauge("snpd_cache_fill_inflight", "In-flight cache fills", ["route"])
+CACHE_L1_HIT = Counter("snpd_cache_l1_hits_total", "Cache hits served in-process", ["route"])
+CACHE_L1_BYTES = Gauge("snpd_cache_l1_bytes", "Bytes held by the in-process cache")
 
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
     """Log all requests with timing and response info"""
@@ -119,6 +142,128 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         
         return response
 
+_SECURITY_HEADERS = (
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-Frame-Options", "DENY"),
+    ("X-XSS-Protection", "1; mode=block"),
+    ("Strict-Transport-Security", "max-age=31536000; includeSubDomains"),
+    ("Content-Security-Policy", "default-src 'self'"),
+)
+
+def _request_state(scope: Scope) -> Dict[str, Any]:
+    """The per-request state shared by the ASGI middlewares (``request.state``)"""
+    return scope.setdefault("state", {})
+
+def _error_envelope(status_code: int, code: str, message: Any, request_id: Optional[str]) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "success": False,
+            "error": {
+                "code": code,
+                "message": message
+            },
+            "request_id": request_id or str(uuid.uuid4()),
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
+class EnhancedRequestLoggingMiddleware:
+    """Pure ASGI equivalent of RequestLoggingMiddleware.
+
+    Avoids BaseHTTPMiddleware's extra task and response stream per request.
+    The request ID is stored in ``request.state`` and ``request_id_context``,
+    where the other Enhanced* middlewares and handlers pick it up.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = str(uuid.uuid4())
+        _request_state(scope)["request_id"] = request_id
+        request_id_context.set(request_id)
+
+        start_time = time.time()
+        logger.info(f"Request {request_id}: {scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                duration = time.time() - start_time
+                logger.info(
+                    f"Response {request_id}: "
+                    f"status={message['status']} "
+                    f"duration={duration:.3f}s"
+                )
+                headers = MutableHeaders(scope=message)
+                headers["X-Request-ID"] = request_id
+                headers["X-Response-Time"] = f"{duration:.3f}"
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+class EnhancedErrorHandlingMiddleware:
+    """Pure ASGI equivalent of ErrorHandlingMiddleware.
+
+    Exceptions raised before the response has started are turned into the
+    standard error envelope; once headers are sent they are re-raised.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except HTTPException as e:
+            if started:
+                raise
+            response = _error_envelope(
+                e.status_code, f"HTTP_{e.status_code}", e.detail, _request_state(scope).get("request_id")
+            )
+            await response(scope, receive, send)
+        except Exception as e:
+            if started:
+                raise
+            logger.error(f"Unhandled error: {str(e)}", exc_info=True)
+            response = _error_envelope(
+                500, "INTERNAL_ERROR", "An unexpected error occurred", _request_state(scope).get("request_id")
+            )
+            await response(scope, receive, send)
+
+class EnhancedSecurityMiddleware:
+    """Pure ASGI equivalent of SecurityMiddleware"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                for name, value in _SECURITY_HEADERS:
+                    headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
 class WebhookSignatureMiddleware(BaseHTTPMiddleware):
     """Validate webhook signatures for security"""
     
@@ -160,62 +305,269 @@ class WebhookSignatureMiddleware(BaseHTTPMiddleware):
         return await call_next(request)
 
 # Decorator for endpoint-specific caching
-def cache_response(ttl: int = 300):
-    """Decorator to cache endpoint responses"""
+def cache_response(ttl: int = 300, scope: str = "public"):
+    """Cache an endpoint's result in the shared response cache.
+
+    Meant for read endpoints EnhancedCacheMiddleware can't cache on its own,
+    such as POSTs with a query body. The key is the route, the sorted query
+    string and the endpoint's validated Pydantic arguments dumped as
+    canonical JSON, so equivalent requests share an entry however the client
+    ordered or defaulted their fields. ``scope`` is as for ``cache_policy``,
+    and ``@cache_tags`` applies. Results are stored and served through the
+    middleware (envelope, ETag, single-flight and invalidation); without it
+    the endpoint just runs.
+    """
+    if scope not in ("public", "user", "token"):
+        raise ValueError(f"Unknown cache scope: {scope}")
+    policy = CachePolicy(scope, ttl)
+
     def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        request_param = next(
+            (p.name for p in signature.parameters.values() if p.annotation is Request), None
+        )
+        injected = request_param is None
+        if injected:
+            request_param = "_cache_request"
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Get request from args
-            request = None
-            for arg in args:
-                if isinstance(arg, Request):
-                    request = arg
-                    break
-            
-            if not request:
+            request = kwargs.pop(request_param) if injected else kwargs[request_param]
+            cache = getattr(request.state, "response_cache", None)
+            if cache is None:
                 return await func(*args, **kwargs)
-            
-            # Generate cache key
-            cache_key = f"endpoint:{func.__name__}:{str(kwargs)}"
-            
-            # Try to get from cache
-            redis_client = request.app.state.redis
-            cached = await redis_client.get(cache_key)
-            
-            if cached:
-                return json.loads(cached)
-            
-            # Get fresh result
-            result = await func(*args, **kwargs)
-            
-            # Cache result
-            await redis_client.setex(
-                cache_key,
-                ttl,
-                json.dumps(result.dict() if hasattr(result, 'dict') else result)
-            )
-            
-            return result
-        
+            return await cache.cached_call(request, policy, func, args, kwargs)
+
+        if injected:
+            # Have FastAPI pass the Request without the endpoint declaring it
+            wrapper.__signature__ = signature.replace(parameters=[
+                *signature.parameters.values(),
+                inspect.Parameter(request_param, inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+            ])
+        # EnhancedCacheMiddleware leaves these routes to the decorator
+        wrapper.__cache_response__ = policy
         return wrapper
     return decorator
 
+def _canonical_args(kwargs: Dict[str, Any]) -> bytes:
+    """Canonical JSON of an endpoint's Pydantic arguments, for cache keys."""
+    models = {name: value.model_dump(mode="json") for name, value in kwargs.items() if isinstance(value, BaseModel)}
+    if not models:
+        return b""
+    return json.dumps(models, sort_keys=True, separators=(",", ":")).encode()
+
+async def _render(scope: Scope, result: Any) -> tuple[int, str, bytes]:
+    """Status, content type and body FastAPI would send for an endpoint's return value.
+
+    Goes through the route's response_model (validation, include/exclude,
+    aliases) and response_class, so cached and fresh responses match.
+    """
+    endpoint = scope.get("endpoint")
+    route = next(
+        (r for r in scope["app"].routes if isinstance(r, APIRoute) and r.endpoint is endpoint), None
+    )
+    if route is None:
+        return 200, "application/json", JSONResponse(jsonable_encoder(result)).body
+    content = await serialize_response(
+        field=route.response_field,
+        response_content=result,
+        include=route.response_model_include,
+        exclude=route.response_model_exclude,
+        by_alias=route.response_model_by_alias,
+        exclude_unset=route.response_model_exclude_unset,
+        exclude_defaults=route.response_model_exclude_defaults,
+        exclude_none=route.response_model_exclude_none,
+        is_coroutine=asyncio.iscoroutinefunction(route.dependant.call),
+    )
+    response_class = route.response_class
+    if isinstance(response_class, DefaultPlaceholder):
+        response_class = response_class.value
+    response = response_class(content, status_code=route.status_code or 200)
+    return response.status_code, response.media_type or "application/json", response.body
+
+class _CachedResponse(Response):
+    """A cache entry returned from an endpoint, sent with the middleware's ETag/encoding rules."""
+
+    def __init__(self, cache: "EnhancedCacheMiddleware", entry: tuple):
+        super().__init__(status_code=entry[0], media_type=entry[1])
+        self._cache = cache
+        self._entry = entry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self._cache._send_cached(scope, send, self._entry)
+        if self.background is not None:
+            await self.background()
+
+# --- Cache policies and tags ---
+CACHE_INVALIDATE_CHANNEL = "cache:invalidate"
+# Only successes and redirects are stored; errors are never replayed
+CACHEABLE_STATUSES = frozenset({200, 203, 204, 300, 301, 302, 303, 307, 308})
+_CACHE_TAG_PREFIX = "cache:tag:"
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """How EnhancedCacheMiddleware caches a route's GET responses"""
+    scope: str = "public"       # "public", "user" (per user id) or "token" (per bearer token)
+    ttl: Optional[int] = None   # freshness override; defaults to the middleware's default_ttl
+
+def cache_policy(scope: str = "public", ttl: Optional[int] = None):
+    """Opt a GET route into response caching.
+
+    ``public`` responses are shared by every caller, ``user`` responses are
+    keyed by the user id in the signed session token and ``token`` responses
+    by the bearer token itself. Requests whose identity can't be resolved are
+    passed through uncached.
+    """
+    if scope not in ("public", "user", "token"):
+        raise ValueError(f"Unknown cache scope: {scope}")
+    def decorator(func: Callable) -> Callable:
+        func.__cache_policy__ = CachePolicy(scope, ttl)
+        return func
+    return decorator
+
+def cache_tags(*tags):
+    """Declare the tags a GET route's cached responses are stored under.
+
+    Each tag is either a format string filled from the path and query
+    parameters (``"heatmap:{geohash}"``) or a callable taking that params dict
+    and returning a tag or list of tags. Write handlers drop every response
+    stored under a tag with ``invalidate_tags``.
+    """
+    def decorator(func: Callable) -> Callable:
+        func.__cache_tags__ = tags
+        return func
+    return decorator
+
+def _route_tags(scope: Scope, user: Optional[str] = None) -> Optional[list[str]]:
+    """Tags declared by the endpoint that handled ``scope``; None if they can't be resolved.
+
+    Besides path and query parameters, ``{user}`` is the cache identity of
+    the request (the user id for per-user routes).
+    """
+    spec = getattr(scope.get("endpoint"), "__cache_tags__", ())
+    if not spec:
+        return []
+    params = dict(parse_qsl(scope.get("query_string", b"").decode()))
+    params.update(scope.get("path_params", {}))
+    if user is not None:
+        params["user"] = user
+    tags = []
+    try:
+        for tag in spec:
+            resolved = tag(params) if callable(tag) else tag.format(**params)
+            tags.extend([resolved] if isinstance(resolved, str) else resolved)
+    except (KeyError, ValueError) as e:
+        logger.warning(f"Could not resolve cache tags for {scope.get('path')}: {e}")
+        return None
+    return tags
+
+_INVALIDATE_TAGS_LUA = """
+local dropped = {}
+for _, tag in ipairs(KEYS) do
+  for _, key in ipairs(redis.call("SMEMBERS", tag)) do
+    redis.call("DEL", key)
+    dropped[#dropped + 1] = key
+  end
+  redis.call("DEL", tag)
+end
+return dropped
+"""
+
+async def invalidate_tags(redis_client: redis.Redis, *tags: str) -> int:
+    """Drop every cached response stored under any of ``tags``.
+
+    Keys are removed atomically with their tag sets, and every replica's L1
+    is told to drop them. Returns the number of keys dropped.
+    """
+    if not tags:
+        return 0
+    script = redis_client.register_script(_INVALIDATE_TAGS_LUA)
+    dropped = await script(keys=[_CACHE_TAG_PREFIX + tag for tag in tags])
+    keys = sorted({k.decode() if isinstance(k, bytes) else k for k in dropped})
+    if keys:
+        await redis_client.publish(CACHE_INVALIDATE_CHANNEL, json.dumps({"origin": None, "keys": keys}))
+    return len(keys)
+
 # Request ID context manager
 class RequestIDContext:
-    """Context manager for request ID propagation"""
+    """Context manager for request ID propagation
+
+    Backed by a ContextVar so concurrent requests each see their own ID.
+    """
     
     def __init__(self):
-        self._request_id = None
+        self._request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
     
     def set(self, request_id: str):
-        self._request_id = request_id
+        self._request_id.set(request_id)
     
     def get(self) -> Optional[str]:
-        return self._request_id
+        return self._request_id.get()
 
 request_id_context = RequestIDContext()
 
+class TokenLeases:
+    """Per-worker token leases taken in batches from the Redis buckets.
+
+    Requests are debited against local leases with no network I/O, and a
+    bucket's lease is topped up in the background once it drops below half of
+    ``lease_size``. Unused tokens are dropped when a lease expires, so each
+    worker can overshoot the distributed limit by at most ``lease_size``
+    tokens per bucket.
+    """
+
+    def __init__(self, lease_size: int, lease_ttl: float = 1.0, max_keys: int = 10000):
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.max_keys = max_keys
+        self._leases: Dict[str, list] = {}    # bucket key -> [tokens, expires_at]
+        self._backoff: Dict[str, float] = {}  # bucket key -> earliest next lease attempt
+
+    def take(self, keys: list[str], cost: int) -> bool:
+        """Debit ``cost`` from the lease of every key, or from none of them."""
+        now = time.monotonic()
+        leases = []
+        for key in keys:
+            lease = self._leases.get(key)
+            if lease is None or lease[1] < now or lease[0] < cost:
+                return False
+            leases.append(lease)
+        for lease in leases:
+            lease[0] -= cost
+        return True
+
+    def wanted(self, keys: list[str]) -> list[str]:
+        """Keys whose lease is missing, expired or running low."""
+        now = time.monotonic()
+        out = []
+        for key in keys:
+            if self._backoff.get(key, 0.0) > now:
+                continue
+            lease = self._leases.get(key)
+            if lease is None or lease[1] < now or lease[0] < self.lease_size / 2:
+                out.append(key)
+        return out
+
+    def grant(self, key: str, tokens: int):
+        now = time.monotonic()
+        lease = self._leases.pop(key, None)
+        remaining = lease[0] if lease is not None and lease[1] >= now else 0
+        self._leases[key] = [remaining + tokens, now + self.lease_ttl]
+        self._backoff.pop(key, None)
+        self._evict(self._leases)
+
+    def deny(self, key: str, retry_after: float):
+        self._backoff[key] = time.monotonic() + retry_after
+        self._evict(self._backoff)
+
+    def _evict(self, table: dict):
+        # Dicts keep insertion order, so this drops the oldest entries first.
+        while len(table) > self.max_keys:
+            table.pop(next(iter(table)))
+
 class EnhancedRateLimitMiddleware:
+    LEVELS = ("global", "route", "user", "ip")
+
     def __init__(
         self,
         app: ASGIApp,
@@ -233,6 +585,8 @@ class EnhancedRateLimitMiddleware:
         ttl_seconds: int = 60,
         max_concurrency: int = 200,
         shed_threshold: int = 240,
+        lease_size: int = 0,
+        lease_ttl: float = 1.0,
     ):
         self.app = app
         self.redis = redis
@@ -248,6 +602,10 @@ class EnhancedRateLimitMiddleware:
         self.ttl = ttl_seconds
         self.sema = asyncio.Semaphore(max_concurrency)
         self.shed_threshold = shed_threshold
+        # Optional in-process tier; lease_size=0 checks Redis on every request.
+        self.leases = TokenLeases(lease_size, lease_ttl) if lease_size > 0 else None
+        self._refilling: set[str] = set()
+        self._refill_tasks: set[asyncio.Task] = set()
 
     async def _ensure_lua(self):
         if self.lua_sha is None:
@@ -264,14 +622,56 @@ class EnhancedRateLimitMiddleware:
             "ip":     f"{base}:i:{ip}",
         }
 
-    async def _check_bucket(self, key: str, cap: int, rate: int) -> tuple[int, float, int]:
+    async def _check_buckets(
+        self,
+        keys: Dict[str, str],
+        levels: tuple[str, ...],
+        costs: Optional[Dict[str, int]] = None,
+    ) -> tuple[int, Optional[str], int, Dict[str, float]]:
+        """Check and debit every level's bucket in one script call.
+
+        ``costs`` overrides the per-level debit (default ``self.cost``).
+        Returns (allowed, rejected_level, retry_after_ms, tokens_per_level).
+        """
         await self._ensure_lua()
         now_ms = int(time.time() * 1000)
+        args = [now_ms, self.ttl]
+        for level in levels:
+            cap, rate = self.capacity[level]
+            args.extend((cap, rate, self.cost if costs is None else costs[level]))
         res = await self.redis.evalsha(
-            self.lua_sha, 1, key, cap, rate, now_ms, self.cost, self.ttl
+            self.lua_sha, len(levels), *(keys[level] for level in levels), *args
         )
-        allowed, tokens, retry_after_ms = int(res[0]), float(res[1]), int(res[2])
-        return allowed, tokens, retry_after_ms
+        allowed, rejected, retry_after_ms = int(res[0]), int(res[1]), int(res[2])
+        tokens = {level: float(t) for level, t in zip(levels, res[3:])}
+        return allowed, (levels[rejected - 1] if rejected else None), retry_after_ms, tokens
+
+    def _schedule_refill(self, keys: Dict[str, str]):
+        wanted = [k for k in self.leases.wanted(list(keys.values())) if k not in self._refilling]
+        if not wanted:
+            return
+        self._refilling.update(wanted)
+        task = asyncio.create_task(self._refill_leases(keys, wanted))
+        self._refill_tasks.add(task)
+        task.add_done_callback(self._refill_tasks.discard)
+
+    async def _refill_leases(self, keys: Dict[str, str], wanted: list[str]):
+        """Lease a batch of tokens for the wanted buckets in one script call."""
+        try:
+            size = self.leases.lease_size
+            costs = {level: size if keys[level] in wanted else 0 for level in self.LEVELS}
+            allowed, rejected, retry_ms, tokens = await self._check_buckets(keys, self.LEVELS, costs)
+            for level, remaining in tokens.items():
+                RATE_TOKENS.labels(scope=level).set(remaining)
+            if allowed:
+                for key in wanted:
+                    self.leases.grant(key, size)
+            else:
+                self.leases.deny(keys[rejected], retry_ms / 1000.0)
+        except Exception as e:
+            logger.warning(f"Token lease refill failed: {e}")
+        finally:
+            self._refilling.difference_update(wanted)
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send):
         if scope["type"] != "http":
@@ -280,7 +680,7 @@ class EnhancedRateLimitMiddleware:
         # Admission control (fast path: shed if queue too deep)
         queued = max(0, self.sema._value * -1)
         QUEUE_DEPTH.set(queued)
-        if CONCURRENCY._value is not None and CONCURRENCY._value >= self.shed_threshold:
+        if CONCURRENCY._value.get() >= self.shed_threshold:
             RATE_DROPPED.labels(scope="admission").inc()
             return await self._reject(send, 429, "admission_shed", retry_after=0.2)
 
@@ -291,14 +691,20 @@ class EnhancedRateLimitMiddleware:
 
         keys = self._keys(scope, route, user, ip)
 
-        # Hierarchical checks: global → route → user → IP (fail fast)
-        for level in ("global", "route", "user", "ip"):
-            cap, rate = self.capacity[level]
-            allowed, tokens, retry_ms = await self._check_bucket(keys[level], cap, rate)
-            RATE_TOKENS.labels(scope=level).set(tokens)
+        if self.leases is not None and self.leases.take([keys[level] for level in self.LEVELS], self.cost):
+            # Fast path: admitted from local leases without touching Redis.
+            self._schedule_refill(keys)
+        else:
+            # Hierarchical checks: global → route → user → IP, all in one round trip.
+            # Nothing is debited unless every level admits the request.
+            allowed, rejected, retry_ms, tokens = await self._check_buckets(keys, self.LEVELS)
+            for level, remaining in tokens.items():
+                RATE_TOKENS.labels(scope=level).set(remaining)
             if not allowed:
-                RATE_LIMITED.labels(scope=level).inc()
-                return await self._reject(send, 429, f"rate_limited_{level}", retry_after=retry_ms/1000.0)
+                RATE_LIMITED.labels(scope=rejected).inc()
+                return await self._reject(send, 429, f"rate_limited_{rejected}", retry_after=retry_ms/1000.0)
+            if self.leases is not None:
+                self._schedule_refill(keys)
 
         # Passed limiter: run request inside concurrency semaphore
         async with self.sema:
@@ -317,13 +723,222 @@ class EnhancedRateLimitMiddleware:
         await send({"type": "http.response.start", "status": status, "headers": headers})
         await send({"type": "http.response.body", "body": body})
 
+# --- Cache envelope ---
+# One Redis value per cached response:
+#   version(B) status(H) ts(d) encoding(B) etag(16s) ct_len(H) | content-type | body
+_ENVELOPE = struct.Struct("!BHdB16sH")
+_ENVELOPE_VERSION = 2
+_ENCODINGS = ("identity", "gzip", "zstd")
+
+def _etag_digest(body: bytes) -> bytes:
+    return hashlib.sha256(body).digest()[:16]
+
+def _format_etag(digest: bytes, encoding: str = "identity") -> str:
+    # Strong validators must differ between content-codings of the same body
+    tag = base64.urlsafe_b64encode(digest).decode().rstrip("=")
+    return f'"{tag}"' if encoding == "identity" else f'"{tag}-{encoding}"'
+
+def _pack_envelope(status: int, ct: str, ts: float, encoding: str, etag: bytes, payload: bytes) -> bytes:
+    ct_bytes = ct.encode()
+    header = _ENVELOPE.pack(
+        _ENVELOPE_VERSION, status, ts, _ENCODINGS.index(encoding), etag, len(ct_bytes)
+    )
+    return header + ct_bytes + payload
+
+def _unpack_envelope(raw: bytes) -> Optional[tuple[int, str, float, str, bytes, bytes]]:
+    """Return (status, content_type, ts, encoding, etag_digest, payload), or None if not an envelope."""
+    if len(raw) < _ENVELOPE.size or raw[0] != _ENVELOPE_VERSION:
+        return None
+    _, status, ts, encoding, etag, ct_len = _ENVELOPE.unpack_from(raw)
+    start = _ENVELOPE.size + ct_len
+    return status, raw[_ENVELOPE.size:start].decode(), ts, _ENCODINGS[encoding], etag, raw[start:]
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=5)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return body
+
+def _decompress(encoding: str, payload: bytes) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(payload)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return payload
+
+def _if_none_match(scope: Scope, etag: str) -> bool:
+    """Whether the request's If-None-Match matches ``etag`` (weak comparison)."""
+    for name, value in scope.get("headers", []):
+        if name != b"if-none-match":
+            continue
+        for candidate in value.decode("latin-1").split(","):
+            candidate = candidate.strip()
+            if candidate == "*" or candidate.removeprefix("W/") == etag:
+                return True
+    return False
+
+def _not_modified(scope: Scope, status: int, etag: str) -> bool:
+    """Whether a response with ``status`` and ``etag`` is answered with 304."""
+    return status == 200 and _if_none_match(scope, etag)
+
+def _accepts_encoding(scope: Scope, encoding: str) -> bool:
+    for name, value in scope.get("headers", []):
+        if name != b"accept-encoding":
+            continue
+        for item in value.decode("latin-1").split(","):
+            coding, _, params = item.strip().partition(";")
+            if coding.strip() in (encoding, "*") and params.replace(" ", "") not in ("q=0", "q=0.0"):
+                return True
+    return False
+
+class LocalCache:
+    """Bounded in-process LRU with a per-entry TTL, sized by body bytes"""
+
+    def __init__(self, max_bytes: int, ttl: float, max_entries: int = 10000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries: "OrderedDict[str, tuple[float, int, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def set(self, key: str, value: Any, size: int):
+        self.pop(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.size += size
+        while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+            _, (_, dropped, _) = self._entries.popitem(last=False)
+            self.size -= dropped
+        CACHE_L1_BYTES.set(self.size)
+
+    def pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+            CACHE_L1_BYTES.set(self.size)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+        CACHE_L1_BYTES.set(0)
+
 class EnhancedCacheMiddleware:
-    def __init__(self, app: ASGIApp, redis: redis.Redis, *, secret: str, default_ttl: int = 60, swr_ttl: int = 300):
+    INVALIDATE_CHANNEL = CACHE_INVALIDATE_CHANNEL
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        redis: redis.Redis,
+        *,
+        secret: str,
+        default_ttl: int = 60,
+        swr_ttl: int = 300,
+        fill_lock_ttl: float = 10.0,
+        fill_wait: float = 2.0,
+        l1_max_bytes: int = 32 * 1024 * 1024,
+        l1_ttl: float = 1.0,
+        compression: Optional[str] = "gzip",
+        compress_min_bytes: int = 1024,
+        session_secret: Optional[str] = None,
+        sessions: Any = None,
+        default_policy: Optional[CachePolicy] = None,
+    ):
         self.app = app
         self.redis = redis
         self.secret = secret.encode()
         self.default_ttl = default_ttl
         self.swr_ttl = swr_ttl
+        # Single-flight: one fill per key per worker, and one per key across
+        # replicas via a Redis lock held for at most fill_lock_ttl seconds.
+        self.fill_lock_ttl = fill_lock_ttl
+        self.fill_wait = fill_wait
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: set[str] = set()
+        self._refresh_tasks: set[asyncio.Task] = set()
+        # L1: per-worker copy of hot entries, dropped on pub/sub invalidation
+        self.l1 = LocalCache(l1_max_bytes, l1_ttl) if l1_max_bytes > 0 else None
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        # Bodies above compress_min_bytes are stored compressed ("gzip", or
+        # "zstd" when zstandard is installed) and served as-is to clients
+        # that accept the encoding.
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard not installed; falling back to gzip cache compression")
+            compression = "gzip"
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        # Routes opt in with @cache_policy; default_policy covers the rest
+        self.session_secret = session_secret.encode() if session_secret else None
+        # Optional session validator (async get(token) -> session dict or
+        # None, e.g. sessions.SessionCache): only live sessions are served
+        # from the cache, so revoked tokens can't keep reading cached routes.
+        self.sessions = sessions
+        self.default_policy = default_policy
+        self._policies: "OrderedDict[tuple[str, str], Optional[CachePolicy]]" = OrderedDict()
+
+    def _policy(self, scope: Scope) -> Optional[CachePolicy]:
+        """Resolve the cache policy of the route ``scope`` will be dispatched to."""
+        cache_key = (scope["method"], scope.get("path", "/"))
+        if cache_key in self._policies:
+            return self._policies[cache_key]
+        policy = self.default_policy
+        router = getattr(scope.get("app"), "router", None)
+        for route in getattr(router, "routes", ()):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                endpoint = child_scope.get("endpoint")
+                if hasattr(endpoint, "__cache_response__"):
+                    policy = None  # cached by the endpoint's own decorator
+                else:
+                    policy = getattr(endpoint, "__cache_policy__", policy)
+                break
+        self._policies[cache_key] = policy
+        if len(self._policies) > 4096:
+            self._policies.popitem(last=False)
+        return policy
+
+    async def _identity(self, scope: Scope, policy: CachePolicy) -> tuple[bool, Optional[str]]:
+        """(cacheable, identity) of a request under ``policy``.
+
+        Without a session validator the identity comes from the bearer token
+        alone. With one, requests without a live session are not cacheable
+        (the route itself rejects them) and ``user`` responses are keyed by
+        the session's user id.
+        """
+        token = None
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                kind, _, credentials = value.decode("latin-1").partition(" ")
+                if kind.lower() == "bearer" and credentials:
+                    token = credentials.strip()
+                break
+        session = None
+        if self.sessions is not None:
+            session = await self.sessions.get(token) if token else None
+            if session is None:
+                return False, None
+        if policy.scope == "public":
+            return True, None
+        if token is None:
+            return False, None
+        if policy.scope == "token":
+            return True, "token:" + hashlib.sha256(token.encode()).hexdigest()[:32]
+        if session is not None:
+            return True, session["user_id"]
+        user_id = session_tokens.user_id(token, self.session_secret) if self.session_secret else None
+        return user_id is not None, user_id
 
     def _key(self, route: str, user: Optional[str], query: str, body: bytes) -> str:
         h = hmac.new(self.secret, digestmod=hashlib.sha256)
@@ -337,99 +952,341 @@ class EnhancedCacheMiddleware:
     async def __call__(self, scope: Scope, receive: Receive, send: Send):
         if scope["type"] != "http":
             return await self.app(scope, receive, send)
+        # Lets @cache_response endpoints reach this cache
+        _request_state(scope)["response_cache"] = self
         if scope["method"] not in ("GET", "HEAD"):
             return await self.app(scope, receive, send)
+        policy = self._policy(scope)
+        if policy is None:
+            return await self._forward_with_etag(scope, receive, send)
+        cacheable, user = await self._identity(scope, policy)
+        if not cacheable:
+            return await self._forward_with_etag(scope, receive, send)
+        self._ensure_listener(scope)
 
         route = scope.get("path", "/")
         query = scope.get("query_string", b"").decode()
-        user = None
+        ttl = policy.ttl if policy.ttl is not None else self.default_ttl
 
         # Buffer body-less GET
         body_bytes = b""
         key = self._key(route, user, query, body_bytes)
-        meta_key = key + ":meta"
 
-        # Try cache
-        raw = await self.redis.get(key)
-        meta = await self.redis.hgetall(meta_key)
-        if raw and meta:
-            CACHE_HIT.labels(route=route).inc()
-            # Serve fresh or stale
-            age = time.time() - float(meta.get(b"ts", b"0"))
-            if age > self.default_ttl and age <= self.swr_ttl:
-                CACHE_STALE.labels(route=route).inc()
-                # kick background refresh
-                asyncio.create_task(self._refresh(scope, receive, key, meta_key, route))
-            headers = [(b"content-type", meta.get(b"ct", b"application/json"))]
-            await send({"type": "http.response.start", "status": int(meta.get(b"status", b"200")), "headers": headers})
-            await send({"type": "http.response.body", "body": raw})
-            return
+        entry = await self._get(key, route, ttl, lambda: self._populate(scope, key, user, ttl))
+        if entry is not None:
+            return await self._send_cached(scope, send, entry)
 
         CACHE_MISS.labels(route=route).inc()
         # Miss → proxy to app; capture response
-        await self._populate_and_forward(scope, receive, send, key, meta_key, route)
+        entry, filled = await self._single_flight(
+            key, route, lambda: self._populate_and_forward(scope, receive, send, key, user, ttl)
+        )
+        if filled:
+            return
+        if entry is None:
+            # Leader failed or response was not cacheable; run the handler ourselves
+            return await self._forward_with_etag(scope, receive, send)
+        await self._send_cached(scope, send, entry)
+
+    async def cached_call(self, request: Request, policy: CachePolicy, func: Callable, args: tuple, kwargs: dict):
+        """Serve a @cache_response endpoint from the cache, calling it on a miss."""
+        cacheable, user = await self._identity(request.scope, policy)
+        if not cacheable:
+            return await func(*args, **kwargs)
+        self._ensure_listener(request.scope)
+
+        route = request.scope.get("path", "/")
+        query = urlencode(sorted(parse_qsl(request.scope.get("query_string", b"").decode(), keep_blank_values=True)))
+        ttl = policy.ttl if policy.ttl is not None else self.default_ttl
+        key = self._key(f"{request.method} {route}", user, query, _canonical_args(kwargs))
+        uncached = None
 
-    async def _refresh(self, scope, receive, key, meta_key, route):
+        async def populate():
+            nonlocal uncached
+            result = await func(*args, **kwargs)
+            tags = _route_tags(request.scope, user)
+            # Only plain return values (a 200) are stored: a returned Response
+            # of any status passes through as is, and errors have raised
+            if isinstance(result, Response) or tags is None:
+                uncached = result
+                return None
+            status, ct, body = await _render(request.scope, result)
+            if status not in CACHEABLE_STATUSES:
+                uncached = result
+                return None
+            return await self._store(key, status, ct, body, tags, ttl)
+
+        entry = await self._get(key, route, ttl, populate)
+        if entry is not None:
+            return _CachedResponse(self, entry)
+
+        CACHE_MISS.labels(route=route).inc()
+        entry, filled = await self._single_flight(key, route, populate)
+        if entry is not None:
+            return _CachedResponse(self, entry)
+        return uncached if filled else await func(*args, **kwargs)
+
+    def _ensure_listener(self, scope: Scope):
+        if self.l1 is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_invalidations())
+            # Handed to the app's lifespan, which cancels it on shutdown
+            state = getattr(scope.get("app"), "state", None)
+            tasks = getattr(state, "background_tasks", None)
+            if tasks is not None:
+                tasks.add(self._listener)
+
+    async def _get(self, key: str, route: str, ttl: int, populate: Callable) -> Optional[tuple]:
+        """Cached entry for ``key``, in-process first, then Redis.
+
+        A stale entry is still returned, and ``populate()`` is started in the
+        background to refresh it, at most once per key.
+        """
+        entry = self.l1.get(key) if self.l1 is not None else None
+        if entry is not None:
+            CACHE_L1_HIT.labels(route=route).inc()
+        else:
+            entry = await self._lookup(key)
+            if entry is not None and self.l1 is not None:
+                self.l1.set(key, entry, len(entry[-1]))
+        if entry is None:
+            return None
+        CACHE_HIT.labels(route=route).inc()
+        ts = entry[2]
+        # Serve fresh or stale
+        age = time.time() - ts
+        if age > ttl and age <= max(self.swr_ttl, ttl) and key not in self._refreshing:
+            CACHE_STALE.labels(route=route).inc()
+            self._refreshing.add(key)
+            task = asyncio.create_task(self._refresh(key, route, populate))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        return entry
+
+    async def _single_flight(self, key: str, route: str, fill: Callable) -> tuple[Optional[tuple], bool]:
+        """Run ``fill()`` for a missing key at most once per worker and once across replicas.
+
+        Returns (entry, filled); ``filled`` is True when this call ran
+        ``fill()`` itself, otherwise ``entry`` is the result of the fill it
+        waited for (None if that failed or wasn't cacheable).
+        """
+        # Another request in this worker is already filling the key: wait for it
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending), False
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        CACHE_FILL.labels(route=route).inc()
+        result = None
         try:
-            CACHE_FILL.labels(route=route).inc()
-            await self._populate(scope, key, meta_key, route)
+            lock = self.redis.lock(key + ":fill", timeout=self.fill_lock_ttl, blocking=False)
+            if not await self._try_acquire(lock):
+                # Another replica holds the fill lock: wait briefly for its result
+                result = await self._wait_for_fill(key)
+                if result is not None:
+                    return result, False
+            try:
+                result = await fill()
+            finally:
+                await self._release(lock)
+            return result, True
         finally:
+            del self._inflight[key]
             CACHE_FILL.labels(route=route).dec()
+            future.set_result(result)
 
-    async def _populate_and_forward(self, scope, receive, send, key, meta_key, route):
-        # Intercept downstream response
-        chunks = []
-        status_code = 200
-        headers = {}
-
-        async def send_wrapper(message):
-            nonlocal status_code, headers, chunks
-            if message["type"] == "http.response.start":
-                status_code = message["status"]
-                headers = {k.decode(): v.decode() for k, v in message.get("headers", [])}
-            elif message["type"] == "http.response.body":
-                body = message.get("body", b"")
-                if body:
-                    chunks.append(body)
-            await send(message)
+    async def _lookup(self, key: str) -> Optional[tuple[int, str, float, str, bytes, bytes]]:
+        """Fetch (status, content_type, ts, encoding, etag_digest, payload) with a single GET."""
+        raw = await self.redis.get(key)
+        return _unpack_envelope(raw) if raw else None
 
-        await self.app(scope, receive, send_wrapper)
-        # Populate cache (best-effort)
+    async def _store(
+        self, key: str, status: int, ct: str, body: bytes, tags: Optional[list[str]] = None,
+        ttl: Optional[int] = None,
+    ) -> tuple[int, str, float, str, bytes, bytes]:
+        etag = _etag_digest(body)
+        entry = (status, ct, time.time(), "identity", etag, body)
         try:
-            body = b"".join(chunks)
-            ct = headers.get("content-type", "application/json")
+            if self.compression and len(body) >= self.compress_min_bytes:
+                entry = (status, ct, entry[2], self.compression, etag, _compress(self.compression, body))
+            expire = max(self.swr_ttl, ttl or 0)
             pipe = self.redis.pipeline()
-            pipe.set(key, body, ex=self.swr_ttl)
-            pipe.hmset(meta_key, mapping={"status": str(status_code), "ct": ct, "ts": str(time.time())})
-            pipe.expire(meta_key, self.swr_ttl)
+            pipe.set(key, _pack_envelope(*entry), ex=expire)
+            for tag in tags or ():
+                pipe.sadd(_CACHE_TAG_PREFIX + tag, key)
+                pipe.expire(_CACHE_TAG_PREFIX + tag, expire)
+            if self.l1 is not None:
+                self.l1.set(key, entry, len(entry[-1]))
+                pipe.publish(self.INVALIDATE_CHANNEL, json.dumps({"origin": self._origin, "keys": [key]}))
             await pipe.execute()
+        except Exception as e:
+            # Populate cache (best-effort)
+            logger.warning(f"Cache store failed: {e}")
+        return entry
+
+    async def invalidate(self, *keys: str):
+        """Drop cached responses here, in Redis and in every replica's L1."""
+        if not keys:
+            return
+        if self.l1 is not None:
+            for key in keys:
+                self.l1.pop(key)
+        pipe = self.redis.pipeline()
+        pipe.delete(*keys)
+        pipe.publish(self.INVALIDATE_CHANNEL, json.dumps({"origin": self._origin, "keys": list(keys)}))
+        await pipe.execute()
+
+    async def _listen_invalidations(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.INVALIDATE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") == self._origin:
+                        continue
+                    for key in data.get("keys", []):
+                        self.l1.pop(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Invalidations may have been missed while disconnected
+                logger.warning(f"Cache invalidation listener error: {e}")
+                self.l1.clear()
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+
+    async def _send_cached(self, scope: Scope, send: Send, entry: tuple[int, str, float, str, bytes, bytes]):
+        status, ct, _, encoding, etag, payload = entry
+        headers = [(b"content-type", ct.encode())]
+        if encoding != "identity":
+            headers.append((b"vary", b"accept-encoding"))
+            if _accepts_encoding(scope, encoding):
+                headers.append((b"content-encoding", encoding.encode()))
+            else:
+                encoding = "identity"
+                # Anything but a 304 carries the body, which must go out decoded
+                if not _not_modified(scope, status, _format_etag(etag)):
+                    payload = _decompress(entry[3], payload)
+        await self._respond(scope, send, status, headers, payload, _format_etag(etag, encoding))
+
+    async def _respond(self, scope: Scope, send: Send, status: int, headers: list, body: bytes, etag: str):
+        """Send a buffered response, or 304 if the client already has ``etag``."""
+        headers = [*headers, (b"etag", etag.encode())]
+        if _not_modified(scope, status, etag):
+            status, body = 304, b""
+            headers = [(k, v) for k, v in headers if k in (b"etag", b"vary", b"cache-control")]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _try_acquire(self, lock) -> bool:
+        try:
+            return await lock.acquire()
         except Exception:
-            pass
+            # Redis trouble: fill without cross-replica coordination
+            return True
 
-    async def _populate(self, scope, key, meta_key, route):
-        # Clone scope minimally for GET refresh
+    async def _release(self, lock):
+        try:
+            if lock.local.token is not None:
+                await lock.release()
+        except Exception:
+            pass  # lock expired or Redis unavailable; it times out on its own
+
+    async def _wait_for_fill(self, key):
+        deadline = time.monotonic() + self.fill_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await self._lookup(key)
+            if entry is not None:
+                return entry
+        return None
+
+    async def _refresh(self, key, route, populate):
+        lock = self.redis.lock(key + ":fill", timeout=self.fill_lock_ttl, blocking=False)
+        try:
+            if not await self._try_acquire(lock):
+                return  # another replica is already refreshing this key
+            CACHE_FILL.labels(route=route).inc()
+            try:
+                await populate()
+            finally:
+                CACHE_FILL.labels(route=route).dec()
+                await self._release(lock)
+        except Exception as e:
+            logger.warning(f"Cache refresh failed for {route}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    async def _capture(self, scope, receive):
+        """Run the handler and buffer its whole response."""
         chunks = []
         status_code = 200
-        headers = {}
+        headers = []
 
-        async def blackhole_send(message):
-            nonlocal status_code, headers, chunks
+        async def capture_send(message):
+            nonlocal status_code, headers
             if message["type"] == "http.response.start":
                 status_code = message["status"]
-                headers = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+                headers = list(message.get("headers", []))
             elif message["type"] == "http.response.body":
                 body = message.get("body", b"")
                 if body:
                     chunks.append(body)
 
-        await self.app(scope, _noop_receive, blackhole_send)  # _noop_receive can return empty body for refresh
-        body = b"".join(chunks)
-        ct = headers.get("content-type", "application/json")
-        pipe = self.redis.pipeline()
-        pipe.set(key, body, ex=self.swr_ttl)
-        pipe.hmset(meta_key, mapping={"status": str(status_code), "ct": ct, "ts": str(time.time())})
-        pipe.expire(meta_key, self.swr_ttl)
-        await pipe.execute()
+        await self.app(scope, receive, capture_send)
+        return status_code, headers, b"".join(chunks)
+
+    async def _populate_and_forward(self, scope, receive, send, key, user, ttl):
+        # Miss → run the handler, store the response, then answer the client
+        status_code, headers, body = await self._capture(scope, receive)
+        names = {k.lower(): v for k, v in headers}
+        tags = _route_tags(scope, user)
+        if status_code not in CACHEABLE_STATUSES or b"content-encoding" in names or tags is None:
+            # an error, already encoded downstream, or tags unresolvable; not cached
+            await self._respond(scope, send, status_code, headers, body, _format_etag(_etag_digest(body)))
+            return None
+        ct = names.get(b"content-type", b"application/json").decode()
+        entry = await self._store(key, status_code, ct, body, tags, ttl)
+        await self._respond(scope, send, status_code, headers, body, _format_etag(entry[4]))
+        return entry
+
+    async def _populate(self, scope, key, user, ttl):
+        # Clone scope minimally for GET refresh
+        status_code, headers, body = await self._capture(scope, _noop_receive)
+        names = {k.lower(): v for k, v in headers}
+        tags = _route_tags(scope, user)
+        if status_code in CACHEABLE_STATUSES and b"content-encoding" not in names and tags is not None:
+            ct = names.get(b"content-type", b"application/json").decode()
+            await self._store(key, status_code, ct, body, tags, ttl)
+
+    async def _forward_with_etag(self, scope, receive, send):
+        """Pass an uncached response through, adding a hash ETag to complete bodies.
+
+        Streamed responses (more_body) and responses that already carry an
+        ETag are forwarded untouched.
+        """
+        held = None
+
+        async def send_wrapper(message):
+            nonlocal held
+            if message["type"] == "http.response.start":
+                held = message
+                return
+            if held is None:
+                return await send(message)
+            start, held = held, None
+            headers = list(start.get("headers", []))
+            if message.get("more_body", False) or any(k.lower() == b"etag" for k, _ in headers):
+                await send(start)
+                return await send(message)
+            body = message.get("body", b"")
+            await self._respond(scope, send, start["status"], headers, body, _format_etag(_etag_digest(body)))
+
+        await self.app(scope, receive, send_wrapper)
 
 async def _noop_receive():
     return {"type": "http.request", "body": b"", "more_body": False}
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""Widen laces_ledger.reason for the gateway's write-behind
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17 00:00:00.000000
+
+laces_writer.py copies every gateway LACES credit/debit into laces_ledger.
+Gateway reasons (SPOT, BOOST, DAILY_STIPEND, ...) are not limited to the
+lacesreason enum, so the column stores the reason as text.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column('laces_ledger', 'reason',
+        existing_type=postgresql.ENUM('SPOT', 'VERIFY', 'KNOWLEDGE', 'TRADE', 'GOOD_VIBES', 'DROPZONE', name='lacesreason'),
+        type_=sa.String(length=50),
+        existing_nullable=False,
+        postgresql_using='reason::text'
+    )
+
+
+def downgrade() -> None:
+    # Fails while rows hold reasons outside the enum
+    op.alter_column('laces_ledger', 'reason',
+        existing_type=sa.String(length=50),
+        type_=postgresql.ENUM('SPOT', 'VERIFY', 'KNOWLEDGE', 'TRADE', 'GOOD_VIBES', 'DROPZONE', name='lacesreason'),
+        existing_nullable=False,
+        postgresql_using='reason::lacesreason'
+    )
@@ -1,41 +1,58 @@
--- KEYS[1] = bucket key
--- ARGV: capacity, refill_per_sec, now_ms, cost, ttl_seconds
--- returns: {allowed(1/0), remaining_tokens, retry_after_ms}
-
-local key = KEYS[1]
-local capacity = tonumber(ARGV[1])
-local rate = tonumber(ARGV[2])            -- tokens per second
-local now_ms = tonumber(ARGV[3])
-local cost = tonumber(ARGV[4])            -- usually 1
-local ttl = tonumber(ARGV[5])
-
-local bucket = redis.call("HMGET", key, "tokens", "ts")
-local tokens = tonumber(bucket[1])
-local ts = tonumber(bucket[2])
-
-if tokens == nil then
-  tokens = capacity
-  ts = now_ms
-else
-  local delta = math.max(0, now_ms - ts) / 1000.0
-  local refill = delta * rate
-  tokens = math.min(capacity, tokens + refill)
-  ts = now_ms
-end
+-- KEYS[1..n] = bucket keys, checked in order (e.g. global, route, user, ip)
+-- ARGV: now_ms, ttl_seconds, then capacity_i, refill_per_sec_i, cost_i for each key
+-- returns: {allowed(1/0), rejected_index(0 if allowed), retry_after_ms, tokens_1, ..., tokens_n}
+--
+-- All buckets are checked before any is debited, so a request rejected at a
+-- lower level never consumes tokens from the levels above it. A cost larger
+-- than 1 leases a batch of tokens for an in-process tier; a cost of 0 only
+-- reads the bucket.
 
-local allowed = 0
+local now_ms = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+
+local n = #KEYS
+local tokens = {}
+local costs = {}
+local rejected = 0
 local retry_after_ms = 0
 
-if tokens >= cost then
-  tokens = tokens - cost
+for i = 1, n do
+  local capacity = tonumber(ARGV[i * 3])
+  local rate = tonumber(ARGV[i * 3 + 1])  -- tokens per second
+  local cost = tonumber(ARGV[i * 3 + 2])  -- usually 1
+  costs[i] = cost
+
+  local bucket = redis.call("HMGET", KEYS[i], "tokens", "ts")
+  local t = tonumber(bucket[1])
+  local ts = tonumber(bucket[2])
+
+  if t == nil then
+    t = capacity
+  else
+    local delta = math.max(0, now_ms - ts) / 1000.0
+    t = math.min(capacity, t + delta * rate)
+  end
+  tokens[i] = t
+
+  if rejected == 0 and t < cost then
+    rejected = i
+    retry_after_ms = math.ceil(((cost - t) / rate) * 1000.0)
+  end
+end
+
+local allowed = 0
+if rejected == 0 then
   allowed = 1
-else
-  allowed = 0
-  local needed = cost - tokens
-  retry_after_ms = math.ceil((needed / rate) * 1000.0)
 end
 
-redis.call("HMSET", key, "tokens", tokens, "ts", ts)
-redis.call("EXPIRE", key, ttl)
+local result = {allowed, rejected, retry_after_ms}
+for i = 1, n do
+  if allowed == 1 then
+    tokens[i] = tokens[i] - costs[i]
+  end
+  redis.call("HSET", KEYS[i], "tokens", tokens[i], "ts", now_ms)
+  redis.call("EXPIRE", KEYS[i], ttl)
+  result[3 + i] = tokens[i]
+end
 
-return {allowed, tokens, retry_after_ms}
\ No newline at end of file
+return result
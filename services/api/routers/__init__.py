@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+
+from . import (
+    alerts, auth, checkout, commands, community, health, heatmap,
+    laces, metrics, monitors, notifications, predictions, realtime,
+)
+
+router = APIRouter()
+
+router.include_router(health.router, tags=["health"])
+router.include_router(auth.router, tags=["auth"])
+router.include_router(commands.router, tags=["commands"])
+router.include_router(monitors.router, tags=["monitors"])
+router.include_router(checkout.router, tags=["checkout"])
+router.include_router(metrics.router, tags=["metrics"])
+router.include_router(realtime.router, tags=["realtime"])
+router.include_router(laces.router, tags=["laces"])
+router.include_router(heatmap.router, tags=["heatmap"])
+router.include_router(community.router, tags=["community"])
+router.include_router(predictions.router, tags=["predictions"])
+router.include_router(notifications.router, tags=["notifications"])
+router.include_router(alerts.router, tags=["alerts"])
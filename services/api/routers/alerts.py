@@ -0,0 +1,53 @@
+import json
+import logging
+from typing import Optional
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis
+from middleware import cache_policy
+from schemas import StockAlert, StockAlertResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Stock Alerts
+@router.get("/api/alerts/stock", response_model=StockAlertResponse)
+@cache_policy("public")
+async def get_stock_alerts(
+    limit: int = 50,
+    retailer: Optional[str] = None,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get recent stock alerts"""
+    try:
+        # Get alerts from sorted set
+        alerts_data = await redis_client.zrevrange(
+            "stock_alerts",
+            0,
+            limit - 1,
+            withscores=True
+        )
+        
+        alerts = []
+        for i in range(0, len(alerts_data), 2):
+            if i + 1 < len(alerts_data):
+                alert_json = alerts_data[i]
+                alert = StockAlert(**json.loads(alert_json))
+                
+                # Filter by retailer if specified
+                if not retailer or alert.retailer.value == retailer:
+                    alerts.append(alert)
+        
+        return StockAlertResponse(
+            success=True,
+            alerts=alerts,
+            total=len(alerts)
+        )
+    except Exception as e:
+        logger.error(f"Failed to get stock alerts: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get alerts")
+
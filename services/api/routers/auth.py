@@ -0,0 +1,51 @@
+import logging
+from datetime import datetime
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from deps import SESSION_SECRET, get_current_user, get_redis
+from schemas import AuthRequest, AuthResponse
+import session_tokens
+import sessions
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/api/auth/session", response_model=AuthResponse)
+async def create_session(
+    auth_request: AuthRequest,
+    redis_client: redis.Redis = Depends(get_redis)
+):
+    """Create a new session token"""
+    try:
+        token = session_tokens.issue("dev-user", SESSION_SECRET)
+        expires_at = datetime.now().timestamp() + sessions.SESSION_TTL  # 24 hours
+        
+        # Store token in Redis
+        await sessions.create(redis_client, token, {
+            "user_id": "dev-user",
+            "api_key": auth_request.api_key,
+            "device_id": auth_request.device_id
+        })
+        
+        return AuthResponse(
+            success=True,
+            token=token,
+            expires_at=datetime.fromtimestamp(expires_at),
+            user_id="dev-user"
+        )
+    except Exception as e:
+        logger.error(f"Session creation failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to create session")
+
+
+@router.delete("/api/auth/session")
+async def revoke_session(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """Revoke the current session token on every worker"""
+    await request.app.state.sessions.revoke(current_user["token"])
+    return {"success": True}
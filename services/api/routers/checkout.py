@@ -0,0 +1,99 @@
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis
+from schemas import CheckoutBatchRequest, CheckoutBatchResponse, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/api/checkout/tasks/batch", response_model=CheckoutBatchResponse)
+async def create_checkout_tasks(
+    request: CheckoutBatchRequest,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create multiple checkout tasks"""
+    try:
+        batch_id = str(uuid.uuid4())
+        task_ids = []
+        
+        # Calculate cost estimate
+        proxy_cost_per_task = 0.05  # $0.05 per checkout attempt
+        captcha_cost_per_task = 0.003  # $3 per 1000 solves
+        total_cost_estimate = request.count * (proxy_cost_per_task + captcha_cost_per_task)
+        
+        # Create staggered tasks
+        for i in range(request.count):
+            task_id = str(uuid.uuid4())
+            
+            # Rotate through profiles and payments
+            profile_id = request.profile_ids[i % len(request.profile_ids)]
+            payment_id = request.payment_ids[i % len(request.payment_ids)]
+            
+            task_data = {
+                "task_id": task_id,
+                "batch_id": batch_id,
+                "monitor_id": request.monitor_id,
+                "profile_id": profile_id,
+                "payment_id": payment_id,
+                "mode": request.mode.value,
+                "proxy_group": request.proxy_group,
+                "status": TaskStatus.QUEUED.value,
+                "created_at": datetime.now().isoformat(),
+                "user_id": current_user["user_id"],
+                "delay_ms": i * request.stagger_ms  # Stagger start times
+            }
+            
+            # Queue task in Redis with priority
+            await redis_client.zadd(
+                "checkout_queue",
+                {json.dumps(task_data): time.time() + (i * request.stagger_ms / 1000)}
+            )
+            
+            # Store task data
+            await redis_client.hset(
+                f"task:{task_id}",
+                mapping=task_data
+            )
+            
+            task_ids.append(task_id)
+        
+        # Store batch info
+        await redis_client.hset(
+            f"batch:{batch_id}",
+            mapping={
+                "batch_id": batch_id,
+                "task_count": request.count,
+                "created_at": datetime.now().isoformat(),
+                "user_id": current_user["user_id"]
+            }
+        )
+        
+        # Track metrics
+        await redis_client.incrby("metrics:tasks_created", request.count)
+        
+        # Trigger worker processing
+        await redis_client.publish(
+            "task_commands",
+            json.dumps({"action": "process_batch", "batch_id": batch_id})
+        )
+        
+        return CheckoutBatchResponse(
+            success=True,
+            batch_id=batch_id,
+            task_ids=task_ids,
+            total_cost_estimate=round(total_cost_estimate, 2)
+        )
+        
+    except Exception as e:
+        logger.error(f"Failed to create checkout tasks: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to create tasks: {str(e)}")
+
@@ -0,0 +1,130 @@
+"""
+Command parsing for the dashboard command bar
+"""
+
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+
+from deps import get_current_user
+
+router = APIRouter()
+
+class CommandParseRequest(BaseModel):
+    prompt: str
+
+class CommandParseResponse(BaseModel):
+    type: str  # 'command', 'chat', or 'error'
+    command: Optional[Dict[str, Any]] = None
+    response: Optional[str] = None
+    message: Optional[str] = None
+
+# Command Parser (replaces Gemini AI)
+class CommandParser:
+    """Internal command parser to replace external AI dependency"""
+    
+    def parse(self, prompt: str) -> CommandParseResponse:
+        prompt_lower = prompt.lower()
+        
+        # Monitor commands
+        if any(word in prompt_lower for word in ["monitor", "watch", "track"]):
+            # Extract SKU from prompt
+            words = prompt.split()
+            sku = None
+            for i, word in enumerate(words):
+                if word.lower() in ["sku", "shoe", "shoes", "product"]:
+                    if i + 1 < len(words):
+                        sku = words[i + 1]
+                        break
+            
+            if not sku:
+                # Try to find any word that looks like a SKU
+                for word in words:
+                    if len(word) > 5 and any(c.isdigit() for c in word):
+                        sku = word
+                        break
+                    elif "travis" in word.lower() or "jordan" in word.lower():
+                        sku = "-".join(words[words.index(word):words.index(word)+3])
+                        break
+            
+            if sku:
+                return CommandParseResponse(
+                    type="command",
+                    command={
+                        "action": "start_monitor",
+                        "parameters": {"sku": sku, "retailer": "shopify"}
+                    }
+                )
+        
+        # Checkout commands
+        elif any(word in prompt_lower for word in ["checkout", "run", "fire", "cop"]):
+            # Extract count
+            count = 50  # default
+            for word in prompt.split():
+                if word.isdigit():
+                    count = int(word)
+                    break
+            
+            # Extract profile
+            profile = "main-profile"
+            if "profile" in prompt_lower:
+                words = prompt.split()
+                profile_idx = words.index("profile") if "profile" in words else -1
+                if profile_idx > 0:
+                    profile = words[profile_idx - 1]
+            
+            return CommandParseResponse(
+                type="command",
+                command={
+                    "action": "fire_checkout",
+                    "parameters": {
+                        "task_count": count,
+                        "profile_id": profile,
+                        "retailer": "shopify"
+                    }
+                }
+            )
+        
+        # Clear commands
+        elif any(word in prompt_lower for word in ["clear", "stop", "reset", "kill"]):
+            return CommandParseResponse(
+                type="command",
+                command={
+                    "action": "clear_dashboard",
+                    "parameters": {}
+                }
+            )
+        
+        # General chat
+        else:
+            return CommandParseResponse(
+                type="chat",
+                response=self._generate_chat_response(prompt)
+            )
+    
+    def _generate_chat_response(self, prompt: str) -> str:
+        """Generate contextual responses for general questions"""
+        prompt_lower = prompt.lower()
+        
+        if "proxy" in prompt_lower:
+            return "Proxy rotation is handled automatically. The system uses sticky residential proxies with 10-15 minute TTL from providers like Bright Data. Cost tracking ensures we stay under $0.05 per successful checkout."
+        elif "captcha" in prompt_lower:
+            return "CAPTCHA solving uses CapSolver as primary with a human farm fallback. Current solve rate is 98%+ with average solve time under 3 seconds."
+        elif "success" in prompt_lower or "rate" in prompt_lower:
+            return "Success rates vary by site. Shopify averages 65%+, Footsites around 50%, and SNKRS is more challenging at 20-30%. These improve with aged accounts and quality proxies."
+        elif "how" in prompt_lower and "work" in prompt_lower:
+            return "SneakerSniper uses a dual-mode approach: fast request-mode for speed and stealth browser mode for heavy anti-bot sites. Monitors poll every 200ms and trigger checkout tasks on stock detection."
+        else:
+            return "I can help you monitor products, run checkout tasks, or answer questions about the bot's operation. Try commands like 'monitor travis scott shoes' or 'run 100 checkouts'."
+
+command_parser = CommandParser()
+
+@router.post("/api/commands/parse", response_model=CommandParseResponse)
+async def parse_command(
+    request: CommandParseRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Parse user command into executable action"""
+    return command_parser.parse(request.prompt)
+
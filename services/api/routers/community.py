@@ -0,0 +1,52 @@
+import json
+import uuid
+from datetime import datetime
+from typing import List
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+
+from deps import get_current_user, get_redis
+from middleware import cache_policy, cache_tags
+from schemas import BaseResponse, HeatSubmit
+import heatmap
+
+from .heatmap import invalidate_heatmap
+
+router = APIRouter()
+
+class LeaderEntry(BaseModel):
+    user_id: str
+    score: int
+    rank: int
+
+@router.get("/api/community/leaderboard", response_model=List[LeaderEntry])
+@cache_policy("public")
+@cache_tags("leaderboard")
+async def leaderboard(
+    limit: int = 50,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    z = await redis_client.zrevrange("laces:leaderboard", 0, limit-1, withscores=True)
+    out = []
+    for idx, (user_id, score) in enumerate(z):
+        out.append(LeaderEntry(user_id=user_id, score=int(score), rank=idx+1))
+    return out
+
+@router.post("/api/community/heat", response_model=BaseResponse)
+async def submit_heat(
+    ev: HeatSubmit,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    event_id = str(uuid.uuid4())
+    data = ev.dict()
+    now = datetime.now()
+    data.update({"event_id": event_id, "timestamp": now.isoformat(), "user_id": current_user["user_id"]})
+    await heatmap.add_event(redis_client, event_id, ev.type.value, ev.lat, ev.lng, data, ts=now.timestamp())
+    await redis_client.publish("heatmap_updates", json.dumps({"type":"new_event","event":data}))
+    await invalidate_heatmap(redis_client, ev.lat, ev.lng)
+    return BaseResponse(success=True)
+
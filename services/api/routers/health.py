@@ -0,0 +1,22 @@
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends
+
+from deps import get_redis
+
+router = APIRouter()
+
+@router.get("/")
+async def root():
+    return {"status": "SneakerSniper API Online", "version": "1.0.0"}
+
+# Health check
+@router.get("/health")
+async def health_check(redis_client: redis.Redis = Depends(get_redis)):
+    """Health check endpoint"""
+    try:
+        # Check Redis connection
+        await redis_client.ping()
+        return {"status": "healthy", "redis": "connected"}
+    except:
+        return {"status": "unhealthy", "redis": "disconnected"}
+
@@ -0,0 +1,171 @@
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis, get_ws_hub
+from middleware import cache_policy, cache_tags, invalidate_tags
+from schemas import BaseResponse, HeatMapEvent
+from ws_hub import FanoutHub
+import geo
+import heatmap
+
+from .laces import earn_laces
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Heatmap cache tags: one geohash cell (~40x20 km) per query center, so a write
+# only has to invalidate its own cell and the eight around it.
+HEATMAP_TAG_PRECISION = 4
+
+def heatmap_query_tags(params: Dict[str, str]) -> List[str]:
+    if float(params.get("radius_km", 5)) > 15:
+        return ["heatmap"]
+    cell = geo.encode(float(params["lat"]), float(params["lng"]), HEATMAP_TAG_PRECISION)
+    return [f"heatmap:{cell}"]
+
+async def invalidate_heatmap(redis_client: redis.Redis, lat: float, lng: float):
+    cell = geo.encode(lat, lng, HEATMAP_TAG_PRECISION)
+    await invalidate_tags(
+        redis_client, "heatmap", *(f"heatmap:{c}" for c in [cell, *geo.neighbors(cell)])
+    )
+
+# HeatMap Events Endpoints
+@router.post("/api/heatmap/events", response_model=BaseResponse)
+async def create_heatmap_event(
+    event: HeatMapEvent,
+    redis_client: redis.Redis = Depends(get_redis),
+    ws_hub: FanoutHub = Depends(get_ws_hub),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a new HeatMap event (drop, restock, find)"""
+    try:
+        event.user_id = current_user["user_id"]
+        
+        # Store event and add it to the geo and time indexes
+        await heatmap.add_event(
+            redis_client,
+            event.event_id,
+            event.type.value,
+            event.lat,
+            event.lng,
+            event.dict(),
+            ts=event.timestamp.timestamp()
+        )
+        
+        # Award LACES for contribution
+        await earn_laces(
+            reason="SPOT",
+            amount=10,
+            reference_id=event.event_id,
+            idempotency_key=f"SPOT:{event.event_id}",
+            redis_client=redis_client,
+            ws_hub=ws_hub,
+            current_user=current_user
+        )
+        
+        # Broadcast to nearby users
+        await redis_client.publish(
+            "heatmap_updates",
+            json.dumps({
+                "type": "new_event",
+                "event": event.dict()
+            }, default=str)
+        )
+        await invalidate_heatmap(redis_client, event.lat, event.lng)
+        
+        return BaseResponse(success=True)
+    except Exception as e:
+        logger.error(f"Failed to create HeatMap event: {e}")
+        raise HTTPException(status_code=500, detail="Failed to create event")
+
+@router.get("/api/heatmap/events/nearby")
+@cache_policy("public")
+@cache_tags(heatmap_query_tags)
+async def get_nearby_events(
+    lat: float,
+    lng: float,
+    radius_km: int = 5,
+    event_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get HeatMap events near a location, nearest first (at most ``limit``, none older than ``since``)"""
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    try:
+        event_details = await heatmap.nearby(
+            redis_client,
+            lat, lng, radius_km,
+            event_types=[event_type] if event_type else heatmap.HEAT_TYPES,
+            limit=limit,
+            since=since.timestamp() if since else None
+        )
+        
+        return {
+            "success": True,
+            "events": event_details,
+            "total": len(event_details)
+        }
+    except Exception as e:
+        logger.error(f"Failed to get nearby events: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get events")
+
+@router.get("/api/heatmap/tiles")
+@cache_policy("public")
+@cache_tags("heatmap")
+async def get_heatmap_tiles(
+    lat_min: float,
+    lat_max: float,
+    lng_min: float,
+    lng_max: float,
+    zoom: int,
+    event_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get HeatMap event counts per geohash cell and type in a bounding box, sized for ``zoom``"""
+    if not (-90 <= lat_min <= lat_max <= 90 and -180 <= lng_min <= lng_max <= 180):
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    precision = heatmap.zoom_precision(zoom)
+    try:
+        cells = geo.cells_in_bbox(lat_min, lat_max, lng_min, lng_max, precision)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Bounding box too large for zoom level")
+    try:
+        counts = await heatmap.cell_counts(
+            redis_client,
+            cells,
+            event_types=[event_type] if event_type else heatmap.HEAT_TYPES,
+            since=since.timestamp() if since else None
+        )
+        
+        tiles = []
+        for cell, by_type in counts.items():
+            cell_lat_min, cell_lat_max, cell_lng_min, cell_lng_max = geo.bounds(cell)
+            tiles.append({
+                "geohash": cell,
+                "lat": (cell_lat_min + cell_lat_max) / 2,
+                "lng": (cell_lng_min + cell_lng_max) / 2,
+                "counts": by_type,
+                "total": sum(by_type.values())
+            })
+        
+        return {
+            "success": True,
+            "precision": precision,
+            "tiles": tiles,
+            "total": sum(tile["total"] for tile in tiles)
+        }
+    except Exception as e:
+        logger.error(f"Failed to get heatmap tiles: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get tiles")
+
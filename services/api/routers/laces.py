@@ -0,0 +1,119 @@
+import logging
+from typing import Optional
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis, get_ws_hub
+from middleware import cache_policy, cache_tags, invalidate_tags
+from schemas import LACESBalance
+from ws_hub import FanoutHub
+import laces
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+async def _after_change(
+    redis_client: redis.Redis, ws_hub: FanoutHub, user_id: str, result: laces.LedgerResult, *tags: str
+):
+    """Invalidate cached views of a committed ledger change and notify the user.
+
+    Failures are logged, not raised: the change is already applied, and an
+    error response would invite a retry that applies it again.
+    """
+    try:
+        await invalidate_tags(redis_client, *tags)
+    except Exception as e:
+        logger.warning(f"Failed to invalidate {tags} after LACES change: {e}")
+    try:
+        # To the user's sockets, on whichever worker holds them
+        await ws_hub.send_to_user(user_id, result.notification)
+    except Exception as e:
+        logger.warning(f"Failed to notify {user_id} of LACES change: {e}")
+
+# LACES Token System Endpoints
+@router.get("/api/laces/balance", response_model=LACESBalance)
+@cache_policy("user")
+@cache_tags("laces:{user}")
+async def get_laces_balance(
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get user's LACES token balance and stats"""
+    try:
+        user_id = current_user["user_id"]
+        
+        # Balance, totals and rank in one round trip
+        snap = await laces.snapshot(redis_client, user_id)
+        percentile = round((1 - (snap["rank"] / snap["total_users"])) * 100, 1)
+        
+        return LACESBalance(
+            user_id=user_id,
+            balance=snap["balance"],
+            lifetime_earned=snap["lifetime_earned"],
+            lifetime_spent=snap["lifetime_spent"],
+            rank=snap["rank"] + 1,  # Convert 0-based to 1-based
+            percentile=percentile
+        )
+    except Exception as e:
+        logger.error(f"Failed to get LACES balance: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get balance")
+
+@router.post("/api/laces/earn")
+async def earn_laces(
+    reason: str,
+    amount: int,
+    reference_id: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    redis_client: redis.Redis = Depends(get_redis),
+    ws_hub: FanoutHub = Depends(get_ws_hub),
+    current_user: dict = Depends(get_current_user)
+):
+    """Award LACES tokens to user"""
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    user_id = current_user["user_id"]
+    try:
+        # Balance, totals, leaderboard and transaction log in one atomic call
+        result = await laces.apply(
+            redis_client, user_id, amount, reason,
+            reference_id=reference_id, idempotency_key=idempotency_key
+        )
+    except Exception as e:
+        logger.error(f"Failed to award LACES: {e}")
+        raise HTTPException(status_code=500, detail="Failed to award tokens")
+    if not result.replayed:
+        await _after_change(redis_client, ws_hub, user_id, result, "leaderboard", f"laces:{user_id}")
+    
+    return {"success": True, "new_balance": result.balance}
+
+@router.post("/api/laces/spend")
+async def spend_laces(
+    reason: str,
+    amount: int,
+    reference_id: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    redis_client: redis.Redis = Depends(get_redis),
+    ws_hub: FanoutHub = Depends(get_ws_hub),
+    current_user: dict = Depends(get_current_user)
+):
+    """Debit LACES tokens from user"""
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    user_id = current_user["user_id"]
+    try:
+        result = await laces.apply(
+            redis_client, user_id, -amount, reason,
+            reference_id=reference_id, idempotency_key=idempotency_key
+        )
+    except laces.InsufficientBalance:
+        raise HTTPException(status_code=400, detail="Insufficient LACES balance")
+    except Exception as e:
+        logger.error(f"Failed to spend LACES: {e}")
+        raise HTTPException(status_code=500, detail="Failed to spend tokens")
+    if not result.replayed:
+        await _after_change(redis_client, ws_hub, user_id, result, f"laces:{user_id}")
+    
+    return {"success": True, "new_balance": result.balance}
+
@@ -0,0 +1,38 @@
+import logging
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis
+from middleware import cache_response
+from schemas import MetricsRequest, MetricsResponse
+import dashboard_metrics
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/api/metrics/dashboard", response_model=MetricsResponse)
+@cache_response(ttl=1)  # snapshots are refreshed every second
+async def get_metrics(
+    request: MetricsRequest,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get dashboard metrics with filtering"""
+    try:
+        # One GET of the per-second snapshot (one pipelined fetch if it's missing)
+        fields = await dashboard_metrics.read(
+            redis_client,
+            request.timeframe.value,
+            request.retailer.value if request.retailer else None
+        )
+        if not request.include_costs:
+            fields["total_spent"] = None
+        
+        return MetricsResponse(success=True, **fields)
+        
+    except Exception as e:
+        logger.error(f"Failed to get metrics: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve metrics")
+
@@ -0,0 +1,97 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis
+from schemas import MonitorRequest, MonitorResponse, MonitorStatus
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/api/monitors", response_model=MonitorResponse)
+async def create_monitor(
+    request: MonitorRequest,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Start a new product monitor"""
+    try:
+        monitor_id = str(uuid.uuid4())
+        
+        # Calculate estimated cost
+        requests_per_hour = 3600000 / request.interval_ms
+        proxy_cost_per_request = 0.00001  # $0.01 per 1000 requests
+        estimated_cost = requests_per_hour * proxy_cost_per_request
+        
+        # Create monitor task in Redis
+        monitor_data = {
+            "monitor_id": monitor_id,
+            "sku": request.sku,
+            "retailer": request.retailer.value,
+            "interval_ms": request.interval_ms,
+            "size_filter": json.dumps(request.size_filter) if request.size_filter else None,
+            "price_threshold": request.price_threshold,
+            "keywords": json.dumps(request.keywords) if request.keywords else None,
+            "webhook_url": request.webhook_url,
+            "status": MonitorStatus.ACTIVE.value,
+            "created_at": datetime.now().isoformat(),
+            "user_id": current_user["user_id"]
+        }
+        
+        # Remove None values
+        monitor_data = {k: v for k, v in monitor_data.items() if v is not None}
+        
+        await redis_client.hset(
+            f"monitor:{monitor_id}",
+            mapping=monitor_data
+        )
+        
+        # Add to active monitors set
+        await redis_client.sadd("active_monitors", monitor_id)
+        
+        # Publish to monitor service via Redis pub/sub
+        await redis_client.publish(
+            "monitor_commands",
+            json.dumps({"action": "start", "monitor": monitor_data})
+        )
+        
+        # Track metrics
+        await redis_client.incr("metrics:monitors_created")
+        
+        return MonitorResponse(
+            success=True,
+            monitor_id=monitor_id,
+            status=MonitorStatus.ACTIVE,
+            estimated_cost_per_hour=round(estimated_cost, 4)
+        )
+        
+    except Exception as e:
+        logger.error(f"Failed to create monitor: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to create monitor: {str(e)}")
+
+@router.delete("/api/monitors/{monitor_id}")
+async def stop_monitor(
+    monitor_id: str,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stop a running monitor"""
+    # Remove from active set
+    await redis_client.srem("active_monitors", monitor_id)
+    
+    # Update status
+    await redis_client.hset(f"monitor:{monitor_id}", "status", "stopped")
+    
+    # Publish stop command
+    await redis_client.publish(
+        "monitor_commands",
+        json.dumps({"action": "stop", "monitor_id": monitor_id})
+    )
+    
+    return {"success": True}
+
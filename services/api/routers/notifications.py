@@ -0,0 +1,34 @@
+import logging
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis
+from schemas import NotificationPreferences
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Notification Preferences
+@router.put("/api/notifications/preferences")
+async def update_notification_preferences(
+    preferences: NotificationPreferences,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Update user notification preferences"""
+    try:
+        user_id = current_user["user_id"]
+        
+        # Store preferences
+        await redis_client.hset(
+            f"notifications:preferences:{user_id}",
+            mapping=preferences.dict()
+        )
+        
+        return {"success": True, "message": "Preferences updated"}
+    except Exception as e:
+        logger.error(f"Failed to update preferences: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update preferences")
+
@@ -0,0 +1,101 @@
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from deps import get_current_user, get_redis
+from schemas import PredictionRequest, PredictionResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Prediction Endpoints (Deadstock Detective)
+@router.post("/api/predictions/analyze", response_model=PredictionResponse)
+async def analyze_sneaker(
+    request: PredictionRequest,
+    redis_client: redis.Redis = Depends(get_redis),
+    current_user: dict = Depends(get_current_user)
+):
+    """Analyze a sneaker for appreciation and restock probability"""
+    try:
+        prediction_id = str(uuid.uuid4())
+        
+        # Mock ML prediction (in production, this would call the ML service)
+        # Factors: hype level, limited edition, collaboration, retail price
+        base_appreciation = 0.3
+        
+        # Adjust based on brand
+        brand_multipliers = {
+            "Jordan": 1.5,
+            "Yeezy": 1.3,
+            "Travis Scott": 2.0,
+            "Off-White": 1.8,
+            "Dunk": 1.2
+        }
+        
+        brand_mult = 1.0
+        for brand, mult in brand_multipliers.items():
+            if brand.lower() in request.brand.lower() or brand.lower() in request.model.lower():
+                brand_mult = max(brand_mult, mult)
+        
+        appreciation_probability = min(0.95, base_appreciation * brand_mult)
+        
+        # Restock probability (inverse of appreciation)
+        restock_probability = max(0.05, 1 - appreciation_probability)
+        
+        # Predicted peak value
+        predicted_multiplier = 1 + (appreciation_probability * 2.5)  # Up to 3.5x retail
+        predicted_peak_value = request.retail_price * predicted_multiplier
+        
+        # Peak date (3-12 months based on hype)
+        days_to_peak = int(90 + (1 - appreciation_probability) * 270)
+        predicted_peak_date = datetime.now() + timedelta(days=days_to_peak)
+        
+        # Confidence based on data availability
+        confidence_score = 0.75  # Mock confidence
+        
+        # Factors
+        factors = [
+            {"factor": "Brand Recognition", "impact": "positive", "weight": 0.3},
+            {"factor": "Limited Release", "impact": "positive", "weight": 0.25},
+            {"factor": "Celebrity Endorsement", "impact": "positive", "weight": 0.2},
+            {"factor": "Retail Price Point", "impact": "neutral", "weight": 0.15},
+            {"factor": "Market Saturation", "impact": "negative", "weight": 0.1}
+        ]
+        
+        response = PredictionResponse(
+            success=True,
+            prediction_id=prediction_id,
+            sku=request.sku,
+            appreciation_probability=round(appreciation_probability, 3),
+            restock_probability=round(restock_probability, 3),
+            predicted_peak_value=round(predicted_peak_value, 2),
+            predicted_peak_date=predicted_peak_date,
+            confidence_score=round(confidence_score, 3),
+            factors=factors
+        )
+        
+        # Store prediction
+        await redis_client.hset(
+            f"prediction:{prediction_id}",
+            mapping={
+                "prediction_id": prediction_id,
+                "sku": request.sku,
+                "user_id": current_user["user_id"],
+                "result": json.dumps(response.dict()),
+                "created_at": datetime.now().isoformat()
+            }
+        )
+        
+        # Track usage for analytics
+        await redis_client.incr("metrics:predictions_made")
+        
+        return response
+    except Exception as e:
+        logger.error(f"Failed to analyze sneaker: {e}")
+        raise HTTPException(status_code=500, detail="Failed to generate prediction")
+
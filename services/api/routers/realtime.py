@@ -0,0 +1,21 @@
+import logging
+
+from fastapi import APIRouter, WebSocket, status
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: str):
+    """WebSocket endpoint for real-time updates (narrowed by sending a WSSubscribe message)"""
+    session = await websocket.app.state.sessions.get(token)
+    if session is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        # Updates come from the worker's shared subscription (ws_hub)
+        await websocket.app.state.ws_hub.serve(websocket, session["user_id"])
+    except Exception as e:
+        logger.error(f"WebSocket error: {e}")
@@ -0,0 +1,128 @@
+"""
+Session validation with an in-process cache
+
+A bearer token is accepted when its signature checks out (session_tokens,
+no I/O) and ``session:{token}`` exists in Redis. Validated sessions are kept
+in process for ``ttl`` seconds, so authenticated hot endpoints cost no extra
+round trip. Revoking a session deletes the key and publishes the token's
+hash on ``session:revoke``; every worker drops it from its cache as soon as
+the message arrives, and at worst once ``ttl`` expires (the cache is also
+cleared whenever the listener loses its connection).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import redis.asyncio as redis
+
+import session_tokens
+
+logger = logging.getLogger(__name__)
+
+REVOKE_CHANNEL = "session:revoke"
+SESSION_TTL = 86400
+
+def session_key(token: str) -> str:
+    return f"session:{token}"
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def create(redis_client: redis.Redis, token: str, data: Dict, ttl: int = SESSION_TTL):
+    await redis_client.setex(session_key(token), ttl, json.dumps(data))
+
+async def revoke(redis_client: redis.Redis, token: str) -> bool:
+    """Delete a session and tell every worker to forget it; False if it didn't exist."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(session_key(token))
+    pipe.publish(REVOKE_CHANNEL, token_hash(token))
+    deleted, _ = await pipe.execute()
+    return bool(deleted)
+
+class SessionCache:
+    """Validated sessions by token hash, each trusted for ``ttl`` seconds"""
+
+    def __init__(self, redis_client: redis.Redis, secret: bytes, *, ttl: float = 5.0, max_entries: int = 10000):
+        self.redis = redis_client
+        self.secret = secret
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    async def get(self, token: str) -> Optional[dict]:
+        """The session behind ``token``, or None if it is forged, expired or revoked."""
+        if session_tokens.user_id(token, self.secret) is None:
+            return None
+        self._ensure_listener()
+        key = token_hash(token)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+
+        # Concurrent first requests with the same token share one GET
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            raw = await self.redis.get(session_key(token))
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't log it as unretrieved
+            raise
+        finally:
+            del self._inflight[key]
+        session = json.loads(raw) if raw is not None else None
+        if session is not None:
+            self._entries[key] = (time.monotonic() + self.ttl, session)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(session)
+        return session
+
+    async def revoke(self, token: str) -> bool:
+        """Revoke a session, dropping it from this worker's cache right away."""
+        self.forget(token_hash(token))
+        return await revoke(self.redis, token)
+
+    def forget(self, token_digest: str):
+        self._entries.pop(token_digest, None)
+
+    def _ensure_listener(self):
+        if self.ttl > 0 and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_revocations())
+
+    async def _listen_revocations(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(REVOKE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        data = message["data"]
+                        self.forget(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Revocations may have been missed while disconnected
+                logger.warning(f"Session revocation listener error: {e}")
+                self._entries.clear()
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
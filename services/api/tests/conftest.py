@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The gateway imports its modules flat (``from middleware import ...``), as it
+# does when run from services/api inside its container.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,106 @@
+import warnings
+
+import fakeredis
+import fakeredis.aioredis
+import httpx
+import pytest
+
+import main
+
+
+def _app():
+    server = fakeredis.FakeServer()
+    redis_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    return main.create_app(redis_client, fakeredis.aioredis.FakeRedis(server=server)), redis_client
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def _login(client) -> dict:
+    response = await client.post("/api/auth/session", json={"api_key": "k" * 16})
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+def test_each_route_is_registered_once():
+    app, _ = _app()
+    routes = [(route.path, tuple(sorted(getattr(route, "methods", None) or ()))) for route in app.routes]
+    assert len(routes) == len(set(routes))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # FastAPI warns on duplicate operation ids
+        assert "/api/community/leaderboard" in app.openapi()["paths"]
+
+
+@pytest.mark.asyncio
+async def test_cache_middleware_serves_repeated_gets(monkeypatch):
+    monkeypatch.setenv("CACHE_L1_MAX_BYTES", "0")
+    app, r = _app()
+    await r.zadd("laces:leaderboard", {"a": 5})
+    async with _client(app) as client:
+        auth = await _login(client)
+        first = await client.get("/api/community/leaderboard", headers=auth)
+        await r.zadd("laces:leaderboard", {"b": 9})
+        second = await client.get("/api/community/leaderboard", headers=auth)
+        await client.post("/api/laces/earn", params={"reason": "SPOT", "amount": 1}, headers=auth)
+        third = await client.get("/api/community/leaderboard", headers=auth)
+
+    assert first.json() == second.json() == [{"user_id": "a", "score": 5, "rank": 1}]
+    assert second.headers["x-content-type-options"] == "nosniff"
+    assert [entry["user_id"] for entry in third.json()] == ["b", "a", "dev-user"]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_middleware_is_active(monkeypatch):
+    monkeypatch.setenv("RATE_IP_BURST", "2")
+    monkeypatch.setenv("RATE_IP_QPS", "1")
+    app, _ = _app()
+    async with _client(app) as client:
+        statuses = [(await client.get("/")).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+@pytest.mark.asyncio
+async def test_routes_require_a_live_session():
+    app, _ = _app()
+    async with _client(app) as client:
+        assert (await client.get("/api/laces/balance", headers={"Authorization": "Bearer t"})).status_code == 401
+        auth = await _login(client)
+        for path in ("/api/laces/balance", "/api/community/leaderboard"):
+            assert (await client.get(path, headers=auth)).status_code == 200
+        assert (await client.delete("/api/auth/session", headers=auth)).status_code == 200
+        # Cached responses aren't served to the revoked token either
+        for path in ("/api/laces/balance", "/api/community/leaderboard"):
+            assert (await client.get(path, headers=auth)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_committed_credit_is_reported_even_if_follow_up_fails(monkeypatch):
+    import routers.laces
+
+    async def down(*args, **kwargs):
+        raise ConnectionError("redis went away")
+
+    app, redis_client = _app()
+    monkeypatch.setattr(routers.laces, "invalidate_tags", down)
+    monkeypatch.setattr(app.state.ws_hub, "send_to_user", down)
+    async with _client(app) as client:
+        auth = await _login(client)
+        response = await client.post("/api/laces/earn", params={"reason": "SPOT", "amount": 10}, headers=auth)
+    # A 500 here would invite a retry that credits the user twice
+    assert response.status_code == 200 and response.json()["new_balance"] == 10
+
+
+@pytest.mark.asyncio
+async def test_shutdown_stops_the_cache_invalidation_listener():
+    app, _ = _app()
+    async with app.router.lifespan_context(app):
+        tasks = app.state.background_tasks
+        before = set(tasks)
+        async with _client(app) as client:
+            auth = await _login(client)
+            assert (await client.get("/api/laces/balance", headers=auth)).status_code == 200
+        (listener,) = tasks - before
+        assert not listener.done()
+    assert listener.cancelled()
+    assert all(task.done() for task in tasks)
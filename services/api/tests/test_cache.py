@@ -0,0 +1,364 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+import fakeredis.aioredis
+
+from middleware import (
+    CachePolicy, EnhancedCacheMiddleware, LocalCache, cache_policy, cache_response, cache_tags,
+    invalidate_tags,
+)
+
+
+def _handler():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"ok":true}'})
+
+    return app, calls
+
+
+async def _get(cache, path="/api/alerts/stock", headers=None, messages=None):
+    messages = [] if messages is None else messages
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": b"",
+             "headers": headers or []}
+    await cache(scope, None, send)
+    return messages[0]["status"], messages[-1]["body"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_run_handler_once():
+    app, calls = _handler()
+    cache = EnhancedCacheMiddleware(app, fakeredis.aioredis.FakeRedis(), secret="s", default_policy=CachePolicy())
+
+    results = await asyncio.gather(*(_get(cache) for _ in range(10)))
+
+    assert calls == ["/api/alerts/stock"]
+    assert results == [(200, b'{"ok":true}')] * 10
+    assert cache._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_stale_hits_share_one_refresh():
+    app, calls = _handler()
+    cache = EnhancedCacheMiddleware(app, fakeredis.aioredis.FakeRedis(), secret="s", default_policy=CachePolicy(), default_ttl=0)
+
+    await _get(cache)
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(_get(cache) for _ in range(5)))
+    await asyncio.gather(*cache._refresh_tasks)
+
+    assert len(calls) == 2
+    assert cache._refreshing == set()
+
+
+def test_local_cache_evicts_least_recently_used_by_size():
+    l1 = LocalCache(max_bytes=10, ttl=60)
+    l1.set("a", "A", 4)
+    l1.set("b", "B", 4)
+    l1.get("a")
+    l1.set("c", "C", 4)
+
+    assert l1.get("a") == "A"
+    assert l1.get("b") is None
+    assert l1.size == 8
+
+
+@pytest.mark.asyncio
+async def test_hits_are_served_from_l1_until_invalidated():
+    app, calls = _handler()
+    r = fakeredis.aioredis.FakeRedis()
+    cache = EnhancedCacheMiddleware(app, r, secret="s", default_policy=CachePolicy())
+
+    await _get(cache)
+    await r.flushall()  # a Redis round trip would now miss
+    assert await _get(cache) == (200, b'{"ok":true}')
+    assert len(calls) == 1
+
+    key = cache._key("/api/alerts/stock", None, "", b"")
+    await cache.invalidate(key)
+    await _get(cache)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_large_bodies_are_stored_compressed_in_one_value():
+    app, calls = _handler()
+    r = fakeredis.aioredis.FakeRedis()
+    cache = EnhancedCacheMiddleware(app, r, secret="s", default_policy=CachePolicy(), compress_min_bytes=1, l1_max_bytes=0)
+
+    await _get(cache)
+    assert await r.keys() == [cache._key("/api/alerts/stock", None, "", b"").encode()]
+
+    plain = await _get(cache)
+    messages = []
+    encoded = await _get(cache, headers=[(b"accept-encoding", b"gzip, br")], messages=messages)
+
+    assert plain == (200, b'{"ok":true}')
+    assert gzip.decompress(encoded[1]) == b'{"ok":true}'
+    assert (b"content-encoding", b"gzip") in messages[0]["headers"]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_conditional_requests_get_304_without_running_handler():
+    app, calls = _handler()
+    cache = EnhancedCacheMiddleware(app, fakeredis.aioredis.FakeRedis(), secret="s", default_policy=CachePolicy())
+
+    messages = []
+    await _get(cache, messages=messages)
+    etag = dict(messages[0]["headers"])[b"etag"]
+
+    messages = []
+    status, body = await _get(cache, headers=[(b"if-none-match", etag)], messages=messages)
+
+    assert (status, body) == (304, b"")
+    assert dict(messages[0]["headers"])[b"etag"] == etag
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_revalidated_non_200_hits_are_sent_decoded():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 203,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"ok":true}'})
+
+    cache = EnhancedCacheMiddleware(app, fakeredis.aioredis.FakeRedis(), secret="s",
+                                    default_policy=CachePolicy(), compress_min_bytes=1, l1_max_bytes=0)
+    messages = []
+    await _get(cache, messages=messages)
+    etag = dict(messages[0]["headers"])[b"etag"]
+
+    messages = []
+    status, body = await _get(cache, headers=[(b"if-none-match", etag)], messages=messages)
+
+    # Only 200s become 304s, so the stored gzip body is decoded for this client
+    assert (status, body) == (203, b'{"ok":true}')
+    assert b"content-encoding" not in dict(messages[0]["headers"])
+
+
+@pytest.mark.asyncio
+async def test_invalidate_tags_drops_tagged_responses():
+    calls = []
+
+    @cache_tags("leaderboard", "region:{region}")
+    async def endpoint():
+        pass
+
+    async def app(scope, receive, send):
+        scope["endpoint"] = endpoint  # as the router does after matching
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"[]"})
+
+    r = fakeredis.aioredis.FakeRedis()
+    cache = EnhancedCacheMiddleware(app, r, secret="s", default_policy=CachePolicy(), l1_max_bytes=0)
+    scope = {"type": "http", "method": "GET", "path": "/lb", "query_string": b"region=eu",
+             "headers": []}
+
+    async def send(message):
+        pass
+
+    await cache(dict(scope), None, send)
+    await cache(dict(scope), None, send)
+    assert len(calls) == 1
+    assert await r.smembers("cache:tag:region:eu")
+
+    assert await invalidate_tags(r, "region:eu") == 1
+    await cache(dict(scope), None, send)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_per_user_routes_are_keyed_by_signed_token_user():
+    import session_tokens
+    from fastapi import FastAPI, Request
+
+    api = FastAPI()
+    calls = []
+
+    @api.get("/balance")
+    @cache_policy("user")
+    async def balance(request: Request):
+        calls.append(request.headers["authorization"])
+        return {"n": len(calls)}
+
+    @api.get("/uncached")
+    async def uncached():
+        calls.append("uncached")
+        return {}
+
+    cache = EnhancedCacheMiddleware(api.router, fakeredis.aioredis.FakeRedis(), secret="s",
+                                    session_secret="k")
+    secret = b"k"
+    alice, alice2, bob = (session_tokens.issue(u, secret) for u in ("alice", "alice", "bob"))
+
+    async def get(path, token=None):
+        headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": path, "query_string": b"",
+                 "headers": headers, "app": api}
+        await cache(scope, _noop_receive, send)
+        return messages[-1]["body"]
+
+    async def _noop_receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    assert await get("/balance", alice) == b'{"n":1}'
+    assert await get("/balance", alice2) == b'{"n":1}'  # same user, another session
+    assert await get("/balance", bob) == b'{"n":2}'
+    await get("/balance", "forged.token.sig")
+    await get("/uncached")
+    await get("/uncached")
+    assert len(calls) == 5
+
+
+def _dashboard_app(r, calls):
+    from fastapi import FastAPI
+    from pydantic import BaseModel
+
+    class Query(BaseModel):
+        timeframe: str = "day"
+        include_costs: bool = True
+
+    app = FastAPI()
+
+    @app.post("/dashboard")
+    @cache_response(ttl=60)
+    @cache_tags("dashboard")
+    async def dashboard(query: Query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return {"timeframe": query.timeframe, "calls": len(calls)}
+
+    app.add_middleware(EnhancedCacheMiddleware, redis=r, secret="s", l1_max_bytes=0)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_cache_response_keys_on_validated_model():
+    r = fakeredis.aioredis.FakeRedis()
+    calls = []
+    transport = httpx.ASGITransport(app=_dashboard_app(r, calls))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        bodies = [{"timeframe": "day"}, {"include_costs": True, "timeframe": "day"}, {}]
+        responses = await asyncio.gather(*(client.post("/dashboard", json=b) for b in bodies))
+        assert len(calls) == 1
+        assert {resp.json()["calls"] for resp in responses} == {1}
+
+        etag = responses[0].headers["etag"]
+        not_modified = await client.post("/dashboard", json={}, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+
+        await client.post("/dashboard", json={"timeframe": "week"})
+        assert len(calls) == 2
+
+        await invalidate_tags(r, "dashboard")
+        assert (await client.post("/dashboard", json={})).json()["calls"] == 3
+
+
+@pytest.mark.asyncio
+async def test_cache_response_without_middleware_just_runs():
+    from fastapi import FastAPI
+
+    app = FastAPI()
+    calls = []
+
+    @app.post("/echo")
+    @cache_response(ttl=60)
+    async def echo(n: int):
+        calls.append(n)
+        return {"n": n}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for _ in range(2):
+            assert (await client.post("/echo?n=3")).json() == {"n": 3}
+    assert calls == [3, 3]
+
+
+@pytest.mark.asyncio
+async def test_error_responses_are_not_cached():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        status = 500 if len(calls) == 1 else 200
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"n":%d}' % len(calls)})
+
+    r = fakeredis.aioredis.FakeRedis()
+    cache = EnhancedCacheMiddleware(app, r, secret="s", default_policy=CachePolicy(), l1_max_bytes=0)
+    statuses = [(await _get(cache))[0] for _ in range(3)]
+
+    assert statuses == [500, 200, 200]
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_response_does_not_store_errors():
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import JSONResponse
+
+    r = fakeredis.aioredis.FakeRedis()
+    app = FastAPI()
+    calls = []
+
+    @app.get("/flaky")
+    @cache_response(ttl=60)
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise HTTPException(status_code=500, detail="boom")
+        if len(calls) == 2:
+            return JSONResponse({"busy": True}, status_code=503)
+        return {"ok": True}
+
+    app.add_middleware(EnhancedCacheMiddleware, redis=r, secret="s", l1_max_bytes=0)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        statuses = [(await client.get("/flaky")).status_code for _ in range(4)]
+    assert statuses == [500, 503, 200, 200]
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_cache_response_renders_through_the_response_model():
+    from fastapi import FastAPI
+    from pydantic import BaseModel, Field
+
+    class Profile(BaseModel):
+        display_name: str = Field(alias="displayName")
+        bio: str = ""
+
+    app = FastAPI()
+    calls = []
+
+    @app.get("/profile", response_model=Profile, response_model_exclude_unset=True)
+    @cache_response(ttl=60)
+    async def profile():
+        calls.append(1)
+        return {"displayName": "kicks", "password_hash": "secret"}
+
+    app.add_middleware(EnhancedCacheMiddleware, redis=fakeredis.aioredis.FakeRedis(), secret="s")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        bodies = [(await client.get("/profile")).json() for _ in range(2)]
+    # Same shape on the miss and the hit, with internal fields filtered out
+    assert bodies == [{"displayName": "kicks"}] * 2
+    assert len(calls) == 1
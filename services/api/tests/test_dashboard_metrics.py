@@ -0,0 +1,94 @@
+import json
+import time
+
+import pytest
+import fakeredis.aioredis
+
+import dashboard_metrics
+import metrics_rollup
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis that counts round trips (single commands and pipeline flushes)"""
+
+    round_trips = 0
+
+    async def execute_command(self, *args, **kwargs):
+        self.round_trips += 1
+        return await super().execute_command(*args, **kwargs)
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super().pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def counted(*a, **kw):
+            self.round_trips += 1
+            return await execute(*a, **kw)
+
+        pipe.execute = counted
+        return pipe
+
+
+async def _seed(r):
+    now = time.time()
+    await r.sadd("active_monitors", "m1", "m2")
+    await r.sadd("proxies:active", "p1", "p2", "p3")
+    await r.sadd("proxies:burned", "p4")
+    await r.zadd("checkout_queue", {"t1": now - 10, "t2": now - 7200})
+    await r.zadd("metrics:top_products:1h", {json.dumps({"sku": "DZ5485"}): 4})
+    await r.set("metrics:proxy_cost_today", "3")
+    pipe = r.pipeline()
+    for success in (True, True, True, False):
+        metrics_rollup.record(pipe, {
+            "completed_tasks": 1, "total_checkouts": 1, "successful_checkouts": int(success),
+            "checkout_ms_sum": 3000, "checkout_ms_count": 1,
+        }, ts=now - 30)
+    metrics_rollup.record(pipe, {"nike:total": 4, "nike:success": 1, "completed_tasks": 5}, ts=now - 30)
+    metrics_rollup.record(pipe, {"proxy_costs": 1.25, "captcha_costs": 0.5}, ts=now - 30)
+    # Two hours ago: in the day window, not the hour window
+    metrics_rollup.record(pipe, {"total_checkouts": 2, "completed_tasks": 1}, ts=now - 7200)
+    await pipe.execute()
+
+
+@pytest.mark.asyncio
+async def test_collect_reads_everything_in_one_round_trip():
+    r = CountingRedis()
+    await _seed(r)
+    r.round_trips = 0
+
+    fields = await dashboard_metrics.collect(r, ["1h", "24h"], [None, "nike"])
+
+    assert r.round_trips == 1
+    hour = fields[("1h", None)]
+    assert hour["active_monitors"] == 2
+    assert hour["running_tasks"] == 1
+    assert hour["completed_tasks"] == 9
+    assert hour["success_rate"] == 75.0
+    assert hour["avg_checkout_time_ms"] == 3000
+    assert hour["total_spent"] == 1.75
+    assert hour["proxy_health"] == {"active": 3, "burned": 1, "health_score": 75.0, "cost_today": "$3.00"}
+    assert hour["top_products"] == [{"sku": "DZ5485", "checkout_count": 4}]
+    assert fields[("1h", "nike")]["success_rate"] == 25.0
+    day = fields[("24h", None)]
+    assert day["running_tasks"] == 2
+    assert day["completed_tasks"] == 10
+    assert day["success_rate"] == 50.0
+
+    # Nothing recorded any spend: unknown, not zero
+    empty = await dashboard_metrics.collect(fakeredis.aioredis.FakeRedis(), ["1h"])
+    assert empty[("1h", None)]["total_spent"] is None
+
+
+@pytest.mark.asyncio
+async def test_read_serves_snapshot_with_single_get():
+    r = CountingRedis()
+    await _seed(r)
+    live = await dashboard_metrics.read(r, "1h")
+
+    assert await dashboard_metrics.refresh_snapshots(r, ["nike"])
+    assert not await dashboard_metrics.refresh_snapshots(r, ["nike"])  # another worker's turn
+
+    r.round_trips = 0
+    assert await dashboard_metrics.read(r, "1h") == live
+    assert (await dashboard_metrics.read(r, "1h", "nike"))["success_rate"] == 25.0
+    assert r.round_trips == 2
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+import fakeredis.aioredis
+
+import geo
+import heatmap
+
+SOHO = (40.7233, -74.0030)
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis that counts pipeline flushes"""
+
+    flushes = 0
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super().pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def counted(*a, **kw):
+            self.flushes += 1
+            return await execute(*a, **kw)
+
+        pipe.execute = counted
+        return pipe
+
+
+async def _add(r, event_id, event_type, lat, lng, ts=None):
+    data = {"event_id": event_id, "type": event_type, "description": None, "images": ["a.jpg"]}
+    await heatmap.add_event(r, event_id, event_type, lat, lng, data, ts=ts)
+
+
+@pytest.mark.asyncio
+async def test_nearby_merges_types_nearest_first_in_two_round_trips():
+    r = CountingRedis(decode_responses=True)
+    lat, lng = SOHO
+    for i in range(30):
+        await _add(r, f"e{i}", heatmap.HEAT_TYPES[i % 3], lat + i * 0.001, lng)
+
+    r.flushes = 0
+    events = await heatmap.nearby(r, lat, lng, 10, limit=5)
+
+    assert r.flushes == 2
+    assert [e["event_id"] for e in events] == ["e0", "e1", "e2", "e3", "e4"]
+    assert events[0]["distance_km"] == 0.0
+    assert [e["distance_km"] for e in events] == sorted(e["distance_km"] for e in events)
+    assert len(await heatmap.nearby(r, lat, lng, 10)) == 30
+
+
+@pytest.mark.asyncio
+async def test_nearby_filters_by_type_and_skips_missing_details():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    lat, lng = SOHO
+    await _add(r, "d1", "drop", lat, lng)
+    await _add(r, "r1", "restock", lat, lng)
+    await r.geoadd(heatmap.geo_key("drop", time.time()), (lng, lat, "gone"))
+
+    events = await heatmap.nearby(r, lat, lng, 1, event_types=["drop"])
+    assert [e["event_id"] for e in events] == ["d1"]
+    assert await heatmap.nearby(r, 0.0, 0.0, 1) == []
+
+
+@pytest.mark.asyncio
+async def test_since_touches_only_recent_slices_and_old_slices_expire():
+    r = CountingRedis(decode_responses=True)
+    lat, lng = SOHO
+    now = time.time()
+    await _add(r, "old", "drop", lat, lng, ts=now - 5 * 3600)
+    await _add(r, "recent", "drop", lat, lng, ts=now - 1800)
+    await _add(r, "expired", "drop", lat, lng, ts=now - 30 * 3600)
+
+    assert {e["event_id"] for e in await heatmap.nearby(r, lat, lng, 1)} == {"old", "recent"}
+    events = await heatmap.nearby(r, lat, lng, 1, since=now - 3600, limit=10)
+    assert [e["event_id"] for e in events] == ["recent"]
+    assert events[0]["images"] == '["a.jpg"]' and "description" not in events[0]
+
+    assert not await r.exists(heatmap.event_key("expired"))
+    assert 0 < await r.ttl(heatmap.geo_key("drop", now - 1800)) <= heatmap.RETENTION_SECONDS + heatmap.SLICE_SECONDS
+    assert await r.zscore(heatmap.TIMELINE_KEY, "expired") is None
+
+
+@pytest.mark.asyncio
+async def test_cell_counts_aggregate_per_type_within_retention():
+    r = CountingRedis(decode_responses=True)
+    lat, lng = SOHO
+    now = time.time()
+    await _add(r, "d1", "drop", lat, lng, ts=now)
+    await _add(r, "d2", "drop", lat + 0.0001, lng, ts=now - 2 * 3600)
+    await _add(r, "r1", "restock", lat, lng, ts=now)
+    await _add(r, "far", "drop", 34.05, -118.24, ts=now)
+    await _add(r, "expired", "drop", lat, lng, ts=now - 30 * 3600)
+
+    precision = heatmap.zoom_precision(13)
+    cells = geo.cells_in_bbox(40.70, 40.75, -74.02, -73.98, precision)
+    soho = geo.encode(lat, lng, precision)
+    assert soho in cells
+
+    r.flushes = 0
+    counts = await heatmap.cell_counts(r, cells, now=now)
+    assert r.flushes == 1
+    assert counts == {soho: {"drop": 2, "restock": 1}}
+
+    assert await heatmap.cell_counts(r, cells, since=now - 1800, now=now) == {soho: {"drop": 1, "restock": 1}}
+    assert await heatmap.cell_counts(r, cells, event_types=["find"], now=now) == {}
+    assert 0 < await r.ttl(heatmap.cells_key(precision, now)) <= heatmap.RETENTION_SECONDS + heatmap.SLICE_SECONDS
+
+
+def test_cells_in_bbox_covers_box_and_caps_size():
+    cells = geo.cells_in_bbox(40.70, 40.80, -74.02, -73.93, 5)
+    assert len(set(cells)) == len(cells)
+    for lat in (40.70, 40.75, 40.80):
+        for lng in (-74.02, -73.97, -73.93):
+            assert geo.encode(lat, lng, 5) in cells
+    with pytest.raises(ValueError):
+        geo.cells_in_bbox(-90, 90, -180, 180, 5)
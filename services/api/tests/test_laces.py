@@ -0,0 +1,56 @@
+import json
+
+import pytest
+import fakeredis.aioredis
+
+import laces
+
+
+@pytest.mark.asyncio
+async def test_credit_and_debit_update_everything_atomically():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    credit = await laces.apply(r, "u1", 30, "SPOT", reference_id="e1")
+    assert credit.balance == 30
+    assert (await laces.apply(r, "u1", -12, "BOOST")).balance == 18
+
+    snap = await laces.snapshot(r, "u1")
+    assert snap == {"balance": 18, "lifetime_earned": 30, "lifetime_spent": 12, "rank": 0, "total_users": 1}
+    assert await r.zscore(laces.LEADERBOARD_KEY, "u1") == 30
+    newest = json.loads((await r.lrange("laces:transactions:u1", 0, 0))[0])
+    assert newest["amount"] == -12 and newest["balance"] == 18
+
+    notification = json.loads(credit.notification)
+    assert notification["type"] == "laces_earned" and notification["new_balance"] == 30
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_applies_once():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    first = await laces.apply(r, "u1", 10, "SPOT", idempotency_key="SPOT:e1")
+    retry = await laces.apply(r, "u1", 10, "SPOT", idempotency_key="SPOT:e1")
+    assert (first.balance, first.replayed) == (10, False)
+    assert (retry.balance, retry.replayed, retry.notification) == (10, True, None)
+    assert await r.llen("laces:transactions:u1") == 1
+    assert (await laces.apply(r, "u2", 10, "SPOT", idempotency_key="SPOT:e1")).balance == 10
+
+
+@pytest.mark.asyncio
+async def test_overdraft_rejected_and_log_capped():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    await laces.apply(r, "u1", 5, "SPOT")
+    with pytest.raises(laces.InsufficientBalance):
+        await laces.apply(r, "u1", -6, "BOOST")
+    assert (await laces.snapshot(r, "u1"))["balance"] == 5
+
+    for _ in range(5):
+        await laces.apply(r, "u1", 1, "SPOT", max_transactions=3)
+    assert await r.llen("laces:transactions:u1") == 3
+
+
+@pytest.mark.asyncio
+async def test_ledger_stream_is_capped_without_a_writer():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    for _ in range(50):
+        await laces.apply(r, "u1", 1, "SPOT", ledger_maxlen=10)
+    # Approximate trimming may keep a few more than asked for
+    assert 10 <= await r.xlen(laces.LEDGER_STREAM) < 50
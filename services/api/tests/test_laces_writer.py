@@ -0,0 +1,76 @@
+import json
+import uuid
+
+import pytest
+import fakeredis.aioredis
+
+import laces
+import laces_writer
+
+
+class RecordingPool:
+    """Stands in for the asyncpg pool: records each batch INSERT"""
+
+    def __init__(self, fail=False, users=()):
+        self.fail = fail
+        self.users = {uuid.UUID(user) for user in users}
+        self.batches = []
+
+    async def fetch(self, sql, user_ids):
+        if self.fail:
+            raise ConnectionError("postgres unavailable")
+        return [{"id": user_id} for user_id in user_ids if user_id in self.users]
+
+    async def execute(self, sql, *columns):
+        if self.fail:
+            raise ConnectionError("postgres unavailable")
+        self.batches.append(columns)
+
+
+@pytest.mark.asyncio
+async def test_batches_rows_and_acks_after_insert():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    user, stranger = str(uuid.uuid4()), str(uuid.uuid4())
+    event_id = str(uuid.uuid4())
+    await laces.apply(r, user, 10, "SPOT", reference_id=event_id)
+    await laces.apply(r, user, -4, "BOOST_SENT")
+    await laces.apply(r, stranger, 10, "SPOT")  # not in users yet
+    await laces.apply(r, "dev-user", 10, "SPOT")  # not a backend user id
+
+    pool = RecordingPool(users=[user])
+    writer = laces_writer.LedgerWriter(r, pool, block_ms=10)
+    assert await writer.drain_once() == 4
+
+    [(ids, users, deltas, reasons, refs, created)] = pool.batches
+    assert users == [uuid.UUID(user)] * 2
+    assert deltas == [10, -4]
+    assert reasons == ["SPOT", "BOOST_SENT"]
+    assert refs == [uuid.UUID(event_id), None]
+    assert all(ts.tzinfo is not None for ts in created)
+    assert await r.xlen(laces.LEDGER_STREAM) == 0
+    assert await writer.drain_once() == 0
+
+    # Nothing is dropped: unstorable entries wait in the dead-letter stream
+    dead = await r.xrange(laces_writer.DEAD_LETTER_STREAM)
+    assert sorted((json.loads(fields["entry"])["user_id"], fields["error"]) for _, fields in dead) == sorted([
+        (stranger, "unknown user"), ("dev-user", "malformed entry"),
+    ])
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_redelivered_with_same_ids():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    user = str(uuid.uuid4())
+    await laces.apply(r, user, 10, "SPOT")
+
+    crashed = laces_writer.LedgerWriter(r, RecordingPool(fail=True), consumer="a", block_ms=10)
+    with pytest.raises(ConnectionError):
+        await crashed.drain_once()
+    assert (await r.xpending(laces.LEDGER_STREAM, laces_writer.GROUP))["pending"] == 1
+
+    pool = RecordingPool(users=[user])
+    survivor = laces_writer.LedgerWriter(r, pool, consumer="b", block_ms=10, claim_idle_ms=0)
+    assert await survivor.drain_once() == 1
+    entry = json.loads((await r.lrange(f"laces:transactions:{user}", 0, 0))[0])
+    assert pool.batches[0][0] == [uuid.UUID(entry["id"])]
+    assert (await r.xpending(laces.LEDGER_STREAM, laces_writer.GROUP))["pending"] == 0
@@ -0,0 +1,38 @@
+import pytest
+import fakeredis.aioredis
+
+import metrics_rollup
+
+NOW = 1_700_000_000.0
+
+
+@pytest.mark.asyncio
+async def test_windows_sum_only_their_buckets():
+    r = fakeredis.aioredis.FakeRedis()
+    pipe = r.pipeline()
+    for age in (0, 59 * 60, 61 * 60, 23 * 3600, 25 * 3600, 6 * 86400, 8 * 86400):
+        metrics_rollup.record(pipe, {"total_checkouts": 1}, ts=NOW - age)
+    await pipe.execute()
+
+    async def total(timeframe):
+        return (await metrics_rollup.totals(r, timeframe, ["total_checkouts"], now=NOW))["total_checkouts"]
+
+    assert await total("1h") == 2
+    assert await total("24h") == 4
+    assert await total("7d") == 6
+    assert await total("30d") == 7
+
+
+@pytest.mark.asyncio
+async def test_buckets_expire_and_floats_accumulate():
+    r = fakeredis.aioredis.FakeRedis()
+    pipe = r.pipeline()
+    metrics_rollup.record(pipe, {"proxy_costs": 0.25, "completed_tasks": 1}, ts=NOW)
+    metrics_rollup.record(pipe, {"proxy_costs": 0.5}, ts=NOW)
+    await pipe.execute()
+
+    totals = await metrics_rollup.totals(r, "1h", ["proxy_costs", "completed_tasks", "missing"], now=NOW)
+    assert totals == {"proxy_costs": 0.75, "completed_tasks": 1.0, "missing": 0.0}
+    for resolution, (_, ttl) in metrics_rollup.RESOLUTIONS.items():
+        assert 0 < await r.ttl(metrics_rollup.bucket_key(resolution, NOW)) <= ttl
+    assert len(metrics_rollup.window_keys("7d", NOW)) == 168
@@ -0,0 +1,69 @@
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from middleware import (
+    EnhancedErrorHandlingMiddleware, EnhancedRequestLoggingMiddleware, EnhancedSecurityMiddleware,
+    ErrorHandlingMiddleware, RequestLoggingMiddleware, SecurityMiddleware, request_id_context,
+)
+
+VOLATILE = {"x-request-id", "x-response-time", "content-length"}
+
+
+def _app(security, errors, logging):
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok(request: Request):
+        return {"request_id": request.state.request_id, "context": request_id_context.get()}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    app.add_middleware(security)
+    app.add_middleware(errors)
+    app.add_middleware(logging)
+    return app
+
+
+async def _fetch(app, path):
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(path)
+
+
+@pytest.fixture
+def apps():
+    return (
+        _app(SecurityMiddleware, ErrorHandlingMiddleware, RequestLoggingMiddleware),
+        _app(EnhancedSecurityMiddleware, EnhancedErrorHandlingMiddleware, EnhancedRequestLoggingMiddleware),
+    )
+
+
+@pytest.mark.asyncio
+async def test_headers_match_base_http_stack(apps):
+    old, new = [await _fetch(app, "/ok") for app in apps]
+    assert new.status_code == old.status_code == 200
+    strip = lambda r: sorted((k, v) for k, v in r.headers.items() if k not in VOLATILE)
+    assert strip(new) == strip(old)
+    assert new.headers["x-content-type-options"] == "nosniff"
+    assert float(new.headers["x-response-time"]) >= 0
+
+
+@pytest.mark.asyncio
+async def test_request_id_shared_with_handler(apps):
+    response = await _fetch(apps[1], "/ok")
+    body = response.json()
+    assert body["request_id"] == body["context"] == response.headers["x-request-id"]
+
+
+@pytest.mark.asyncio
+async def test_unhandled_error_envelope_matches(apps):
+    old, new = [await _fetch(app, "/boom") for app in apps]
+    assert new.status_code == old.status_code == 500
+    assert new.json()["error"] == old.json()["error"] == {
+        "code": "INTERNAL_ERROR", "message": "An unexpected error occurred",
+    }
+    assert new.json()["request_id"] == new.headers["x-request-id"]
+    assert sorted(new.headers) == sorted(old.headers)
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+import fakeredis.aioredis
+
+from middleware import EnhancedRateLimitMiddleware, TokenLeases
+
+
+async def _app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _limiter(r, **kwargs):
+    return EnhancedRateLimitMiddleware(_app, r, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_all_levels_checked_in_one_call():
+    r = fakeredis.aioredis.FakeRedis()
+    limiter = _limiter(r, capacity_global=10, capacity_route=5, capacity_user=3, capacity_ip=2)
+    keys = limiter._keys(None, "/x", None, "1.2.3.4")
+
+    allowed, rejected, retry_ms, tokens = await limiter._check_buckets(keys, limiter.LEVELS)
+
+    assert allowed == 1
+    assert rejected is None
+    assert tokens == {"global": 9, "route": 4, "user": 2, "ip": 1}
+
+
+@pytest.mark.asyncio
+async def test_rejection_rolls_back_higher_levels():
+    r = fakeredis.aioredis.FakeRedis()
+    limiter = _limiter(r, capacity_global=10, rate_global=1, capacity_route=10, rate_route=1,
+                       capacity_user=10, rate_user=1, capacity_ip=1, rate_ip=1)
+    keys = limiter._keys(None, "/x", None, "1.2.3.4")
+
+    await limiter._check_buckets(keys, limiter.LEVELS)
+    allowed, rejected, retry_ms, tokens = await limiter._check_buckets(keys, limiter.LEVELS)
+
+    assert allowed == 0
+    assert rejected == "ip"
+    assert retry_ms > 0
+    # Only the first, admitted request was debited from the upper levels.
+    assert tokens["global"] == pytest.approx(9, abs=0.1)
+    assert tokens["route"] == pytest.approx(9, abs=0.1)
+    assert tokens["user"] == pytest.approx(9, abs=0.1)
+
+
+def test_leases_debit_all_keys_or_none():
+    leases = TokenLeases(lease_size=4)
+    leases.grant("a", 4)
+    leases.grant("b", 1)
+
+    assert leases.take(["a", "b"], 1)
+    assert not leases.take(["a", "b"], 1)
+    assert leases.wanted(["a", "b"]) == ["b"]
+
+    leases.deny("b", retry_after=60)
+    assert leases.wanted(["a", "b"]) == []
+
+
+@pytest.mark.asyncio
+async def test_leased_requests_skip_redis():
+    r = fakeredis.aioredis.FakeRedis()
+    limiter = _limiter(r, lease_size=10)
+    keys = limiter._keys(None, "/x", None, "1.2.3.4")
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    scope = {"type": "http", "path": "/x", "client": ("1.2.3.4", 0)}
+    await limiter(scope, None, send)
+    await asyncio.gather(*limiter._refill_tasks)
+    tokens_after_lease = float(await r.hget(keys["global"], "tokens"))
+
+    for _ in range(5):
+        await limiter(scope, None, send)
+
+    assert statuses == [200] * 6
+    assert float(await r.hget(keys["global"], "tokens")) == tokens_after_lease
@@ -0,0 +1,78 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+import session_tokens
+import sessions
+
+SECRET = b"s"
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis that counts GETs"""
+
+    gets = 0
+
+    async def get(self, *args, **kwargs):
+        self.gets += 1
+        return await super().get(*args, **kwargs)
+
+
+async def _session(r, user="u1"):
+    token = session_tokens.issue(user, SECRET)
+    await sessions.create(r, token, {"user_id": user})
+    return token
+
+
+@pytest.mark.asyncio
+async def test_validated_sessions_are_served_from_process():
+    r = CountingRedis(decode_responses=True)
+    cache = sessions.SessionCache(r, SECRET, ttl=60)
+    token = await _session(r)
+
+    assert await asyncio.gather(*(cache.get(token) for _ in range(5))) == [{"user_id": "u1"}] * 5
+    assert await cache.get(token) == {"user_id": "u1"}
+    assert r.gets == 1
+
+    # Forged tokens never reach Redis; unknown ones aren't cached
+    assert await cache.get(session_tokens.issue("u1", b"other")) is None
+    assert await cache.get(session_tokens.issue("u1", SECRET)) is None
+    assert r.gets == 2
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_revocation_reaches_every_worker():
+    server = fakeredis.FakeServer()
+    r = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    workers = [
+        sessions.SessionCache(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True), SECRET, ttl=60)
+        for _ in range(2)
+    ]
+    token = await _session(r)
+    for cache in workers:
+        assert await cache.get(token) is not None
+    await asyncio.sleep(0.05)  # let the listeners subscribe
+
+    assert await sessions.revoke(r, token)
+    await asyncio.sleep(0.05)
+    assert [await cache.get(token) for cache in workers] == [None, None]
+    assert not await sessions.revoke(r, token)
+    for cache in workers:
+        await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_ttl_bounds_staleness_without_pubsub():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    cache = sessions.SessionCache(r, SECRET, ttl=0.05)
+    token = await _session(r)
+    assert await cache.get(token) is not None
+
+    await r.delete(sessions.session_key(token))  # no revocation message
+    assert await cache.get(token) is not None
+    await asyncio.sleep(0.06)
+    assert await cache.get(token) is None
+    await cache.close()
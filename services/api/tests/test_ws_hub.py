@@ -0,0 +1,395 @@
+import asyncio
+import json
+
+import fakeredis
+import fakeredis.aioredis
+import httpx
+import pytest
+from fastapi import WebSocketDisconnect
+
+import main
+import ws_hub
+import ws_presence
+
+
+class FakeSocket:
+    """Just enough of a WebSocket: queued client messages in, frames out"""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+        self.closed = None
+        self.unblocked = asyncio.Event()
+        self.unblocked.set()
+
+    async def receive_text(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        return message
+
+    async def send_text(self, frame):
+        await self.unblocked.wait()
+        self.sent.append(frame)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis that counts pub/sub connections"""
+
+    subscriptions = 0
+
+    def pubsub(self, **kwargs):
+        self.subscriptions += 1
+        return super().pubsub(**kwargs)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_one_subscription_fans_out_to_every_client():
+    r = CountingRedis(decode_responses=True)
+    hub = ws_hub.FanoutHub(r)
+    sockets = [FakeSocket() for _ in range(3)]
+    serving = [asyncio.create_task(hub.serve(ws)) for ws in sockets]
+    await _settle()
+
+    await r.publish("monitor_updates", '{"type": "monitor.update"}')
+    await r.publish("system_alerts", '{"type": "alert"}')
+    await sockets[0].incoming.put("ping")
+    await _settle()
+
+    assert r.subscriptions == 1
+    assert sockets[0].sent == ['{"type": "monitor.update"}', '{"type": "alert"}', "pong"]
+    assert sockets[1].sent == sockets[2].sent == sockets[0].sent[:2]
+
+    for ws in sockets:
+        await ws.incoming.put(None)
+    await asyncio.gather(*serving)
+    assert not hub.subscribers
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_client_drops_oldest_frames_without_stalling_others():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), queue_size=4)
+    fast, slow = FakeSocket(), FakeSocket()
+    slow.unblocked.clear()
+    serving = [asyncio.create_task(hub.serve(ws)) for ws in (fast, slow)]
+    await _settle()
+
+    hub.dispatch("task_updates", "0")
+    await _settle()  # the slow client's sender is now stuck sending "0"
+    for i in range(1, 11):
+        hub.dispatch("task_updates", str(i))
+        await asyncio.sleep(0.001)
+    assert fast.sent == [str(i) for i in range(11)]
+
+    slow.unblocked.set()
+    await _settle()
+    assert slow.sent[0] == "0"
+    assert json.loads(slow.sent[1]) == {"type": "ws.dropped", "payload": {"count": 6}}
+    assert slow.sent[2:] == ["7", "8", "9", "10"]
+
+    for ws in (fast, slow):
+        await ws.incoming.put(None)
+    await asyncio.gather(*serving)
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_stalled_client_is_disconnected():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), send_timeout=0.05)
+    stalled = FakeSocket()
+    stalled.unblocked.clear()
+    serving = asyncio.create_task(hub.serve(stalled))
+    await _settle()
+
+    hub.dispatch("task_updates", "update")
+    await asyncio.wait_for(serving, 1)
+    assert stalled.closed == 1008
+    assert not hub.subscribers
+    await hub.close()
+
+
+class StubSessions:
+    async def get(self, token):
+        return {"user_id": token.split(":")[0]} if token.endswith(":ok") else None
+
+
+def _subscribe(**fields):
+    return json.dumps({"auth_token": "u1:ok", **fields})
+
+
+@pytest.mark.asyncio
+async def test_subscriptions_route_only_matching_messages():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), sessions=StubSessions())
+    everything, by_monitor, by_sku, own = (FakeSocket() for _ in range(4))
+    serving = [
+        asyncio.create_task(hub.serve(everything, "u1")),
+        *(asyncio.create_task(hub.serve(ws, "u1")) for ws in (by_monitor, by_sku, own)),
+    ]
+    await _settle()
+    await by_monitor.incoming.put(_subscribe(channels=["monitor_updates"], monitor_ids=["m1"]))
+    await by_sku.incoming.put(_subscribe(channels=["monitor_updates", "system_alerts"], skus=["DZ5485"]))
+    await own.incoming.put(_subscribe(channels=["task_updates"], own_only=True))
+    await _settle()
+    assert [json.loads(ws.sent.pop())["type"] for ws in (by_monitor, by_sku, own)] == ["ws.subscribed"] * 3
+
+    m1 = json.dumps({"type": "monitor.update", "payload": {"monitor_id": "m1", "sku": "X"}})
+    m2 = json.dumps({"type": "monitor.update", "payload": {"monitor_id": "m2", "sku": "DZ5485"}})
+    digest = json.dumps({"type": "monitor.digest", "payload": {"monitors": [{"monitor_id": "m3"}, {"monitor_id": "m1"}]}})
+    alert = json.dumps({"type": "alert", "payload": {"data": {"sku": "DZ5485"}}})
+    mine = json.dumps({"type": "task.update", "payload": {"task_id": "t", "user_id": "u1"}})
+    theirs = json.dumps({"type": "task.update", "payload": {"task_id": "t", "user_id": "u2"}})
+    for channel, frame in [("monitor_updates", m1), ("monitor_updates", m2), ("monitor_updates", digest),
+                           ("system_alerts", alert),
+                           ("task_updates", mine), ("task_updates", theirs)]:
+        hub.dispatch(channel, frame)
+    await _settle()
+
+    assert everything.sent == [m1, m2, digest, alert, mine, theirs]
+    only_m1 = json.dumps({"type": "monitor.digest", "payload": {"monitors": [{"monitor_id": "m1"}]}})
+    assert by_monitor.sent == [m1, only_m1]
+    assert by_sku.sent == [m2, alert]
+    assert own.sent == [mine]
+
+    for ws in (everything, by_monitor, by_sku, own):
+        await ws.incoming.put(None)
+    await asyncio.gather(*serving)
+    assert not any(hub._everything.values()) and not any(hub._filtered.values())
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_invalid_subscriptions_are_rejected_and_keep_the_old_one():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), sessions=StubSessions())
+    ws = FakeSocket()
+    serving = asyncio.create_task(hub.serve(ws, "u1"))
+    await _settle()
+    for message in (
+        "not json",
+        _subscribe(channels=["secrets"]),
+        json.dumps({"channels": ["task_updates"], "auth_token": "u2:ok"}),
+    ):
+        await ws.incoming.put(message)
+    await _settle()
+    assert [json.loads(frame)["type"] for frame in ws.sent] == ["ws.error"] * 3
+
+    hub.dispatch("system_alerts", "{}")
+    await _settle()
+    assert ws.sent[-1] == "{}"
+    await ws.incoming.put(None)
+    await serving
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_send_to_user_reaches_sockets_on_other_workers():
+    server = fakeredis.FakeServer()
+    hubs = [
+        ws_hub.FanoutHub(
+            fakeredis.aioredis.FakeRedis(server=server),
+            presence=ws_presence.PresenceRegistry(fakeredis.aioredis.FakeRedis(server=server), worker),
+        )
+        for worker in ("w1", "w2")
+    ]
+    here, there, other = FakeSocket(), FakeSocket(), FakeSocket()
+    serving = [
+        asyncio.create_task(hubs[0].serve(here, "u1")),
+        asyncio.create_task(hubs[1].serve(there, "u1")),
+        asyncio.create_task(hubs[1].serve(other, "u2")),
+    ]
+    await _settle()
+    assert sorted(await hubs[0].presence.workers("u1")) == ["w1", "w2"]
+
+    assert await hubs[0].send_to_user("u1", {"type": "laces.update", "payload": {"balance": 5}}) == 2
+    assert await hubs[0].send_to_user("u3", "nobody") == 0
+    await _settle()
+    assert [json.loads(frame)["type"] for frame in here.sent + there.sent] == ["laces.update"] * 2
+    assert other.sent == []
+
+    await there.incoming.put(None)
+    await serving[1]
+    assert await hubs[0].presence.workers("u1") == ["w1"]
+    for ws in (here, other):
+        await ws.incoming.put(None)
+    await asyncio.gather(*serving)
+    for hub in hubs:
+        await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_stalled_sockets_do_not_delay_a_fast_one():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), send_timeout=0.5)
+    stalled = [FakeSocket() for _ in range(100)]
+    for ws in stalled:
+        ws.unblocked.clear()
+    fast = FakeSocket()
+    serving = [asyncio.create_task(hub.serve(ws)) for ws in stalled + [fast]]
+    await _settle()
+    for i in range(3):
+        hub.dispatch("system_alerts", json.dumps({"n": i}))
+        await asyncio.sleep(0)
+    await _settle()
+
+    # Well inside send_timeout, while every stalled socket is mid-send
+    assert [json.loads(frame)["n"] for frame in fast.sent] == [0, 1, 2]
+    assert not any(ws.sent for ws in stalled)
+
+    await asyncio.gather(*serving[:-1])  # stalled sockets are disconnected
+    assert {ws.closed for ws in stalled} == {1008}
+    await fast.incoming.put(None)
+    await serving[-1]
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_own_only_matches_the_published_payloads():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), sessions=StubSessions())
+    ws = FakeSocket()
+    serving = asyncio.create_task(hub.serve(ws, "u1"))
+    await _settle()
+    await ws.incoming.put(_subscribe(channels=list(ws_hub.CHANNELS), own_only=True))
+    await _settle()
+    assert json.loads(ws.sent.pop())["type"] == "ws.subscribed"
+
+    # As published by the monitor service (update, stock alert, crash alert)
+    # and the checkout service (task.update)
+    def update(user_id):
+        return json.dumps({"type": "monitor.update", "payload": {
+            "monitor_id": "m1", "sku": "FV5029-006", "user_id": user_id, "status": "Air Jordan 4",
+            "in_stock": True, "price": 210.0, "poll_count": 3, "latency_ms": 40, "timestamp": "t",
+        }})
+
+    stock = json.dumps({"type": "alert", "payload": {"message": "IN STOCK", "severity": "success", "data": {
+        "monitor_id": "m1", "sku": "FV5029-006", "user_id": "u1", "title": "Air Jordan 4", "price": 210.0,
+    }}})
+    crashed = json.dumps({"type": "alert", "payload": {
+        "message": "Monitor m1 crashed", "severity": "error", "monitor_id": "m1", "user_id": "u1",
+    }})
+    task = json.dumps({"type": "task.update", "payload": {
+        "task_id": "t1", "user_id": "u1", "status": "RUNNING", "message": "Starting checkout...",
+        "progress": 50, "timestamp": "t",
+    }})
+    system = json.dumps({"type": "alert", "payload": {"message": "Low success rate", "severity": "warning"}})
+    for channel, frame in [("monitor_updates", update("u1")), ("monitor_updates", update("u2")),
+                           ("system_alerts", stock), ("system_alerts", crashed),
+                           ("task_updates", task), ("system_alerts", system)]:
+        hub.dispatch(channel, frame)
+    await _settle()
+    assert ws.sent == [update("u1"), stock, crashed, task]
+
+    await ws.incoming.put(None)
+    await serving
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_digests_are_cut_down_to_each_subscribers_monitors():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), sessions=StubSessions())
+    sockets = {name: FakeSocket() for name in ("all", "m1", "m1_again", "u1", "none")}
+    serving = [asyncio.create_task(hub.serve(ws, "u1")) for ws in sockets.values()]
+    await _settle()
+    for name, fields in [("m1", {"monitor_ids": ["m1"]}), ("m1_again", {"monitor_ids": ["m1"]}),
+                         ("u1", {"own_only": True}), ("none", {"monitor_ids": ["m9"]})]:
+        await sockets[name].incoming.put(_subscribe(channels=["monitor_updates"], **fields))
+    await _settle()
+    for ws in sockets.values():
+        ws.sent.clear()
+
+    entries = [
+        {"monitor_id": "m1", "sku": "A", "user_id": "u1", "poll_count": 7},
+        {"monitor_id": "m2", "sku": "B", "user_id": "u2", "poll_count": 3},
+        {"monitor_id": "m3", "sku": "C", "user_id": "u1", "poll_count": 1},
+    ]
+    digest = json.dumps({"type": "monitor.digest", "payload": {"monitors": entries, "timestamp": "t"}})
+    hub.dispatch("monitor_updates", digest)
+    await _settle()
+
+    def monitors(name):
+        return [[entry["monitor_id"] for entry in json.loads(frame)["payload"]["monitors"]]
+                for frame in sockets[name].sent]
+
+    assert sockets["all"].sent == [digest]
+    assert monitors("m1") == monitors("m1_again") == [["m1"]]
+    assert sockets["m1"].sent[0] is sockets["m1_again"].sent[0]  # serialized once
+    assert monitors("u1") == [["m1", "m3"]]
+    assert sockets["none"].sent == []
+
+    for ws in sockets.values():
+        await ws.incoming.put(None)
+    await asyncio.gather(*serving)
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_laces_notifications_reach_the_users_sockets_on_another_worker():
+    server = fakeredis.FakeServer()
+    apps = [
+        main.create_app(
+            fakeredis.aioredis.FakeRedis(server=server, decode_responses=True),
+            fakeredis.aioredis.FakeRedis(server=server),
+        )
+        for _ in range(2)
+    ]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=apps[0]), base_url="http://test") as client:
+        token = (await client.post("/api/auth/session", json={"api_key": "k" * 16})).json()["token"]
+        user_id = (await apps[0].state.sessions.get(token))["user_id"]
+        ws = FakeSocket()
+        serving = asyncio.create_task(apps[1].state.ws_hub.serve(ws, user_id))
+        await _settle()
+
+        params = {"reason": "SPOT", "amount": 10, "idempotency_key": "SPOT:e1"}
+        for _ in range(2):  # the retry is a replay and notifies nobody
+            response = await client.post("/api/laces/earn", params=params, headers={"Authorization": f"Bearer {token}"})
+            assert response.json() == {"success": True, "new_balance": 10}
+        await _settle()
+
+    assert [json.loads(frame) for frame in ws.sent] == [{
+        "user_id": user_id, "type": "laces_earned", "amount": 10, "reason": "SPOT", "new_balance": 10,
+    }]
+    await ws.incoming.put(None)
+    await serving
+    for app in apps:
+        await app.state.ws_hub.close()
+
+
+@pytest.mark.asyncio
+async def test_frame_budget_paces_each_socket_without_losing_changes():
+    hub = ws_hub.FanoutHub(fakeredis.aioredis.FakeRedis(), frame_budget=3)
+    ws = FakeSocket()
+    serving = asyncio.create_task(hub.serve(ws))
+    await _settle()
+    frames = [json.dumps({"type": "monitor.update", "payload": {"monitor_id": f"m{i}"}}) for i in range(5)]
+    for frame in frames:
+        hub.dispatch("monitor_updates", frame)
+    await _settle()
+    assert ws.sent == frames[:3]
+
+    await asyncio.sleep(1)
+    assert ws.sent == frames
+    await ws.incoming.put(None)
+    await serving
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_lapsed_workers_are_pruned_from_presence():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    crashed = ws_presence.PresenceRegistry(r, "crashed", ttl=0.05)
+    alive = ws_presence.PresenceRegistry(r, "alive", ttl=30)
+    await crashed.register(["u1"])
+    await asyncio.sleep(0.1)  # the crashed worker never refreshes
+
+    await alive.register(["u1"])
+    assert await r.zrange(ws_presence.presence_key("u1"), 0, -1) == ["alive"]
+    await crashed.register(["u2"])
+    await asyncio.sleep(0.1)
+    assert await alive.workers("u2") == []
+    assert await r.zcard(ws_presence.presence_key("u2")) == 0
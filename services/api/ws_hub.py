@@ -0,0 +1,401 @@
+"""
+WebSocket fan-out hub
+
+One hub per worker holds a single Redis subscription to the update channels
+and hands each message, as the text frame it arrived as, to the clients
+interested in it. Clients don't touch Redis at all.
+
+Clients start out subscribed to every channel and narrow that down by
+sending a ``WSSubscribe`` message: the channels they want and, optionally,
+monitor IDs, SKUs and/or their own user scope to filter them by. The hub
+keeps an in-memory index from (channel) and (channel, field, value) to
+subscribers, so a message is only parsed when some subscriber filters its
+channel, and is only queued for the sockets that asked for it. A
+``monitor.digest`` reaches a filtered subscriber with only the monitors it
+asked for.
+
+Each client has its own bounded send queue drained by its own sender task,
+so a slow socket only ever delays itself. When a client's queue is full its
+oldest frame is dropped (the next frame it gets is a ``ws.dropped`` notice
+with the count, so the dashboard can refetch), and a client whose socket
+doesn't accept a frame within ``send_timeout`` is disconnected. There is no
+worker-wide send limit: the bounded queues and the timeout already bound
+what a stalled socket can hold, and a shared slot held during a stalled
+send would delay everyone else.
+
+Each client gets at most ``frame_budget`` frames per second. Frames over the
+budget wait in the client's queue for the next second, so a burst of
+updates is paced out, or if it overflows the queue, coalesced into a
+``ws.dropped`` notice.
+
+With a ``PresenceRegistry`` (ws_presence.py) the hub also registers its
+users in Redis and listens on its own routing channel, so ``send_to_user``
+reaches a user's sockets on whichever replicas hold them (the LACES routes
+use it for balance notifications).
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, FrozenSet, Optional, Sequence, Set, Tuple
+
+import redis.asyncio as redis
+from fastapi import WebSocket, WebSocketDisconnect
+from prometheus_client import Counter, Gauge
+from pydantic import ValidationError
+
+from schemas import WSSubscribe
+from ws_presence import PresenceRegistry, route_channel
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = ("monitor_updates", "task_updates", "system_alerts")
+# Payload fields a subscription can filter on (looked up in ``payload``, in
+# ``payload.data`` for alerts and in each of ``payload.monitors`` for digests)
+FILTER_FIELDS = ("monitor_id", "sku", "user_id")
+
+Filter = Tuple[str, str]  # (field, value)
+
+WS_CLIENTS = Gauge("snpd_ws_clients", "WebSocket clients connected to this worker")
+WS_FRAMES = Counter("snpd_ws_frames_total", "Frames queued to WebSocket clients")
+WS_DROPPED = Counter("snpd_ws_dropped_total", "Frames dropped from full WebSocket client queues")
+WS_SLOW_DISCONNECTS = Counter("snpd_ws_slow_disconnects_total", "WebSocket clients dropped for stalling")
+WS_ROUTED = Counter("snpd_ws_routed_total", "Direct messages routed to other gateway workers")
+
+class Subscriber:
+    """One connected client: a bounded frame queue and the task draining it"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        queue_size: int,
+        user_id: Optional[str] = None,
+        frame_budget: int = 0,
+    ):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.user_id = user_id
+        self.frame_budget = frame_budget    # frames per second; 0 = unlimited
+        self.channels: FrozenSet[str] = frozenset()
+        self.filters: FrozenSet[Filter] = frozenset()
+        self.queue: Deque[str] = deque()
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._window_start = 0.0
+        self._window_sent = 0
+
+    def offer(self, frame: str):
+        """Queue a frame without waiting, dropping the oldest if the queue is full."""
+        if len(self.queue) >= self.queue_size:
+            self.queue.popleft()
+            self.dropped += 1
+            WS_DROPPED.inc()
+        self.queue.append(frame)
+        WS_FRAMES.inc()
+        self._ready.set()
+
+    async def run(self, send_timeout: float):
+        """Send queued frames until the socket fails or stalls for ``send_timeout``."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self.queue:
+                # Frames can be dropped while a send is in progress
+                await self._take_frame()
+                if self.dropped:
+                    notice = json.dumps({"type": "ws.dropped", "payload": {"count": self.dropped}})
+                    self.dropped = 0
+                    await asyncio.wait_for(self.websocket.send_text(notice), send_timeout)
+                    await self._take_frame()
+                await asyncio.wait_for(self.websocket.send_text(self.queue.popleft()), send_timeout)
+
+    async def _take_frame(self):
+        """Wait until the client's frame budget allows another frame."""
+        if not self.frame_budget:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if now - self._window_start >= 1.0:
+            self._window_start, self._window_sent = now, 0
+        elif self._window_sent >= self.frame_budget:
+            await asyncio.sleep(self._window_start + 1.0 - now)
+            self._window_start, self._window_sent = loop.time(), 0
+        self._window_sent += 1
+
+class FanoutHub:
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        channels: Sequence[str] = CHANNELS,
+        *,
+        queue_size: int = 256,
+        send_timeout: float = 5.0,
+        frame_budget: int = 0,
+        sessions: Any = None,
+        presence: Optional[PresenceRegistry] = None,
+    ):
+        self.redis = redis_client
+        self.channels = tuple(channels)
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.frame_budget = frame_budget
+        # Validates WSSubscribe.auth_token (async get(token) -> session or None)
+        self.sessions = sessions
+        self.presence = presence
+        self.subscribers: set[Subscriber] = set()
+        self._users: Dict[str, Set[Subscriber]] = {}
+        # Topic index: unfiltered subscribers per channel, filtered ones per
+        # channel and (field, value)
+        self._everything: Dict[str, Set[Subscriber]] = {}
+        self._filtered: Dict[str, Dict[Filter, Set[Subscriber]]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def subscribe(self, subscriber: Subscriber, channels: Sequence[str], filters: Sequence[Filter] = ()):
+        """Replace a subscriber's channels and filters in the topic index."""
+        self._unindex(subscriber)
+        subscriber.channels = frozenset(channels)
+        subscriber.filters = frozenset(filters)
+        for channel in subscriber.channels:
+            if not subscriber.filters:
+                self._everything.setdefault(channel, set()).add(subscriber)
+                continue
+            index = self._filtered.setdefault(channel, {})
+            for topic in subscriber.filters:
+                index.setdefault(topic, set()).add(subscriber)
+
+    def _unindex(self, subscriber: Subscriber):
+        for channel in subscriber.channels:
+            if not subscriber.filters:
+                self._everything[channel].discard(subscriber)
+                continue
+            index = self._filtered[channel]
+            for topic in subscriber.filters:
+                index[topic].discard(subscriber)
+                if not index[topic]:
+                    del index[topic]
+
+    def dispatch(self, channel: str, frame: str):
+        for subscriber in self._everything.get(channel, ()):
+            subscriber.offer(frame)
+        index = self._filtered.get(channel)
+        if not index:
+            return
+        message = _parse(frame)
+        if message is None:
+            return
+        payload = message["payload"]
+        matched: Set[Subscriber] = set()
+        for topic in _topics(payload):
+            matched.update(index.get(topic, ()))
+        monitors = payload.get("monitors")
+        if not isinstance(monitors, list):
+            for subscriber in matched:
+                subscriber.offer(frame)
+            return
+        # A digest is cut down to the monitors each subscriber asked for,
+        # serialized once per distinct filter set
+        digests: Dict[FrozenSet[Filter], str] = {}
+        for subscriber in matched:
+            digest = digests.get(subscriber.filters)
+            if digest is None:
+                entries = [entry for entry in monitors if _topics(entry) & subscriber.filters]
+                digest = digests[subscriber.filters] = json.dumps(
+                    {**message, "payload": {**payload, "monitors": entries}}
+                )
+            subscriber.offer(digest)
+
+    def deliver(self, user_id: str, frame: str) -> int:
+        """Queue a frame for this worker's sockets of ``user_id``; returns how many."""
+        subscribers = self._users.get(user_id, ())
+        for subscriber in subscribers:
+            subscriber.offer(frame)
+        return len(subscribers)
+
+    async def send_to_user(self, user_id: str, message: Any) -> int:
+        """Push a message to every socket of ``user_id`` on any replica.
+
+        Returns the number of workers it was routed to (this one included).
+        """
+        frame = message if isinstance(message, str) else json.dumps(message)
+        if self.presence is None:
+            return 1 if self.deliver(user_id, frame) else 0
+        workers = await self.presence.workers(user_id)
+        remote = [worker for worker in workers if worker != self.presence.worker_id]
+        if remote:
+            envelope = json.dumps({"user_id": user_id, "frame": frame})
+            pipe = self.redis.pipeline(transaction=False)
+            for worker in remote:
+                pipe.publish(route_channel(worker), envelope)
+            await pipe.execute()
+            WS_ROUTED.inc(len(remote))
+        local = 1 if self.deliver(user_id, frame) else 0
+        return len(remote) + local
+
+    async def serve(self, websocket: WebSocket, user_id: Optional[str] = None):
+        """Stream updates to an accepted socket until it disconnects or stalls."""
+        subscriber = Subscriber(websocket, self.queue_size, user_id, self.frame_budget)
+        self.subscribers.add(subscriber)
+        self.subscribe(subscriber, self.channels)
+        if user_id is not None:
+            await self._add_user(user_id, subscriber)
+        WS_CLIENTS.set(len(self.subscribers))
+        self._ensure_listener()
+        sender = asyncio.create_task(subscriber.run(self.send_timeout))
+        receiver = asyncio.create_task(self._receive(subscriber))
+        try:
+            done, _ = await asyncio.wait((sender, receiver), return_when=asyncio.FIRST_COMPLETED)
+            if sender in done and isinstance(sender.exception(), asyncio.TimeoutError):
+                WS_SLOW_DISCONNECTS.inc()
+                logger.info("Disconnecting WebSocket client that stopped reading")
+                await websocket.close(code=1008)
+        finally:
+            sender.cancel()
+            receiver.cancel()
+            self._unindex(subscriber)
+            self.subscribers.discard(subscriber)
+            if user_id is not None:
+                await self._remove_user(user_id, subscriber)
+            WS_CLIENTS.set(len(self.subscribers))
+
+    async def _add_user(self, user_id: str, subscriber: Subscriber):
+        sockets = self._users.setdefault(user_id, set())
+        sockets.add(subscriber)
+        if self.presence is not None and len(sockets) == 1:
+            try:
+                await self.presence.register([user_id])
+            except Exception as e:
+                # The next heartbeat registers the user
+                logger.warning(f"WebSocket presence registration failed: {e}")
+
+    async def _remove_user(self, user_id: str, subscriber: Subscriber):
+        sockets = self._users.get(user_id)
+        if sockets is None:
+            return
+        sockets.discard(subscriber)
+        if sockets:
+            return
+        del self._users[user_id]
+        if self.presence is not None:
+            try:
+                await self.presence.unregister([user_id])
+            except Exception as e:
+                # The registration lapses after the presence TTL anyway
+                logger.warning(f"WebSocket presence unregistration failed: {e}")
+
+    async def _receive(self, subscriber: Subscriber):
+        try:
+            while True:
+                # Pings and WSSubscribe messages; replies go through the
+                # queue so only the sender task ever writes to the socket
+                text = await subscriber.websocket.receive_text()
+                if text == "ping":
+                    subscriber.offer("pong")
+                else:
+                    subscriber.offer(await self._handle_subscribe(subscriber, text))
+        except WebSocketDisconnect:
+            pass
+
+    async def _handle_subscribe(self, subscriber: Subscriber, text: str) -> str:
+        """Apply a WSSubscribe message; returns the reply frame."""
+        try:
+            request = WSSubscribe.model_validate_json(text)
+        except ValidationError:
+            return _reply("ws.error", {"message": "Invalid subscription"})
+        unknown = sorted(set(request.channels) - set(self.channels))
+        if unknown:
+            return _reply("ws.error", {"message": f"Unknown channels: {', '.join(unknown)}"})
+        if self.sessions is not None:
+            session = await self.sessions.get(request.auth_token)
+            if session is None or session["user_id"] != subscriber.user_id:
+                return _reply("ws.error", {"message": "Invalid authentication"})
+        filters = [("monitor_id", monitor_id) for monitor_id in request.monitor_ids]
+        filters += [("sku", sku) for sku in request.skus]
+        if request.own_only and subscriber.user_id is not None:
+            filters.append(("user_id", subscriber.user_id))
+        self.subscribe(subscriber, request.channels, filters)
+        return _reply("ws.subscribed", {
+            "channels": sorted(subscriber.channels),
+            "monitor_ids": request.monitor_ids,
+            "skus": request.skus,
+            "own_only": request.own_only,
+        })
+
+    def _ensure_listener(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+        if self.presence is not None and self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self.presence.heartbeat(lambda: list(self._users)))
+
+    async def _listen(self):
+        own_channel = route_channel(self.presence.worker_id) if self.presence is not None else None
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(*self.channels, *([own_channel] if own_channel else []))
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        channel, data = message["channel"], message["data"]
+                        channel = channel.decode() if isinstance(channel, bytes) else channel
+                        data = data.decode() if isinstance(data, bytes) else data
+                        if channel == own_channel:
+                            self._deliver_routed(data)
+                        else:
+                            self.dispatch(channel, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"WebSocket hub subscription error: {e}")
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+
+    def _deliver_routed(self, data: str):
+        try:
+            envelope = json.loads(data)
+            self.deliver(envelope["user_id"], envelope["frame"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Malformed routed WebSocket message: {e}")
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self.presence is not None and self._users:
+            try:
+                await self.presence.unregister(list(self._users))
+            except Exception as e:
+                logger.warning(f"WebSocket presence unregistration failed: {e}")
+
+def _reply(kind: str, payload: dict) -> str:
+    return json.dumps({"type": kind, "payload": payload})
+
+def _parse(frame: str) -> Optional[dict]:
+    """A published message with a dict payload, or None."""
+    try:
+        message = json.loads(frame)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or not isinstance(message.get("payload"), dict):
+        return None
+    return message
+
+def _topics(payload: Any) -> Set[Filter]:
+    """The (field, value) topics a payload can be filtered by."""
+    if not isinstance(payload, dict):
+        return set()
+    topics = set()
+    # monitor.digest carries one payload per monitor
+    monitors = payload.get("monitors")
+    sources = [payload, payload.get("data"), *(monitors if isinstance(monitors, list) else ())]
+    for source in sources:
+        if isinstance(source, dict):
+            for field in FILTER_FIELDS:
+                value = source.get(field)
+                if value is not None:
+                    topics.add((field, str(value)))
+    return topics
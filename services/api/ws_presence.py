@@ -0,0 +1,77 @@
+"""
+WebSocket presence across gateway replicas
+
+Every hub registers the users it has sockets for in ``ws:presence:{user_id}``,
+a sorted set of worker IDs scored by when the registration lapses. Workers
+refresh their entries every ``ttl / 3`` seconds, so a replica that dies
+without cleaning up drops out of lookups within ``ttl``. Lapsed entries are
+pruned from the set whenever it is registered to or read, and the key
+itself expires once nobody refreshes it.
+
+To reach a user, a replica looks up the live workers for them and publishes
+the frame on each worker's own ``ws:route:{worker_id}`` channel; only the
+workers actually holding that user's sockets ever see it.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Iterable, List
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL = 30
+
+def presence_key(user_id: str) -> str:
+    return f"ws:presence:{user_id}"
+
+def route_channel(worker_id: str) -> str:
+    return f"ws:route:{worker_id}"
+
+class PresenceRegistry:
+    def __init__(self, redis_client: redis.Redis, worker_id: str, *, ttl: float = PRESENCE_TTL):
+        self.redis = redis_client
+        self.worker_id = worker_id
+        self.ttl = ttl
+
+    async def register(self, user_ids: Iterable[str]):
+        """Record (or refresh) this worker as holding sockets for ``user_ids``."""
+        now = time.time()
+        expires = now + self.ttl
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zremrangebyscore(presence_key(user_id), "-inf", f"({now}")
+            pipe.zadd(presence_key(user_id), {self.worker_id: expires})
+            pipe.expire(presence_key(user_id), int(self.ttl) + 1)
+        await pipe.execute()
+
+    async def unregister(self, user_ids: Iterable[str]):
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zrem(presence_key(user_id), self.worker_id)
+        await pipe.execute()
+
+    async def workers(self, user_id: str) -> List[str]:
+        """Workers with a live registration for ``user_id``."""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(presence_key(user_id), "-inf", f"({now}")
+        pipe.zrange(presence_key(user_id), 0, -1)
+        _, workers = await pipe.execute()
+        return [w.decode() if isinstance(w, bytes) else w for w in workers]
+
+    async def heartbeat(self, local_users):
+        """Refresh this worker's registrations until cancelled.
+
+        ``local_users`` is called each round for the users currently connected.
+        """
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.register(local_users())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"WebSocket presence heartbeat failed: {e}")
@@ -19,6 +19,9 @@ import random
 from abc import ABC, abstractmethod
 import uuid
 
+# Shared with the gateway, which sums the rollups per dashboard timeframe
+from services.api import metrics_rollup
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -36,6 +39,7 @@ class CheckoutTask:
     mode: str  # 'request' or 'browser'
     is_dry_run: bool = False
     proxy_url: Optional[str] = None
+    user_id: Optional[str] = None  # owner, so dashboards can filter their own tasks
     
 @dataclass
 class Profile:
@@ -313,9 +317,9 @@ class CheckoutService:
                         variant_id=task_info.get('variant_id', ''),
                         size=task_info.get('size', ''),
                         retailer=task_info['retailer'],
-                        mode=task_info['mode']
-                        is_dry_run=task_info.get('is_dry_run', False)
-
+                        mode=task_info['mode'],
+                        is_dry_run=task_info.get('is_dry_run', False),
+                        user_id=task_info.get('user_id'),
                     )
                     
                     # Process task asynchronously
@@ -327,16 +331,17 @@ class CheckoutService:
     
     async def _execute_task(self, task: CheckoutTask):
         """Execute a checkout task"""
+        started = time.time()
         try:
             # Mark as running
             self.running_tasks[task.task_id] = task
-            await self._update_task_status(task.task_id, "RUNNING", "Starting checkout...")
+            await self._update_task_status(task, "RUNNING", "Starting checkout...")
             
             # Get profile
             profile = await self._get_profile(task.profile_id)
             if not profile:
                 await self._update_task_status(
-                    task.task_id, 
+                    task, 
                     "FAILED", 
                     "Profile not found"
                 )
@@ -348,7 +353,7 @@ class CheckoutService:
             
             if not engine:
                 await self._update_task_status(
-                    task.task_id,
+                    task,
                     "FAILED",
                     f"No engine for {engine_key}"
                 )
@@ -363,14 +368,10 @@ class CheckoutService:
                     order_id=f"DRY-RUN-{str(uuid.uuid4())[:8]}"
                 )
                 await self._update_task_status(
-                    task.task_id, "SUCCESS", f"Dry run successful: {result.order_id}"
+                    task, "SUCCESS", f"Dry run successful: {result.order_id}"
                 )
             else:
                 result = await engine.checkout(task, profile)
-             
-             # Store result in database for historical records
-             await self._store_checkout_result(task, result)
-
             
             # Store result in database for historical records
             await self._store_checkout_result(task, result)
@@ -378,22 +379,23 @@ class CheckoutService:
             # Update final status
             if result.success:
                 await self._update_task_status(
-                    task.task_id,
+                    task,
                     "SUCCESS",
                     f"Order: {result.order_id}"
                 )
                 await self._increment_success_metrics()
             else:
                 await self._update_task_status(
-                    task.task_id,
+                    task,
                     "FAILED",
                     result.error or "Unknown error"
                 )
+            await self._record_checkout_metrics(task, result.success, (time.time() - started) * 1000)
                 
         except Exception as e:
             logger.error(f"Task execution error: {e}")
             await self._update_task_status(
-                task.task_id,
+                task,
                 "FAILED",
                 f"System error: {str(e)}"
             )
@@ -495,11 +497,11 @@ class CheckoutService:
         # This is a placeholder for an actual database insert using an ORM.
         logger.info(f"Storing checkout result for task {task.task_id} in database.")
     
-    async def _update_task_status(self, task_id: str, status: str, message: str):
+    async def _update_task_status(self, task: CheckoutTask, status: str, message: str):
         """Update task status and publish update"""
         # Update in Redis
         await self.redis_client.hset(
-            f"task:{task_id}",
+            f"task:{task.task_id}",
             mapping={
                 "status": status,
                 "message": message,
@@ -511,7 +513,8 @@ class CheckoutService:
         update = {
             "type": "task.update",
             "payload": {
-                "task_id": task_id,
+                "task_id": task.task_id,
+                "user_id": task.user_id,
                 "status": status,
                 "message": message,
                 "progress": 100 if status in ["SUCCESS", "FAILED"] else 50,
@@ -530,6 +533,21 @@ class CheckoutService:
         running_count = len(self.running_tasks)
         await self.redis_client.set("metrics:running_tasks", running_count)
     
+    async def _record_checkout_metrics(self, task: CheckoutTask, success: bool, duration_ms: float):
+        """Count a finished checkout into the dashboard's minute/hour/day rollups"""
+        values = {
+            "completed_tasks": 1,
+            "total_checkouts": 1,
+            "successful_checkouts": int(success),
+            "checkout_ms_sum": int(duration_ms),
+            "checkout_ms_count": 1,
+            f"{task.retailer}:total": 1,
+            f"{task.retailer}:success": int(success),
+        }
+        pipe = self.redis_client.pipeline(transaction=False)
+        metrics_rollup.record(pipe, values)
+        await pipe.execute()
+    
     async def shutdown(self):
         """Gracefully shutdown the service"""
         logger.info("Shutting down Checkout Service...")
@@ -0,0 +1,223 @@
+"""
+Central poll scheduler
+
+One dispatcher task keeps every scheduled poll in a heap ordered by due
+time and sleeps until the earliest one, instead of each monitor running its
+own task and ``asyncio.sleep``. Due polls go to a fixed pool of worker
+tasks; a retailer with ``limit`` polls already in flight has further due
+polls parked until one of them finishes, so one slow retailer can't occupy
+the whole pool.
+
+Polls run at a fixed rate: the next poll is due one interval after the
+previous one was *due*, not after it finished, so poll duration and
+dispatch lag don't accumulate. A poll that overruns its interval is
+followed straight away, but whole intervals it overran are skipped (counted
+in ``monitor_polls_skipped_total``) rather than fired as a burst to catch
+up. A job is never polled twice concurrently.
+
+A poll that raises stays scheduled but backs off: the next one is due
+``interval * 2 ** failures`` after it finished (at most ``max_backoff``),
+until a poll succeeds again.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_LAG = Histogram(
+    "monitor_schedule_lag_seconds", "Delay between a poll falling due and starting",
+    ["retailer"], buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+SCHEDULE_DRIFT = Histogram(
+    "monitor_schedule_drift_seconds", "Start-to-start poll interval minus the configured interval",
+    ["retailer"], buckets=[-0.05, -0.01, 0, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1],
+)
+POLLS_SKIPPED = Counter("monitor_polls_skipped_total", "Poll ticks skipped after an overrun", ["retailer"])
+SCHEDULED_JOBS = Gauge("monitor_scheduled_jobs", "Polls registered with the scheduler")
+POLLS_INFLIGHT = Gauge("monitor_polls_inflight", "Polls running", ["retailer"])
+POLLS_FAILED = Counter("monitor_polls_failed_total", "Polls that raised and were backed off", ["retailer"])
+
+@dataclass(eq=False)
+class Job:
+    key: Hashable
+    retailer: str
+    interval: float
+    due: float
+    last_start: Optional[float] = None
+    running: bool = False
+    failures: int = 0     # consecutive failed polls
+
+@dataclass
+class _RetailerSlots:
+    limit: int
+    inflight: int = 0
+    parked: Deque[Job] = field(default_factory=deque)
+
+class PollScheduler:
+    def __init__(
+        self,
+        poll: Callable[[Hashable], Awaitable[Any]],
+        *,
+        workers: int = 64,
+        retailer_limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 16,
+        max_backoff: float = 60.0,
+    ):
+        self.poll = poll
+        self.workers = workers
+        self.retailer_limits = dict(retailer_limits or {})
+        self.default_limit = default_limit
+        self.max_backoff = max_backoff
+        self._jobs: Dict[Hashable, Job] = {}
+        self._heap: List[Tuple[float, int, Job]] = []
+        self._seq = itertools.count()
+        self._slots: Dict[str, _RetailerSlots] = {}
+        self._ready: "asyncio.Queue[Job]" = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._jobs
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def schedule(self, key: Hashable, retailer: str, interval: float, *, delay: float = 0.0):
+        """Poll ``key`` every ``interval`` seconds, first after ``delay``.
+
+        Rescheduling an existing key changes its interval; its next poll is
+        brought forward if the new interval makes it due sooner.
+        """
+        now = asyncio.get_running_loop().time()
+        job = self._jobs.get(key)
+        if job is not None:
+            job.interval = interval
+            if job.running or job.last_start is None or job.failures:
+                return
+            due = job.last_start + interval
+            if due >= job.due:
+                return
+            job.due = max(due, now)
+        else:
+            job = Job(key, retailer, interval, now + delay)
+            self._jobs[key] = job
+            SCHEDULED_JOBS.set(len(self._jobs))
+        heapq.heappush(self._heap, (job.due, next(self._seq), job))
+        self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        """Stop polling ``key``; a poll already running finishes. False if unknown."""
+        job = self._jobs.pop(key, None)
+        SCHEDULED_JOBS.set(len(self._jobs))
+        # Heap and parked entries are skipped once the job is gone
+        return job is not None
+
+    def start(self):
+        if not self._tasks:
+            self._tasks.append(asyncio.create_task(self._dispatch()))
+            self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _live(self, job: Job) -> bool:
+        return self._jobs.get(job.key) is job
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job = heapq.heappop(self._heap)
+                # Stale entries: cancelled jobs and superseded due times
+                if self._live(job) and not job.running and due == job.due:
+                    self._submit(job)
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _submit(self, job: Job):
+        slots = self._slots_for(job.retailer)
+        job.running = True
+        if slots.inflight < slots.limit:
+            slots.inflight += 1
+            POLLS_INFLIGHT.labels(job.retailer).inc()
+            self._ready.put_nowait(job)
+        else:
+            slots.parked.append(job)
+
+    def _slots_for(self, retailer: str) -> _RetailerSlots:
+        slots = self._slots.get(retailer)
+        if slots is None:
+            slots = self._slots[retailer] = _RetailerSlots(self.retailer_limits.get(retailer, self.default_limit))
+        return slots
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._ready.get()
+            try:
+                if self._live(job):
+                    start = loop.time()
+                    SCHEDULE_LAG.labels(job.retailer).observe(start - job.due)
+                    if job.last_start is not None:
+                        SCHEDULE_DRIFT.labels(job.retailer).observe(start - job.last_start - job.interval)
+                    job.last_start = start
+                    try:
+                        await self.poll(job.key)
+                        job.failures = 0
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        job.failures += 1
+                        POLLS_FAILED.labels(job.retailer).inc()
+                        logger.error(
+                            f"Poll {job.key!r} failed ({job.failures} in a row), "
+                            f"retrying in {self._backoff(job):.1f}s: {e}"
+                        )
+            finally:
+                self._finish(job, loop.time())
+
+    def _finish(self, job: Job, now: float):
+        job.running = False
+        slots = self._slots_for(job.retailer)
+        slots.inflight -= 1
+        POLLS_INFLIGHT.labels(job.retailer).dec()
+        # Hand the freed slot to the next live parked poll
+        while slots.parked:
+            parked = slots.parked.popleft()
+            if self._live(parked):
+                slots.inflight += 1
+                POLLS_INFLIGHT.labels(parked.retailer).inc()
+                self._ready.put_nowait(parked)
+                break
+            parked.running = False
+        if not self._live(job):
+            return
+        due = job.due + job.interval
+        missed = int((now - due) // job.interval) if due < now else 0
+        if missed:
+            POLLS_SKIPPED.labels(job.retailer).inc(missed)
+            due += missed * job.interval
+        if job.failures:
+            due = max(due, now + self._backoff(job))
+        job.due = due
+        heapq.heappush(self._heap, (due, next(self._seq), job))
+        self._wakeup.set()
+
+    def _backoff(self, job: Job) -> float:
+        return min(job.interval * 2 ** job.failures, self.max_backoff)
@@ -8,13 +8,16 @@ import json
 import time
 import httpx
 import redis.asyncio as redis
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 from datetime import datetime
 import logging
 import os
 
 from db import StockDatabase
+from scheduler import PollScheduler
+from updates import UpdateCoalescer
+from watch import TargetKey, WatchTargets, matches
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +31,31 @@ class MonitorConfig:
     retailer: str
     interval_ms: int
     webhook_url: Optional[str] = None
+    store: Optional[str] = None
+    size_filter: Optional[List[str]] = None
+    price_threshold: Optional[float] = None
+    keywords: Optional[List[str]] = None
+    user_id: Optional[str] = None  # owner, so dashboards can filter their own monitors
+
+    @classmethod
+    def from_data(cls, monitor_id: str, data: Dict[str, Any]) -> "MonitorConfig":
+        """Build a config from a start command or the ``monitor:{id}`` hash"""
+        def _list(value):
+            return json.loads(value) if isinstance(value, str) else value
+
+        price_threshold = data.get("price_threshold")
+        return cls(
+            monitor_id=monitor_id,
+            sku=data["sku"],
+            retailer=data["retailer"],
+            interval_ms=int(data["interval_ms"]),
+            webhook_url=data.get("webhook_url"),
+            store=data.get("store"),
+            size_filter=_list(data.get("size_filter")),
+            price_threshold=float(price_threshold) if price_threshold is not None else None,
+            keywords=_list(data.get("keywords")),
+            user_id=data.get("user_id"),
+        )
     
 @dataclass
 class ProductInfo:
@@ -228,12 +256,31 @@ class FinishLineMonitor(RetailerMonitor):
             variants={},
         )
 
+def _parse_limits(spec: str) -> Dict[str, int]:
+    """Per-retailer concurrency limits from ``"shopify=8,snkrs=4"``"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        retailer, _, limit = item.partition("=")
+        limits[retailer.strip()] = int(limit)
+    return limits
+
 class MonitorService:
     """Main monitoring service that manages all monitors"""
     
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
-        self.monitors: Dict[str, asyncio.Task] = {}
+        self.monitors: Dict[str, MonitorConfig] = {}
+        self._monitor_state: Dict[str, Dict[str, Any]] = {}
+        # Monitors of the same product share a watch target, polled once by
+        # one dispatcher and a bounded worker pool
+        self.targets = WatchTargets()
+        self.scheduler = PollScheduler(
+            self._poll_target,
+            workers=int(os.getenv("MONITOR_WORKERS", "64")),
+            retailer_limits=_parse_limits(os.getenv("MONITOR_RETAILER_LIMITS", "")),
+            default_limit=int(os.getenv("MONITOR_RETAILER_CONCURRENCY", "16")),
+            max_backoff=int(os.getenv("MONITOR_MAX_BACKOFF_MS", "60000")) / 1000.0,
+        )
         self.http_client = httpx.AsyncClient(
             limits=httpx.Limits(max_keepalive_connections=25, max_connections=100),
             timeout=httpx.Timeout(5.0),
@@ -245,6 +292,8 @@ class MonitorService:
             'snkrs': SNKRSMonitor(self.http_client),
             'finishline': FinishLineMonitor(self.http_client),
         }
+        # Shopify stores other than the default, by store URL
+        self.shopify_stores: Dict[str, ShopifyMonitor] = {}
         db_config = {
             "host": os.getenv("DB_HOST", "localhost"),
             "port": int(os.getenv("DB_PORT", "3306")),
@@ -253,6 +302,8 @@ class MonitorService:
             "db": os.getenv("DB_NAME", "sneakersniper"),
         }
         self.db = StockDatabase(db_config)
+        self.updates: Optional[UpdateCoalescer] = None
+        self._digest_task: Optional[asyncio.Task] = None
         
     async def start(self):
         """Start the monitor service"""
@@ -267,6 +318,14 @@ class MonitorService:
 
         # Connect to MySQL
         await self.db.connect()
+
+        # State changes go out immediately, heartbeats in a periodic digest
+        self.updates = UpdateCoalescer(
+            self.redis_client,
+            interval=int(os.getenv("MONITOR_DIGEST_INTERVAL_MS", "1000")) / 1000.0,
+        )
+        self._digest_task = asyncio.create_task(self.updates.run())
+        self.scheduler.start()
         
         # Subscribe to monitor commands
         pubsub = self.redis_client.pubsub()
@@ -296,12 +355,7 @@ class MonitorService:
         
         if action == "start":
             monitor_data = command.get("monitor")
-            config = MonitorConfig(
-                monitor_id=monitor_data["monitor_id"],
-                sku=monitor_data["sku"],
-                retailer=monitor_data["retailer"],
-                interval_ms=monitor_data["interval_ms"]
-            )
+            config = MonitorConfig.from_data(monitor_data["monitor_id"], monitor_data)
             await self._start_monitor(config)
             
         elif action == "stop":
@@ -312,14 +366,19 @@ class MonitorService:
             await self._publish_status()
     
     async def _start_monitor(self, config: MonitorConfig):
-        """Start a new monitor task"""
+        """Start a monitor, subscribing it to the watch target for its product"""
         if config.monitor_id in self.monitors:
             logger.warning(f"Monitor {config.monitor_id} already running")
             return
+        if config.retailer not in self.retailer_monitors:
+            logger.error(f"Unknown retailer: {config.retailer}")
+            return
 
-        # Create monitor task
-        task = asyncio.create_task(self._monitor_loop(config))
-        self.monitors[config.monitor_id] = task
+        self.monitors[config.monitor_id] = config
+        self._monitor_state[config.monitor_id] = {"poll_count": 0, "last_status": None}
+        key = self._target_key(config)
+        interval = self.targets.add(config.monitor_id, key, config.interval_ms / 1000.0)
+        self.scheduler.schedule(key, config.retailer, interval)
         await self._persist_monitor(config, status="active")
 
         logger.info(f"Started monitor {config.monitor_id} for SKU {config.sku}")
@@ -327,84 +386,115 @@ class MonitorService:
     async def _stop_monitor(self, monitor_id: str):
         """Stop a running monitor"""
         if monitor_id in self.monitors:
-            self.monitors[monitor_id].cancel()
+            self._unwatch(monitor_id)
             del self.monitors[monitor_id]
+            del self._monitor_state[monitor_id]
+            self.updates.forget(monitor_id)
             await self.redis_client.srem("active_monitors", monitor_id)
             await self.redis_client.hset(f"monitor:{monitor_id}", "status", "stopped")
             logger.info(f"Stopped monitor {monitor_id}")
+
+    def _target_key(self, config: MonitorConfig) -> TargetKey:
+        retailer_monitor = self._retailer_monitor(config)
+        return (config.retailer, getattr(retailer_monitor, "store_url", None), config.sku)
+
+    def _retailer_monitor(self, config: MonitorConfig) -> RetailerMonitor:
+        if config.retailer == "shopify" and config.store:
+            store_url = config.store.rstrip('/')
+            if store_url not in self.shopify_stores:
+                self.shopify_stores[store_url] = ShopifyMonitor(self.http_client, store_url)
+            return self.shopify_stores[store_url]
+        return self.retailer_monitors[config.retailer]
+
+    def _unwatch(self, monitor_id: str):
+        """Unsubscribe a monitor; its target slows down or stops with it"""
+        key, interval = self.targets.remove(monitor_id)
+        if key is None:
+            return
+        if interval is None:
+            self.scheduler.cancel(key)
+        else:
+            self.scheduler.schedule(key, key[0], interval)
     
-    async def _monitor_loop(self, config: MonitorConfig):
-        """Main monitoring loop for a SKU"""
-        retailer_monitor = self.retailer_monitors.get(config.retailer)
-        if not retailer_monitor:
-            logger.error(f"Unknown retailer: {config.retailer}")
+    async def _poll_target(self, key: TargetKey):
+        """Poll a watch target once and fan the result out (called by the scheduler)"""
+        monitor_ids = self.targets.subscribers(key)
+        if not monitor_ids:
             return
-            
-        poll_count = 0
-        last_status = None
+        retailer_monitor = self._retailer_monitor(self.monitors[monitor_ids[0]])
         
-        try:
-            while True:
-                start_time = time.time()
-                
-                # Check stock
-                product_info = await retailer_monitor.check_stock(config.sku)
-                
-                # Calculate latency
-                latency_ms = int((time.time() - start_time) * 1000)
-                poll_count += 1
-                
-                # Detect status change
-                if last_status is not None and last_status != product_info.in_stock:
-                    if product_info.in_stock:
-                        # Stock detected!
-                        await self._handle_stock_alert(config, product_info)
-                
-                last_status = product_info.in_stock
-                
-                # Publish update to Redis
-                update_data = {
-                    "type": "monitor.update",
-                    "payload": {
-                        "monitor_id": config.monitor_id,
-                        "sku": config.sku,
-                        "status": product_info.title[:50],
-                        "in_stock": product_info.in_stock,
-                        "poll_count": poll_count,
-                        "latency_ms": latency_ms,
-                        "timestamp": datetime.now().isoformat()
-                    }
+        start_time = time.time()
+        
+        # Check stock. A failure (often a transient retailer error) raises to
+        # the scheduler, which logs it and backs this target off; every
+        # subscriber stays watched.
+        product_info = await retailer_monitor.check_stock(key[2])
+        
+        # Calculate latency
+        latency_ms = int((time.time() - start_time) * 1000)
+        
+        for monitor_id in monitor_ids:
+            try:
+                await self._deliver(monitor_id, product_info, latency_ms)
+            except Exception as e:
+                await self._monitor_failed(monitor_id, e)
+        
+        # Update metrics
+        await self._update_metrics(latency_ms)
+    
+    async def _deliver(self, monitor_id: str, product_info: ProductInfo, latency_ms: int):
+        """Apply one poll result to a monitor: its filters, alerts and update"""
+        config = self.monitors.get(monitor_id)
+        if config is None:
+            return
+        state = self._monitor_state[monitor_id]
+        state["poll_count"] += 1
+        matched = matches(config, product_info)
+        
+        # Detect status change (of this monitor's filters, not just stock)
+        last_status = state["last_status"]
+        if last_status is not None and last_status != matched:
+            if matched:
+                # Stock detected!
+                await self._handle_stock_alert(config, product_info)
+        
+        state["last_status"] = matched
+        
+        # Publish update (immediately on a state change, else in the next digest)
+        await self.updates.update({
+            "monitor_id": config.monitor_id,
+            "sku": config.sku,
+            "user_id": config.user_id,
+            "status": product_info.title[:50],
+            "in_stock": product_info.in_stock,
+            "matches_filters": matched,
+            "price": product_info.price,
+            "poll_count": state["poll_count"],
+            "latency_ms": latency_ms,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    async def _monitor_failed(self, monitor_id: str, e: Exception):
+        """Stop polling for a monitor that errored and report it"""
+        logger.error(f"Monitor {monitor_id} error: {e}")
+        config = self.monitors.get(monitor_id)
+        self._unwatch(monitor_id)
+        # Publish error
+        await self.redis_client.publish(
+            "system_alerts",
+            json.dumps({
+                "type": "alert",
+                "payload": {
+                    "message": f"Monitor {monitor_id} crashed: {str(e)}",
+                    "severity": "error",
+                    "monitor_id": monitor_id,
+                    "user_id": config.user_id if config else None,
                 }
-                
-                await self.redis_client.publish(
-                    "monitor_updates",
-                    json.dumps(update_data)
-                )
-                
-                # Update metrics
-                await self._update_metrics(latency_ms)
-                
-                # Wait for next poll
-                await asyncio.sleep(config.interval_ms / 1000.0)
-                
-        except asyncio.CancelledError:
-            logger.info(f"Monitor {config.monitor_id} cancelled")
-        except Exception as e:
-            logger.error(f"Monitor {config.monitor_id} error: {e}")
-            # Publish error
-            await self.redis_client.publish(
-                "system_alerts",
-                json.dumps({
-                    "type": "alert",
-                    "payload": {
-                        "message": f"Monitor {config.monitor_id} crashed: {str(e)}",
-                        "severity": "error"
-                    }
-                })
-            )
-            await self.redis_client.hset(
-                f"monitor:{config.monitor_id}", "status", "error"
-            )
+            })
+        )
+        await self.redis_client.hset(
+            f"monitor:{monitor_id}", "status", "error"
+        )
     
     async def _handle_stock_alert(self, config: MonitorConfig, product_info: ProductInfo):
         """Handle stock detection"""
@@ -414,6 +504,7 @@ class MonitorService:
         alert_data = {
             "monitor_id": config.monitor_id,
             "sku": product_info.sku,
+            "user_id": config.user_id,
             "title": product_info.title,
             "price": product_info.price,
             "variants": len(product_info.variants),
@@ -479,10 +570,10 @@ class MonitorService:
         """Publish current monitor status to Redis"""
         payload = {
             monitor_id: {
-                "running": not task.done(),
-                "retailer": await self.redis_client.hget(f"monitor:{monitor_id}", "retailer"),
+                "running": monitor_id in self.targets,
+                "retailer": config.retailer,
             }
-            for monitor_id, task in self.monitors.items()
+            for monitor_id, config in self.monitors.items()
         }
         await self.redis_client.publish(
             "monitor_updates",
@@ -496,24 +587,17 @@ class MonitorService:
         for monitor_id in active_monitor_ids:
             monitor_data = await self.redis_client.hgetall(f"monitor:{monitor_id}")
             if monitor_data and monitor_data.get("status") == "active":
-                config = MonitorConfig(
-                    monitor_id=monitor_id,
-                    sku=monitor_data["sku"],
-                    retailer=monitor_data["retailer"],
-                    interval_ms=int(monitor_data["interval_ms"])
-                )
+                config = MonitorConfig.from_data(monitor_id, monitor_data)
                 await self._start_monitor(config)
     
     async def shutdown(self):
         """Gracefully shutdown the service"""
         logger.info("Shutting down Monitor Service...")
         
-        # Cancel all monitors
-        for task in self.monitors.values():
-            task.cancel()
-        
-        # Wait for tasks to complete
-        await asyncio.gather(*self.monitors.values(), return_exceptions=True)
+        # Stop polling
+        await self.scheduler.close()
+        if self._digest_task is not None:
+            self._digest_task.cancel()
         
         # Close connections
         await self.http_client.aclose()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The monitor service imports its modules flat (``from db import ...``), as it
+# does when run from services/monitor inside its container.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
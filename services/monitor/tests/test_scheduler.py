@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from scheduler import PollScheduler
+
+
+@pytest.mark.asyncio
+async def test_polls_keep_a_fixed_rate_despite_poll_duration():
+    starts = []
+
+    async def poll(key):
+        starts.append(asyncio.get_running_loop().time())
+        await asyncio.sleep(0.03)
+
+    scheduler = PollScheduler(poll, workers=4)
+    scheduler.start()
+    scheduler.schedule("m1", "shopify", 0.05)
+    await asyncio.sleep(0.52)
+    await scheduler.close()
+
+    # Fixed delay (sleep after each poll) would manage only 7 polls here
+    assert len(starts) in (10, 11)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert abs(sum(gaps) / len(gaps) - 0.05) < 0.005
+
+
+@pytest.mark.asyncio
+async def test_retailer_limit_parks_polls_without_blocking_other_retailers():
+    running = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0}
+    release = asyncio.Event()
+
+    async def poll(key):
+        retailer = key[0]
+        running[retailer] += 1
+        peak[retailer] = max(peak[retailer], running[retailer])
+        try:
+            if retailer == "a":
+                await release.wait()
+        finally:
+            running[retailer] -= 1
+
+    scheduler = PollScheduler(poll, workers=8, retailer_limits={"a": 2})
+    scheduler.start()
+    for i in range(5):
+        scheduler.schedule(("a", i), "a", 10)
+    scheduler.schedule(("b", 0), "b", 0.01)
+    await asyncio.sleep(0.1)
+    assert peak == {"a": 2, "b": 1}
+    assert running["a"] == 2
+
+    release.set()
+    await asyncio.sleep(0.02)
+    assert peak["a"] == 2 and running["a"] == 0
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_overruns_skip_ticks_and_never_overlap():
+    polls = []
+    running = set()
+
+    async def poll(key):
+        assert key not in running
+        running.add(key)
+        polls.append(key)
+        await asyncio.sleep(0.055)
+        running.discard(key)
+
+    scheduler = PollScheduler(poll)
+    scheduler.start()
+    scheduler.schedule("slow", "shopify", 0.02)
+    await asyncio.sleep(0.2)
+    assert scheduler.cancel("slow")
+    count = len(polls)
+    await asyncio.sleep(0.1)
+    await scheduler.close()
+
+    assert 3 <= count <= 4
+    assert len(polls) == count
+    assert not scheduler.cancel("slow")
+
+
+@pytest.mark.asyncio
+async def test_failing_polls_back_off_and_recover():
+    starts = []
+
+    async def poll(key):
+        starts.append(asyncio.get_running_loop().time())
+        if len(starts) <= 3:
+            raise RuntimeError("retailer down")
+
+    scheduler = PollScheduler(poll, max_backoff=0.08)
+    scheduler.start()
+    scheduler.schedule("m1", "shopify", 0.02)
+    await asyncio.sleep(0.33)
+    assert "m1" in scheduler
+    await scheduler.close()
+
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    # 0.04, 0.08, then capped at 0.08; back to the interval once a poll succeeds
+    assert all(abs(gap - expected) < 0.01 for gap, expected in zip(gaps, [0.04, 0.08, 0.08]))
+    assert all(abs(gap - 0.02) < 0.01 for gap in gaps[3:]) and len(gaps) > 4
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import fakeredis.aioredis
+import pytest
+
+import service
+from service import MonitorConfig, ProductInfo
+from updates import UpdateCoalescer
+
+
+class RecordingRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis that keeps every published message"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, decode_responses=True, **kwargs)
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+        return await super().publish(channel, message)
+
+
+class FakeHTTP:
+    """Stands in for the shared httpx client; records webhook posts"""
+
+    def __init__(self, *args, **kwargs):
+        self.posts = []
+
+    async def post(self, url, json=None, timeout=None):
+        self.posts.append((url, json))
+
+    async def aclose(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self):
+        self.alerts = []
+
+    async def store_alert(self, alert):
+        self.alerts.append(alert)
+
+
+class FakeRetailer:
+    """Returns queued results (an exception is raised) and counts fetches"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.fetches = []
+
+    async def check_stock(self, sku):
+        self.fetches.append(sku)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def _service(monkeypatch, retailer):
+    monkeypatch.setattr(service.httpx, "AsyncClient", FakeHTTP)
+    svc = service.MonitorService()
+    svc.redis_client = RecordingRedis()
+    svc.db = FakeDB()
+    svc.updates = UpdateCoalescer(svc.redis_client, interval=60)
+    svc.retailer_monitors["snkrs"] = retailer
+    return svc
+
+
+def _product(in_stock, price=210.0):
+    variants = {"1": {"id": "1", "size": "42", "available": in_stock}}
+    return ProductInfo(sku="FV5029-006", title="Air Jordan 4 Bred", price=price, in_stock=in_stock, variants=variants)
+
+
+def _monitor(monitor_id, user_id, **fields):
+    # Shaped like the monitor:{id} hash the gateway writes
+    return MonitorConfig.from_data(monitor_id, {
+        "sku": "FV5029-006", "retailer": "snkrs", "interval_ms": "200", "user_id": user_id, **fields,
+    })
+
+
+def _published(svc, channel):
+    return [message for name, message in svc.redis_client.published if name == channel]
+
+
+@pytest.mark.asyncio
+async def test_updates_and_alerts_carry_the_monitor_owner(monkeypatch):
+    svc = _service(monkeypatch, FakeRetailer(_product(False), _product(True)))
+    await svc._start_monitor(_monitor("m1", "u1"))
+    key = svc.targets._target_of["m1"]
+    for _ in range(2):
+        await svc._poll_target(key)
+
+    updates = _published(svc, "monitor_updates")
+    assert [(u["type"], u["payload"]["user_id"]) for u in updates] == [("monitor.update", "u1")] * 2
+    (alert,) = _published(svc, "system_alerts")
+    assert alert["payload"]["data"]["user_id"] == "u1"
+    assert svc.db.alerts[0]["user_id"] == "u1"
+
+
+@pytest.mark.asyncio
+async def test_one_poll_feeds_each_monitor_through_its_own_filters(monkeypatch):
+    retailer = FakeRetailer(_product(False), _product(True))
+    svc = _service(monkeypatch, retailer)
+    await svc._start_monitor(_monitor("m1", "u1", price_threshold="250", webhook_url="https://hooks.test/u1"))
+    await svc._start_monitor(_monitor("m2", "u2", size_filter='["42", "43"]', webhook_url="https://hooks.test/u2"))
+    await svc._start_monitor(_monitor("m3", "u3", size_filter='["44"]', webhook_url="https://hooks.test/u3"))
+    key = svc.targets._target_of["m1"]
+    assert len(svc.targets) == 1 and key in svc.scheduler
+    for _ in range(2):
+        await svc._poll_target(key)
+    await asyncio.sleep(0)  # webhooks are sent from their own tasks
+
+    assert retailer.fetches == ["FV5029-006"] * 2
+    updates = [u["payload"] for u in _published(svc, "monitor_updates")]
+    # in_stock is the product's stock; matches_filters is per monitor
+    assert [(u["monitor_id"], u["in_stock"], u["matches_filters"]) for u in updates] == [
+        ("m1", False, False), ("m2", False, False), ("m3", False, False),
+        ("m1", True, True), ("m2", True, True), ("m3", True, False),
+    ]
+    alerts = [alert["payload"]["data"] for alert in _published(svc, "system_alerts")]
+    assert [(a["monitor_id"], a["user_id"]) for a in alerts] == [("m1", "u1"), ("m2", "u2")]
+    assert [a["monitor_id"] for a in svc.db.alerts] == ["m1", "m2"]
+    assert [(url, data["user_id"]) for url, data in svc.http_client.posts] == [
+        ("https://hooks.test/u1", "u1"), ("https://hooks.test/u2", "u2"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_a_failed_poll_keeps_every_subscriber_watched(monkeypatch):
+    retailer = FakeRetailer(RuntimeError("blocked"), _product(True))
+    svc = _service(monkeypatch, retailer)
+    await svc._start_monitor(_monitor("m1", "u1"))
+    await svc._start_monitor(_monitor("m2", "u2", size_filter='["44"]'))
+    key = svc.targets._target_of["m1"]
+    # The scheduler logs the error and backs the target off
+    with pytest.raises(RuntimeError):
+        await svc._poll_target(key)
+
+    assert _published(svc, "system_alerts") == []
+    for monitor_id in ("m1", "m2"):
+        assert monitor_id in svc.targets
+        assert await svc.redis_client.hget(f"monitor:{monitor_id}", "status") != "error"
+    assert key in svc.scheduler
+
+    await svc._poll_target(key)
+    assert retailer.fetches == ["FV5029-006"] * 2
+    assert [u["payload"]["monitor_id"] for u in _published(svc, "monitor_updates")] == ["m1", "m2"]
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from updates import UpdateCoalescer
+
+
+class RecordingRedis:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+
+
+def _poll(monitor_id, in_stock=False, price=200.0, poll_count=1):
+    return {"monitor_id": monitor_id, "sku": "DZ5485", "status": "Jordan 4", "in_stock": in_stock,
+            "price": price, "poll_count": poll_count, "latency_ms": 40}
+
+
+@pytest.mark.asyncio
+async def test_state_changes_publish_immediately_and_heartbeats_are_digested():
+    redis_client = RecordingRedis()
+    updates = UpdateCoalescer(redis_client, interval=60)
+    await updates.update(_poll("m1"))
+    for poll_count in range(2, 6):
+        await updates.update(_poll("m1", poll_count=poll_count))
+    await updates.update(_poll("m1", in_stock=True, poll_count=6))
+    await updates.update(_poll("m2", poll_count=1))
+    await updates.update(_poll("m2", poll_count=2))
+
+    assert [(message["type"], message["payload"]["monitor_id"], message["payload"]["poll_count"])
+            for _, message in redis_client.published] == [
+        ("monitor.update", "m1", 1), ("monitor.update", "m1", 6), ("monitor.update", "m2", 1),
+    ]
+    assert await updates.flush() == 1
+    channel, digest = redis_client.published[-1]
+    assert channel == "monitor_updates" and digest["type"] == "monitor.digest"
+    assert [(p["monitor_id"], p["poll_count"]) for p in digest["payload"]["monitors"]] == [("m2", 2)]
+    assert await updates.flush() is None
+
+
+@pytest.mark.asyncio
+async def test_every_state_change_is_published_immediately():
+    redis_client = RecordingRedis()
+    updates = UpdateCoalescer(redis_client, interval=60)
+    monitor_ids = [f"m{i}" for i in range(25)]
+    for monitor_id in monitor_ids:
+        await updates.update(_poll(monitor_id, in_stock=True))
+
+    # Nothing is held back for a digest, however many monitors flip at once
+    assert [message["payload"]["monitor_id"] for _, message in redis_client.published] == monitor_ids
+    assert await updates.flush() is None
+
+
+@pytest.mark.asyncio
+async def test_forgotten_monitors_leave_the_digest():
+    updates = UpdateCoalescer(RecordingRedis(), interval=60)
+    await updates.update(_poll("m1"))
+    await updates.update(_poll("m1", poll_count=2))
+    updates.forget("m1")
+    assert await updates.flush() is None
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from scheduler import PollScheduler
+from watch import WatchTargets, available_sizes, matches
+
+KITH = ("shopify", "https://kith.com", "jordan-4-bred")
+
+
+def test_targets_poll_at_the_fastest_subscribed_interval():
+    targets = WatchTargets()
+    assert targets.add("m1", KITH, 1.0) == 1.0
+    assert targets.add("m2", KITH, 0.25) == 0.25
+    assert targets.add("m3", ("snkrs", None, "FV5029-006"), 0.5) == 0.5
+    assert len(targets) == 2 and sorted(targets.subscribers(KITH)) == ["m1", "m2"]
+
+    assert targets.remove("m2") == (KITH, 1.0)
+    assert targets.remove("m1") == (KITH, None)
+    assert targets.remove("m1") == (None, None)
+    assert len(targets) == 1 and "m3" in targets and "m1" not in targets
+
+
+@pytest.mark.asyncio
+async def test_many_monitors_of_one_product_share_one_poll():
+    targets = WatchTargets()
+    fetches = []
+
+    async def poll(key):
+        fetches.append((key, len(targets.subscribers(key))))
+
+    scheduler = PollScheduler(poll)
+    scheduler.start()
+    for i in range(300):
+        scheduler.schedule(KITH, "shopify", targets.add(f"m{i}", KITH, 0.05))
+    await asyncio.sleep(0.12)
+    await scheduler.close()
+
+    assert 2 <= len(fetches) <= 3
+    assert set(fetches) == {(KITH, 300)}
+
+
+def _product(in_stock=True, price=210.0, title="Air Jordan 4 Retro Bred Reimagined", variants=None):
+    return SimpleNamespace(in_stock=in_stock, price=price, title=title, variants=variants or {})
+
+
+def _filters(**fields):
+    return SimpleNamespace(**{"price_threshold": None, "keywords": None, "size_filter": None, **fields})
+
+
+def test_each_monitor_applies_its_own_filters():
+    variants = {
+        1: {"id": 1, "option1": "42", "available": True},
+        2: {"id": 2, "option1": "43", "available": False},
+        3: {"id": 3, "size": "44.5", "available": True},
+    }
+    product = _product(variants=variants)
+    assert available_sizes(variants.values()) == ["42", "44.5"]
+
+    assert matches(_filters(), product)
+    assert not matches(_filters(), _product(in_stock=False))
+    assert matches(_filters(price_threshold=210), product)
+    assert not matches(_filters(price_threshold=200), product)
+    assert matches(_filters(keywords=["jordan", "BRED"]), product)
+    assert not matches(_filters(keywords=["jordan", "military"]), product)
+    assert matches(_filters(size_filter=["43", "44.5"]), product)
+    assert not matches(_filters(size_filter=["43"]), product)
@@ -0,0 +1,76 @@
+"""
+Coalesced monitor.update stream
+
+Monitors poll every few hundred milliseconds, but dashboards only need to
+hear about a poll when the product's state changed. UpdateCoalescer
+publishes a ``monitor.update`` straight away when a monitor's stock, filter
+match, price or status changes, and keeps only the latest heartbeat (poll
+count, latency) of every other monitor, flushed as one ``monitor.digest``
+message per interval.
+
+State changes are never held back. The per-client frame budget is enforced
+where the client is known, by the gateway's WebSocket hub (each socket's
+sender sends at most ``WS_FRAME_BUDGET`` frames per second).
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Payload fields whose change is pushed immediately
+STATE_FIELDS = ("in_stock", "matches_filters", "price", "status")
+
+class UpdateCoalescer:
+    def __init__(
+        self,
+        redis_client,
+        channel: str = "monitor_updates",
+        *,
+        interval: float = 1.0,
+    ):
+        self.redis = redis_client
+        self.channel = channel
+        self.interval = interval
+        self._state: Dict[str, Tuple[Any, ...]] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    async def update(self, payload: Dict[str, Any]):
+        """Record one poll's payload; publishes it now if the monitor's state changed."""
+        monitor_id = payload["monitor_id"]
+        state = tuple(payload.get(field) for field in STATE_FIELDS)
+        changed = self._state.get(monitor_id) != state
+        self._state[monitor_id] = state
+        if changed:
+            self._pending.pop(monitor_id, None)
+            await self.redis.publish(self.channel, json.dumps({"type": "monitor.update", "payload": payload}))
+        else:
+            self._pending[monitor_id] = payload
+
+    def forget(self, monitor_id: str):
+        self._state.pop(monitor_id, None)
+        self._pending.pop(monitor_id, None)
+
+    async def flush(self) -> Optional[int]:
+        """Publish pending heartbeats as one digest; returns how many monitors it covered."""
+        if not self._pending:
+            return None
+        monitors, self._pending = list(self._pending.values()), {}
+        await self.redis.publish(self.channel, json.dumps({
+            "type": "monitor.digest",
+            "payload": {"monitors": monitors, "timestamp": datetime.now().isoformat()},
+        }))
+        return len(monitors)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Monitor digest publish failed: {e}")
@@ -0,0 +1,95 @@
+"""
+Shared watch targets
+
+Monitors that poll the same product share one watch target, keyed by
+(retailer, store, sku). The scheduler polls each target once, at the
+fastest interval any of its monitors asked for, and the result is fanned
+out to every monitor subscribed to it; each monitor still applies its own
+filters (``matches``) and fires its own alerts and webhook.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_client import Gauge
+
+TargetKey = Tuple[str, Optional[str], str]  # (retailer, store, sku)
+
+WATCH_TARGETS = Gauge("monitor_watch_targets", "Distinct products being polled")
+WATCH_MONITORS = Gauge("monitor_watch_monitors", "Monitors subscribed to watch targets")
+
+class WatchTargets:
+    """Monitors grouped by the product they poll"""
+
+    def __init__(self):
+        self._intervals: Dict[TargetKey, Dict[str, float]] = {}
+        self._target_of: Dict[str, TargetKey] = {}
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __contains__(self, monitor_id: str) -> bool:
+        return monitor_id in self._target_of
+
+    def add(self, monitor_id: str, key: TargetKey, interval: float) -> float:
+        """Subscribe a monitor to a target; returns the target's poll interval."""
+        self._intervals.setdefault(key, {})[monitor_id] = interval
+        self._target_of[monitor_id] = key
+        self._report()
+        return self.interval(key)
+
+    def remove(self, monitor_id: str) -> Tuple[Optional[TargetKey], Optional[float]]:
+        """Unsubscribe a monitor.
+
+        Returns its target and the target's new poll interval, which is None
+        once nothing subscribes to it any more (and (None, None) for an
+        unknown monitor).
+        """
+        key = self._target_of.pop(monitor_id, None)
+        if key is None:
+            return None, None
+        subscribers = self._intervals[key]
+        del subscribers[monitor_id]
+        if not subscribers:
+            del self._intervals[key]
+        self._report()
+        return key, self.interval(key)
+
+    def interval(self, key: TargetKey) -> Optional[float]:
+        subscribers = self._intervals.get(key)
+        return min(subscribers.values()) if subscribers else None
+
+    def subscribers(self, key: TargetKey) -> List[str]:
+        return list(self._intervals.get(key, ()))
+
+    def _report(self):
+        WATCH_TARGETS.set(len(self._intervals))
+        WATCH_MONITORS.set(len(self._target_of))
+
+def matches(config: Any, product: Any) -> bool:
+    """Whether a product in stock satisfies a monitor's filters.
+
+    ``config`` carries ``price_threshold``, ``keywords`` and ``size_filter``
+    (each None for no filter); ``product`` is a ProductInfo.
+    """
+    if not product.in_stock:
+        return False
+    if config.price_threshold is not None and product.price > config.price_threshold:
+        return False
+    if config.keywords:
+        title = product.title.lower()
+        if not all(keyword.lower() in title for keyword in config.keywords):
+            return False
+    if config.size_filter:
+        return bool(set(config.size_filter) & set(available_sizes(product.variants.values())))
+    return True
+
+def available_sizes(variants: Iterable[Any]) -> List[str]:
+    """Sizes of the available variants, across the retailers' variant shapes."""
+    sizes = []
+    for variant in variants:
+        if not isinstance(variant, dict) or not variant.get("available", False):
+            continue
+        size = variant.get("size") or variant.get("option1") or variant.get("nikeSize")
+        if size is not None:
+            sizes.append(str(size))
+    return sizes